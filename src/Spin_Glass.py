@@ -1,91 +1,208 @@
 import sys
+import os
+import time
+import multiprocessing
 import numpy as np
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QDockWidget, QStatusBar, QAction, QDoubleSpinBox, QRadioButton, QStackedWidget, QComboBox, QCheckBox
-from PyQt5.QtGui import QPainter, QFont, QPixmap, QImage, QDesktopServices
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QDockWidget, QStatusBar, QAction, QDoubleSpinBox, QRadioButton, QStackedWidget, QComboBox, QCheckBox, QMessageBox, QLineEdit, QInputDialog
+from PyQt5.QtGui import QPainter, QFont, QPixmap, QImage, QDesktopServices, QIntValidator
 from PyQt5.QtCore import Qt, QRect, QEvent, pyqtSignal, QThread, QTimer, QUrl
 from PyQt5.QtWidgets import QFileDialog
-import random
-import pickle
+from kernels import available_backends, SWEEP_ORDERS
+from acceptance import UPDATE_RULES
+from clusters import CLUSTER_MOVES
+from model import SpinGlassModel
+from spinfile import read_state, write_state, is_legacy
+from tempering import ParallelTempering, ladder_temperatures
+from engine import SimulationEngine, performance, describe
+from schedules import Schedule, SCHEDULES
+from profiler import PROFILER, profiled
 
 
 
 
 class GridWidget(QWidget):
     # 定义信号
-    data_updated = pyqtSignal(int, float, float, float, float, float, float)
+    data_updated = pyqtSignal(int, float, float, float, float, float, float, float, float, float, float, float, float, float, float, float, float, int)
     setting_updated = pyqtSignal(int, float, float, bool, bool)
+    algorithm_updated = pyqtSignal(str, str, str)
+    performance_updated = pyqtSignal(float, float, float, float, int)
+    error_occurred = pyqtSignal(str, bool)  # (描述, 模拟是否因此停止)
+    outputs_updated = pyqtSignal(bool, bool)  # (是否在录制, 是否在自动存档), 模型自行停止录制或存档时发射
     # 初始化
     def __init__(self, n, parent=None):
         super().__init__(parent)
-        self.n = n
+        self.model = SpinGlassModel(n, replicas=2)  # 模拟状态和算法, 两个副本用于计算重叠 q
         self.grid_size = 800  # 固定区域的大小
-        self.cell_size = self.grid_size // self.n
-        self.spins = np.ones((self.n, self.n))
-        for i in range(self.n):
-            for j in range(self.n):
-                self.spins[i, j] = 1 if random.random() < 0.5 else -1
-        self.is_black = True  # 初始状态为黑色
+        self.cell_size = max(1, self.grid_size // self.model.n)
         self.start_simulation = False
         self.update_option = True  # 默认连续更新
-        self.bound_option = True  # 默认周期边界条件
-
-        # 数据初始化
-        self.steps = 0
-        self.temperature = 0.01
-        self.magnetic = 0.00
-        self.J_interaction = np.random.normal(0, 1/3, size=(self.n, self.n, 4))  # 初始化随机相互作用 J_{ij} (高斯分布) 4个近邻相互作用
-        self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                    self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                    self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                    self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-        self.magnetization = np.sum(self.spins) / self.n**2
-        self.magnetizations = []  # 记录总磁化强度
-        self.energies = [] # 记录总能量
+        # 8 位索引图像的颜色表: int8 自旋按字节读作 1 (+1, 黑) 或 255 (-1, 白)
+        self.color_table = [0xffffffff] * 256
+        self.color_table[1] = 0xff000000
+        self.frame_pending = False  # 有新数据需要重绘, 由刷新定时器在界面线程中处理
+        self.engine = None  # 运行中的模拟进程 (engine.SimulationEngine)
+        self.tempering_thread = None  # 副本交换线程 (TemperingThread), 由主窗口设置
+        self.frame_spins = None  # 模拟进程最新快照中的自旋 (只读副本)
+        self.frame_statistics = None  # 模拟进程最新快照中的统计量
+        self.frame_performance = None  # 模拟进程最新快照中的性能数据 (engine.PERFORMANCE)
+        self.last_performance = None  # 上一次计算性能浮层时的 (性能数据, 绘制次数和总耗时)
+        self.engine_trace = None  # 最近停止的模拟进程的计时数据
+        self.recording = False
+        self.checkpointing = False
 
          # 定时器每秒更新
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_period)
         self.timer.start(500)
 
+        # 按屏幕刷新率重绘, 与模拟速度无关
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(self.refresh_interval())
+
+    # 屏幕刷新间隔 (毫秒)
+    def refresh_interval(self):
+        screen = QApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return max(1, int(1000 / rate)) if rate > 0 else 16
+
+    # 自旋数组直接作为 QImage 的像素缓冲 (不复制), 一次 drawImage 缩放到整个网格
+    # 模拟进程运行时绘制最新快照的副本, 否则绘制本进程中的模型
+    # 比显示区域大的格子按步长抽样后缩放到整个显示区域
+    @profiled('paintEvent')
     def paintEvent(self, event):
         painter = QPainter(self)
-        for i in range(self.n):
-            for j in range(self.n):
-                if self.spins[i, j] == 1:
-                    color = Qt.black
-                else:
-                    color = Qt.white
-                painter.fillRect(QRect(j * self.cell_size, i * self.cell_size, self.cell_size, self.cell_size), color)
-            
+        spins = self.frame_spins if self.engine is not None else self.model.spins  # 保持引用, 绘制期间缓冲区不会被释放
+        side = min(spins.shape[0] * self.cell_size, self.grid_size)
+        stride = -(-spins.shape[0] // self.grid_size)
+        if stride > 1:
+            spins = np.ascontiguousarray(spins[::stride, ::stride])
+        n = spins.shape[0]
+        image = QImage(spins.data, n, n, spins.strides[0], QImage.Format_Indexed8)
+        image.setColorTable(self.color_table)
+        painter.drawImage(QRect(0, 0, side, side), image)
+
+    # 只标记需要重绘, 不直接调用 update()
+    def request_frame(self):
+        self.frame_pending = True
+
+    # 转发模拟进程报告的异常
+    def report_errors(self, engine):
+        for message, stopped in engine.errors():
+            self.error_occurred.emit(message, stopped)
+
+    # 从模拟进程取最新的快照 (没有新快照时不变)
+    def pull_snapshot(self):
+        snapshot = self.engine.latest()
+        if snapshot is not None:
+            self.frame_spins, self.frame_statistics, self.frame_performance = snapshot
+            self.frame_pending = True
+
+    # 刷新定时器: 连续更新时读取最新快照, 有新数据时重绘并更新数据界面
+    def refresh(self):
+        if self.engine is not None and self.update_option:
+            self.pull_snapshot()
+        if self.frame_pending:
+            self.frame_pending = False
+            self.update()
+            self.emit_data()
+
+    # 发射数据信号
+    @profiled('emit_data')
+    def emit_data(self):
+        if self.engine is not None:
+            steps, *values, equilibrated = self.frame_statistics
+            self.data_updated.emit(int(steps), *values, int(equilibrated))
+        else:
+            self.data_updated.emit(*self.model.statistics())
+
+    # 启动模拟进程 (模型状态交给模拟进程, 停止时取回)
+    def start_engine(self):
+        if self.engine is None:
+            self.frame_spins = self.model.spins.copy()
+            self.frame_statistics = self.model.statistics()
+            self.frame_performance = None
+            self.last_performance = None
+            self.engine = SimulationEngine(self.model, PROFILER.enabled)
+            self.start_simulation = True
+
+    # 停止模拟进程并取回最终状态
+    def stop_engine(self):
+        self.start_simulation = False
+        if self.engine is not None:
+            engine, self.engine = self.engine, None
+            try:
+                if PROFILER.enabled:
+                    self.engine_trace = engine.trace()
+            except (RuntimeError, OSError):
+                pass  # 进程已经退出, 由 stop() 报告
+            try:
+                engine.stop()
+            except RuntimeError as error:
+                self.error_occurred.emit(str(error), False)
+            self.report_errors(engine)
+            self.last_performance = None
+            self.update()
+            self.emit_data()
+
+    # 调用模型的方法: 模拟进程运行时转发给模拟进程
+    def apply(self, name, *args):
+        try:
+            if self.engine is not None:
+                self.engine.send(name, *args)
+            else:
+                getattr(self.model, name)(*args)
+                self.update()
+                self.emit_data()
+        except Exception as error:
+            self.error_occurred.emit(describe(error), False)
+
+    # 需要重新分配格子的操作: 先停止模拟进程取回状态, 完成后再重新启动
+    def paused(self, action, *args):
+        running = self.engine is not None
+        # 副本交换线程按旧的格子和耦合运行, 同样先停止, 完成后按新的模型重新启动
+        tempering = self.tempering_thread is not None and self.tempering_thread.isRunning()
+        if running:
+            self.stop_engine()
+        if tempering:
+            self.start_simulation = False
+            self.tempering_thread.wait()
+        try:
+            action(*args)
+        finally:
+            self.sync_outputs()
+            self.cell_size = max(1, self.grid_size // self.model.n)
+            if running:
+                self.start_engine()
+            if tempering:
+                self.start_simulation = True
+                self.tempering_thread.start()
+            self.emit_data()
+            # 触发重绘
+            self.update()
+
+    # 格子形状改变时模型会停止录制和自动存档 (见 SpinGlassModel.stop_outputs_if_reshaped), 同步界面的状态
+    def sync_outputs(self):
+        recording, checkpointing = self.model.recorder is not None, self.model.checkpointer is not None
+        if (recording, checkpointing) != (self.recording, self.checkpointing):
+            self.recording, self.checkpointing = recording, checkpointing
+            self.outputs_updated.emit(recording, checkpointing)
+
+    # 当前的完整状态 (模拟进程运行时向其索取, 不停止模拟)
+    def current_state(self):
+        return self.engine.state() if self.engine is not None else self.model.state()
 
     # 更新 n 值
     def set_grid_size(self, n):
-        self.n = n
-        self.cell_size = self.grid_size // self.n
-        self.spins = np.ones((self.n, self.n))
-        self.J_interaction = np.random.normal(0, 1/3, size=(self.n, self.n, 4))  # 初始化随机相互作用 J_{ij} (高斯分布) 4个近邻相互作用
-        self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                    self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                    self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                    self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-        self.magnetization = np.sum(self.spins) / self.n**2
-        self.steps = 0
-        self.magnetizations = []  # 记录总磁化强度
-        self.energies = [] # 记录总能量
-        self.data_updated.emit(0, self.energy, 0.0000, 0.0000, self.magnetization, 0.0000, 0.0000)
-        # 触发重绘
-        self.update()
-        
+        self.paused(self.model.set_grid_size, n)
 
     # 更新 temperature 值
     def set_temperature(self, temperature):
-        self.temperature = temperature
-        # print('temperature:', temperature)
+        self.apply('set_temperature', temperature)
 
     # 更新 magnetic 值
     def set_magnetic(self, magnetic):
-        self.magnetic = magnetic
-        # print('magnetic:', magnetic)
+        self.apply('set_magnetic', magnetic)
     
     # 更新选项
     def set_update_option(self, update_flag):
@@ -93,135 +210,172 @@ class GridWidget(QWidget):
 
     # 更新边界条件
     def set_bound_option(self, bound_flag):
-        self.bound_option = bound_flag
+        self.apply('set_bound_option', bound_flag)
+
+    # 更新模拟后端
+    def set_backend(self, backend):
+        self.apply('set_backend', backend)
+
+    # 更新接受规则
+    def set_update_rule(self, rule):
+        self.apply('set_update_rule', rule)
+
+    # 更新扫描顺序
+    def set_sweep_order(self, order):
+        self.apply('set_sweep_order', order)
+
+    # 更新团簇更新方式
+    def set_cluster_move(self, cluster_move):
+        self.apply('set_cluster_move', cluster_move)
+
+    # 更新随机数种子: 重新生成 J 和自旋, 相同的种子得到相同的模拟
+    def set_seed(self, seed):
+        self.paused(lambda: (self.model.set_seed(seed), self.model.set_grid_size(self.model.n)))
     
     # align按钮
     def align(self):
-        self.is_black = not self.is_black
-        self.spins = np.ones((self.n, self.n)) if self.is_black else -np.ones((self.n, self.n))
-        self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                    self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                    self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                    self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-        self.magnetization = np.sum(self.spins) / self.n**2
-        self.data_updated.emit(self.steps, self.energy, np.mean(self.energies), np.std(self.energies), self.magnetization, np.mean(self.magnetizations), np.std(self.magnetizations))
-        # 触发重绘
-        self.update()
-        
+        self.apply('align')
     
     # randomize按钮
     def randomize(self):
-        # 随机设置每个格点的颜色
-        for i in range(self.n):
-            for j in range(self.n):
-                self.spins[i, j] = 1 if random.random() < 0.5 else -1
-        self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                    self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                    self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                    self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-        self.magnetization = np.sum(self.spins) / self.n**2
-        self.data_updated.emit(self.steps, self.energy, np.mean(self.energies), np.std(self.energies), self.magnetization, np.mean(self.magnetizations), np.std(self.magnetizations))
-        # 触发重绘
-        self.update()
+        self.apply('randomize')
     
     # 读取数据
+    # 先在临时模型上读取一次: 文件损坏、缺少字段或格式不对时抛出异常, 当前的模拟不受影响
     def load_data(self, data):
-        self.set_grid_size(data["n"])
-        self.spins = data["spins"]
-        self.J_interaction = data["J_interaction"]
-        self.set_temperature(data["temperature"])
-        self.set_magnetic(data["magnetic"])
-        self.bound_option = data["bound_option"]
-        self.set_update_option(data["update_option"])
-        self.steps = data["steps"]
-        self.energy = data["energy"]
-        self.energies = data["energies"]
-        self.magnetization = data["magnetization"]
-        self.magnetizations = data["magnetizations"]
-        self.data_updated.emit(self.steps, self.energy, np.mean(self.energies), np.std(self.energies), self.magnetization, np.mean(self.magnetizations), np.std(self.magnetizations))
-        self.setting_updated.emit(self.n, self.temperature, self.magnetic, self.update_option, self.bound_option)
-        
-
-    # 模拟
-    def simulation_by_step(self):
-        if not self.start_simulation:
-            return  # 如果模拟未启动，直接返回
-
-        # 随机选择一个结点
-        i, j = np.random.randint(0, self.n, size=2)
-
-        if self.bound_option:
-            # 计算能量变化
-            delta_E = 2 * self.spins[i, j] * \
-                    (self.J_interaction[i, j, 0] * self.spins[(i + 1) % self.n, j] + \
-                    self.J_interaction[i, j, 1] * self.spins[(i - 1) % self.n, j] + \
-                    self.J_interaction[i, j, 2] * self.spins[i, (j + 1) % self.n] + \
-                    self.J_interaction[i, j, 3] * self.spins[i, (j - 1) % self.n] + \
-                    self.magnetic)
-        else:
-            delta_E = 0
-            neighbors = [((i + 1) % self.n, j), ((i - 1) % self.n, j), (i, (j + 1) % self.n), (i, (j - 1) % self.n)]
-            # 非周期性边界条件：检查邻居是否在网格内
-            valid_neighbors = []
-            for idx, (ni, nj) in enumerate(neighbors):
-                if 0 <= ni < self.n and 0 <= nj < self.n:
-                    valid_neighbors.append((ni, nj, idx))  # 记录有效邻居及其索引
-            # 计算能量变化
-            for ni, nj, idx in valid_neighbors:
-                delta_E += self.J_interaction[i, j, idx] * self.spins[ni, nj]
-            delta_E = 2 * self.spins[i, j] * (delta_E + self.magnetic)
-
-        # Metropolis准则
-        if delta_E < 0 or np.random.rand() < np.exp(-delta_E / self.temperature):
-            self.spins[i, j] *= -1  # 翻转自旋
-            self.steps += 1
-        # 更新
-        if self.steps % 300 == 0:
-            # 计算总能量和总磁化强度
-            self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                    self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                    self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                    self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-            self.magnetization = np.sum(self.spins) / self.n**2
-            self.energies.append(self.energy)
-            self.magnetizations.append(self.magnetization)
-            if self.update_option:
-                self.update()
-                # 发射信号
-                self.data_updated.emit(self.steps, self.energy, np.mean(self.energies), np.std(self.energies), self.magnetization, np.mean(self.magnetizations), np.std(self.magnetizations))
+        SpinGlassModel(2, replicas=data.get("replicas", self.model.replicas)).load_state(data)
+        self.paused(self.model.load_state, data)
+        self.set_update_option(data.get("update_option", True))
+        self.setting_updated.emit(self.model.n, self.model.temperature, self.model.magnetic, self.update_option, self.model.bound_option)
+        self.algorithm_updated.emit(self.model.update_rule, self.model.sweep_order, self.model.cluster_move)
+
+    # 录制和自动存档 (在运行模拟的进程中进行)
+    def start_recording(self, path):
+        self.recording = True
+        self.apply('start_recording', path)
+
+    def stop_recording(self):
+        self.recording = False
+        self.apply('stop_recording')
+
+    def start_checkpointing(self, path):
+        self.checkpointing = True
+        self.apply('start_checkpointing', path, 1000, 60.0, {"update_option": self.update_option})
+
+    def stop_checkpointing(self):
+        self.checkpointing = False
+        self.apply('stop_checkpointing')
+
+    # 开始模拟退火 (在运行模拟的进程中按程序改变温度和磁场)
+    def start_annealing(self, schedule):
+        self.apply('start_annealing', schedule)
+
+    # 第 0 个副本换成精确基态 (需要开放边界、无磁场, 否则抛出 ValueError), 返回基态能量
+    def load_ground_state(self):
+        energies = []
+        self.paused(lambda: energies.append(self.model.load_ground_state()))
+        return energies[0]
+
+    # 显示副本交换线程取回的构型 (在界面线程中更新模型)
+    def show_tempering(self, spins, sweeps):
+        if spins.shape != (self.model.n, self.model.n):
+            return  # 格子大小改变前发出、尚未处理的构型
+        self.model.spins = spins
+        self.model.sweeps += sweeps
+        self.model.recompute()
+        self.model.record()
+        if self.update_option:
+            self.request_frame()
 
     # 定时更新
+    @profiled('update_period')
     def update_period(self):
+        if self.engine is not None:
+            self.pull_snapshot()
+            self.report_errors(self.engine)
         self.update()
-        # 计算总能量和总磁化强度
-        self.energy = -0.5 * np.sum(self.spins * (self.J_interaction[:, :, 0] * np.roll(self.spins, 1, axis=0) + \
-                                                self.J_interaction[:, :, 1] * np.roll(self.spins, -1, axis=0) + \
-                                                self.J_interaction[:, :, 2] * np.roll(self.spins, 1, axis=1) + \
-                                                self.J_interaction[:, :, 3] * np.roll(self.spins, -1, axis=1))) - self.magnetic * np.sum(self.spins)
-        self.magnetization = np.sum(self.spins) / self.n**2
-        # 发射信号
-        self.data_updated.emit(self.steps, self.energy, np.mean(self.energies), np.std(self.energies), self.magnetization, np.mean(self.magnetizations), np.std(self.magnetizations))
+        # 发射信号 (能量和磁化强度已由模拟增量更新)
+        self.emit_data()
+        if PROFILER.enabled:
+            self.emit_performance()
+
+    # 打开或关闭计时 (界面进程和模拟进程), 打开时数据界面显示性能浮层
+    def set_profiling(self, flag):
+        PROFILER.enable(flag)
+        if self.engine is not None:
+            self.engine.send('profile', flag)
+        self.last_performance = None
+
+    # 性能浮层: 与上一次定时更新相比的每秒翻转数、接受率、每次扫描和每帧绘制的平均耗时 (毫秒) 和等待后台写入的项数
+    # 模拟进程运行时用快照中的性能数据, 否则用本进程的计时
+    def emit_performance(self):
+        current = self.frame_performance if self.engine is not None else performance(self.model)
+        if current is None:
+            return
+        paint = PROFILER.total('paintEvent')
+        if self.last_performance is not None:
+            (time0, attempted0, accepted0, sweeps0, seconds0, _), (paints0, paint_seconds0) = self.last_performance
+            now, attempted, accepted, sweeps, seconds, depth = current
+            if attempted < attempted0:  # 清空记录后计数重新开始
+                attempted0, accepted0 = attempted, accepted
+            flips = (accepted - accepted0) / (now - time0) if now > time0 else 0.0
+            acceptance = (accepted - accepted0) / (attempted - attempted0) if attempted > attempted0 else 0.0
+            sweep_ms = 1e3 * (seconds - seconds0) / (sweeps - sweeps0) if sweeps > sweeps0 else 0.0
+            render_ms = 1e3 * (paint[1] - paint_seconds0) / (paint[0] - paints0) if paint[0] > paints0 else 0.0
+            self.performance_updated.emit(flips, acceptance, sweep_ms, render_ms, int(depth))
+        self.last_performance = (tuple(current), paint)
+
+    # 导出本进程和模拟进程 (运行中或最近停止的) 的计时数据为 Chrome trace
+    def export_trace(self, path):
+        others, names = [], ['interface']
+        trace = self.engine.trace() if self.engine is not None else self.engine_trace
+        if trace is not None:
+            others.append(trace)
+            names.append('simulation')
+        PROFILER.export_trace(path, others, names)
         
     # 清空记录
     def reset(self):
-        self.steps = 0
-        self.energies = []
-        self.magnetizations = []
+        self.apply('reset')
 
             
         
         
 
 
-# 模拟线程
-class SimulationThread(QThread):
+# 副本交换模拟线程: 在进程池中运行并行回火, 界面显示最低温度 (即设置的温度) 上的构型
+# 线程不修改模型, 取回的构型通过信号交给界面线程
+class TemperingThread(QThread):
+    # 传递各相邻温度对的交换接受率
+    tempering_updated = pyqtSignal(str)
+    # 传递最低温度上的构型和这段时间内的扫描次数
+    configuration_updated = pyqtSignal(object, int)
+
     def __init__(self, grid_widget):
         super().__init__()
         self.grid_widget = grid_widget
+        self.replicas = 32  # 副本数的上限, 实际副本数随格点数的平方根增长 (见 tempering.ladder_temperatures)
+        self.sweeps = 10  # 每轮交换之间的扫描次数
+        self.refresh = 0.1  # 读取构型的最小间隔 (秒)
 
     def run(self):
-        while self.grid_widget.start_simulation:
-            self.grid_widget.simulation_by_step()  # 每次只运行一步模拟
+        model = self.grid_widget.model
+        temperatures = ladder_temperatures(model.temperature, max(1.0, 2 * model.temperature), model.n**2, self.replicas)
+        with ParallelTempering(model.n, temperatures, model.magnetic, model.bound_option, model.J_bonds, model.backend,
+                               seed=model.seed_sequence.spawn(1)[0]) as pt:
+            last = 0.0
+            sweeps = 0
+            while self.grid_widget.start_simulation:
+                pt.step(self.sweeps)
+                sweeps += self.sweeps
+                if time.perf_counter() - last < self.refresh:
+                    continue
+                last = time.perf_counter()
+                self.configuration_updated.emit(pt.configuration(0), sweeps)
+                sweeps = 0
+                rates = pt.acceptance_rates()
+                self.tempering_updated.emit(f'Parallel tempering, {len(temperatures)} replicas, T {temperatures[0]:.3g}-{temperatures[-1]:.3g}, '
+                                            f'swap rates min {rates.min():.2f} mean {rates.mean():.2f}: ' + ' '.join(f'{rate:.2f}' for rate in rates))
 
 
 
@@ -244,6 +398,17 @@ class SubWindow(QWidget):
     bound_option = pyqtSignal(bool)
     # 传递reset信号
     reset_signal = pyqtSignal()
+    # 传递模拟后端选项
+    backend_option = pyqtSignal(str)
+    # 传递接受规则和扫描顺序选项
+    rule_option = pyqtSignal(str)
+    order_option = pyqtSignal(str)
+    # 传递团簇更新选项
+    cluster_option = pyqtSignal(str)
+    # 传递副本交换选项
+    tempering_option = pyqtSignal(bool)
+    # 传递随机数种子 (None 表示随机)
+    seed_option = pyqtSignal(object)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -337,7 +502,7 @@ class SubWindow(QWidget):
         # 下半部分
         self.bottom_widget = QStackedWidget()
         self.bottom_widget.setStyleSheet("background-color: transparent;")
-        self.bottom_widget.setFixedSize(250, 200)
+        self.bottom_widget.setFixedSize(250, 280)
 
 
         # 设置界面
@@ -399,6 +564,12 @@ class SubWindow(QWidget):
         self.Lattice_choice.addItem('100')
         self.Lattice_choice.addItem('200')
         self.Lattice_choice.addItem('400')
+        self.Lattice_choice.addItem('800')
+        self.Lattice_choice.addItem('1600')
+        self.Lattice_choice.addItem('4096')
+        # 也可以输入其他大小, 大于显示区域的格子抽样显示
+        self.Lattice_choice.setEditable(True)
+        self.Lattice_choice.setValidator(QIntValidator(2, 4096, self.Lattice_choice))
         self.Lattice_choice.setStyleSheet("background-color: white;")
         self.Lattice_choice.setCurrentIndex(11)
         self.Lattice_choice.currentIndexChanged.connect(self.on_lattice_changed)
@@ -408,6 +579,60 @@ class SubWindow(QWidget):
         self.bound_box.setChecked(True)
         self.bound_box.stateChanged.connect(self.on_bound_changed)
 
+        # 模拟后端选择
+        self.Backend_label = QLabel("Backend")
+        self.Backend_label.setFont(font)
+
+        self.Backend_choice = QComboBox()
+        self.Backend_choice.setFixedSize(80, 20)
+        self.Backend_choice.addItems(available_backends())
+        self.Backend_choice.setStyleSheet("background-color: white;")
+        self.Backend_choice.setCurrentIndex(self.Backend_choice.count() - 1)
+        self.Backend_choice.currentIndexChanged.connect(self.on_backend_changed)
+
+        # 接受规则和扫描顺序选择
+        self.Rule_label = QLabel("Update rule")
+        self.Rule_label.setFont(font)
+
+        self.Rule_choice = QComboBox()
+        self.Rule_choice.setFixedSize(100, 20)
+        self.Rule_choice.addItems(UPDATE_RULES)
+        self.Rule_choice.setStyleSheet("background-color: white;")
+        self.Rule_choice.currentIndexChanged.connect(self.on_rule_changed)
+
+        self.Order_label = QLabel("Sweep order")
+        self.Order_label.setFont(font)
+
+        self.Order_choice = QComboBox()
+        self.Order_choice.setFixedSize(100, 20)
+        self.Order_choice.addItems(SWEEP_ORDERS)
+        self.Order_choice.setStyleSheet("background-color: white;")
+        self.Order_choice.currentIndexChanged.connect(self.on_order_changed)
+
+        # 团簇更新选择
+        self.Cluster_label = QLabel("Cluster move")
+        self.Cluster_label.setFont(font)
+
+        self.Cluster_choice = QComboBox()
+        self.Cluster_choice.setFixedSize(100, 20)
+        self.Cluster_choice.addItems(CLUSTER_MOVES)
+        self.Cluster_choice.setStyleSheet("background-color: white;")
+        self.Cluster_choice.currentIndexChanged.connect(self.on_cluster_changed)
+
+        # 副本交换选择
+        self.tempering_box = QCheckBox('Parallel tempering')
+        self.tempering_box.setChecked(False)
+        self.tempering_box.stateChanged.connect(self.on_tempering_changed)
+
+        # 随机数种子
+        self.Seed_label = QLabel("Seed")
+        self.Seed_label.setFont(font)
+
+        self.Seed_edit = QLineEdit()
+        self.Seed_edit.setFixedSize(80, 20)
+        self.Seed_edit.setPlaceholderText('random')
+        self.Seed_edit.setStyleSheet("background-color: white;")
+        self.Seed_edit.editingFinished.connect(self.on_seed_changed)
 
         settings_layout = QGridLayout()
         settings_layout.addWidget(self.Align_button, 0, 0)
@@ -415,6 +640,17 @@ class SubWindow(QWidget):
         settings_layout.addWidget(self.Lattice_label, 1, 0, alignment=Qt.AlignLeft)
         settings_layout.addWidget(self.Lattice_choice, 1, 1, alignment=Qt.AlignRight)
         settings_layout.addWidget(self.bound_box, 2, 0, 1, 2, alignment=Qt.AlignHCenter)
+        settings_layout.addWidget(self.Backend_label, 3, 0, alignment=Qt.AlignLeft)
+        settings_layout.addWidget(self.Backend_choice, 3, 1, alignment=Qt.AlignRight)
+        settings_layout.addWidget(self.Rule_label, 4, 0, alignment=Qt.AlignLeft)
+        settings_layout.addWidget(self.Rule_choice, 4, 1, alignment=Qt.AlignRight)
+        settings_layout.addWidget(self.Order_label, 5, 0, alignment=Qt.AlignLeft)
+        settings_layout.addWidget(self.Order_choice, 5, 1, alignment=Qt.AlignRight)
+        settings_layout.addWidget(self.Cluster_label, 6, 0, alignment=Qt.AlignLeft)
+        settings_layout.addWidget(self.Cluster_choice, 6, 1, alignment=Qt.AlignRight)
+        settings_layout.addWidget(self.tempering_box, 7, 0, 1, 2, alignment=Qt.AlignHCenter)
+        settings_layout.addWidget(self.Seed_label, 8, 0, alignment=Qt.AlignLeft)
+        settings_layout.addWidget(self.Seed_edit, 8, 1, alignment=Qt.AlignRight)
 
 
         settings_widget.setLayout(settings_layout)
@@ -428,18 +664,30 @@ class SubWindow(QWidget):
         self.Steps_label = QLabel('Steps:')
         self.Steps_data = QLabel('0')
         self.Energy_label = QLabel('Energy:')
-        self.Energy_data = QLabel(f'{self.parent().grid_widget.energy:.4f}')
+        self.Energy_data = QLabel(f'{self.parent().grid_widget.model.energy:.4f}')
         self.AverageE_label = QLabel('Average E:')
         self.AverageE_data = QLabel('0.0000')
         self.SigmaE_label = QLabel('Sigma E:')
         self.SigmaE_data = QLabel('0.0000')
 
         self.Magnetization_label = QLabel('Magnetization:')
-        self.Magnetization_data = QLabel(f'{self.parent().grid_widget.magnetization:.4f}')
+        self.Magnetization_data = QLabel(f'{self.parent().grid_widget.model.magnetization:.4f}')
         self.AverageM_label = QLabel('Average M:')
         self.AverageM_data = QLabel('0.0000')
         self.SigmaM_label = QLabel('Sigma M:')
         self.SigmaM_data = QLabel('0.0000')
+        self.Overlap_label = QLabel('Overlap q:')
+        self.Overlap_data = QLabel(f'{self.parent().grid_widget.model.overlap():.4f}')
+        self.Heat_label = QLabel('Specific heat:')
+        self.Heat_data = QLabel('0.0000')
+        self.Susceptibility_label = QLabel('Susceptibility:')
+        self.Susceptibility_data = QLabel('0.0000')
+        self.Acceptance_label = QLabel('Acceptance:')
+        self.Acceptance_data = QLabel('0.0000')
+        self.Tau_label = QLabel('Tau E / |M| / q:')
+        self.Tau_data = QLabel('0.0 / 0.0 / 0.0')
+        self.Samples_label = QLabel('Independent samples:')
+        self.Samples_data = QLabel('not equilibrated')
 
         self.reset_button = QPushButton("Reset")
         self.reset_button.setStyleSheet("""
@@ -473,7 +721,24 @@ class SubWindow(QWidget):
         data_layout.addWidget(self.AverageM_data, 5, 1, alignment=Qt.AlignHCenter)
         data_layout.addWidget(self.SigmaM_label, 6, 0, alignment=Qt.AlignHCenter)
         data_layout.addWidget(self.SigmaM_data, 6, 1, alignment=Qt.AlignHCenter)
-        data_layout.addWidget(self.reset_button, 7, 0, 1, 2, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Overlap_label, 7, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Overlap_data, 7, 1, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Heat_label, 8, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Heat_data, 8, 1, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Susceptibility_label, 9, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Susceptibility_data, 9, 1, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Acceptance_label, 10, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Acceptance_data, 10, 1, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Tau_label, 11, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Tau_data, 11, 1, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Samples_label, 12, 0, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.Samples_data, 12, 1, alignment=Qt.AlignHCenter)
+        # 性能浮层 (File 菜单的 Performance overlay 打开计时后显示)
+        self.Performance_data = QLabel('')
+        self.Performance_data.setStyleSheet('color: gray;')
+        self.Performance_data.setVisible(False)
+        data_layout.addWidget(self.Performance_data, 13, 0, 1, 2, alignment=Qt.AlignHCenter)
+        data_layout.addWidget(self.reset_button, 14, 0, 1, 2, alignment=Qt.AlignHCenter)
 
         data_widget.setLayout(data_layout)
 
@@ -537,7 +802,10 @@ class SubWindow(QWidget):
     # lattice_size改变
     def on_lattice_changed(self):
         # 获取当前选择的 n 值
-        n = int(self.Lattice_choice.currentText())
+        text = self.Lattice_choice.currentText()
+        if not text.isdigit() or int(text) < 2:
+            return
+        n = int(text)
         # 发射信号
         self.lattice_size_changed.emit(n)
     
@@ -560,6 +828,34 @@ class SubWindow(QWidget):
     # 周期边界条件改变
     def on_bound_changed(self):
         self.bound_option.emit(self.bound_box.isChecked())
+
+    # 模拟后端改变
+    def on_backend_changed(self):
+        self.backend_option.emit(self.Backend_choice.currentText())
+
+    # 接受规则改变
+    def on_rule_changed(self):
+        self.rule_option.emit(self.Rule_choice.currentText())
+
+    # 扫描顺序改变
+    def on_order_changed(self):
+        self.order_option.emit(self.Order_choice.currentText())
+
+    # 团簇更新选项改变
+    def on_cluster_changed(self):
+        self.cluster_option.emit(self.Cluster_choice.currentText())
+
+    # 副本交换选项改变
+    def on_tempering_changed(self):
+        self.tempering_option.emit(self.tempering_box.isChecked())
+
+    # 随机数种子改变 (留空为随机)
+    def on_seed_changed(self):
+        text = self.Seed_edit.text().strip()
+        if text and not text.isdigit():
+            self.Seed_edit.setText('')
+            return
+        self.seed_option.emit(int(text) if text else None)
     
     # align按钮
     def align(self):
@@ -569,16 +865,34 @@ class SubWindow(QWidget):
     def randomize(self):
         self.randomize_grid_requested.emit()
 
-    # 更新数据界面的 label
-    def update_data_labels(self, steps, energy, avg_energy, sigma_energy, magnetization, avg_magnetization, sigma_magnetization):
+    # 更新数据界面的 label (平均值附带自相关修正后的误差, 自相关时间以扫描计, 独立样本数在判断为平衡后显示)
+    @profiled('update_data_labels')
+    def update_data_labels(self, steps, energy, avg_energy, error_energy, sigma_energy, magnetization, avg_magnetization, error_magnetization,
+                           sigma_magnetization, overlap, specific_heat, susceptibility, acceptance, tau_energy, tau_magnetization, tau_overlap,
+                           samples, equilibrated):
         self.Steps_data.setText(f'{steps}')
         self.Energy_data.setText(f'{energy:.4f}')
-        self.AverageE_data.setText(f'{avg_energy:.4f}')
+        self.AverageE_data.setText(f'{avg_energy:.4f} ± {error_energy:.4f}')
         self.SigmaE_data.setText(f'{sigma_energy:.4f}')
         self.Magnetization_data.setText(f'{magnetization:.4f}')
-        self.AverageM_data.setText(f'{avg_magnetization:.4f}')
+        self.AverageM_data.setText(f'{avg_magnetization:.4f} ± {error_magnetization:.4f}')
         self.SigmaM_data.setText(f'{sigma_magnetization:.4f}')
+        self.Overlap_data.setText(f'{overlap:.4f}')
+        self.Heat_data.setText(f'{specific_heat:.4f}')
+        self.Susceptibility_data.setText(f'{susceptibility:.4f}')
+        self.Acceptance_data.setText(f'{acceptance:.4f}')
+        self.Tau_data.setText(f'{tau_energy:.1f} / {tau_magnetization:.1f} / {tau_overlap:.1f}')
+        self.Samples_data.setText(f'{samples:.0f} (from sweep {equilibrated})' if equilibrated >= 0 else 'not equilibrated')
     
+    # 更新性能浮层
+    def update_performance(self, flips, acceptance, sweep_ms, render_ms, queue_depth):
+        self.Performance_data.setText(f'{flips:.3g} flips/s   acceptance {acceptance:.1%}\n'
+                                      f'sweep {sweep_ms:.3f} ms   render {render_ms:.2f} ms   queue {queue_depth}')
+
+    def show_performance(self, flag):
+        self.Performance_data.setText('')
+        self.Performance_data.setVisible(flag)
+
     # 重置按钮
     def reset(self):
         self.reset_signal.emit()
@@ -587,6 +901,11 @@ class SubWindow(QWidget):
         self.SigmaE_data.setText('0.0000')
         self.AverageM_data.setText('0.0000')
         self.SigmaM_data.setText('0.0000')
+        self.Heat_data.setText('0.0000')
+        self.Susceptibility_data.setText('0.0000')
+        self.Acceptance_data.setText('0.0000')
+        self.Tau_data.setText('0.0 / 0.0 / 0.0')
+        self.Samples_data.setText('not equilibrated')
         
     
     # 更新设置
@@ -597,11 +916,20 @@ class SubWindow(QWidget):
         self.periodic_button.setChecked(not update_option)
         # 断开信号连接
         self.Lattice_choice.blockSignals(True)
+        if self.Lattice_choice.findText(str(n)) < 0:
+            self.Lattice_choice.addItem(str(n))
         self.Lattice_choice.setCurrentIndex(self.Lattice_choice.findText(str(n)))
         # 重新连接信号
         self.Lattice_choice.blockSignals(False)
         self.bound_box.setChecked(bound_option)
 
+    # 更新接受规则、扫描顺序和团簇更新方式的显示 (读取的状态中保存了这些选项)
+    def update_algorithm_choices(self, rule, order, cluster_move):
+        for choice, text in ((self.Rule_choice, rule), (self.Order_choice, order), (self.Cluster_choice, cluster_move)):
+            choice.blockSignals(True)
+            choice.setCurrentIndex(choice.findText(text))
+            choice.blockSignals(False)
+
 
     # 切换 QStackedWidget 界面，并更新按钮样式
     def switch_page(self, index):
@@ -667,6 +995,38 @@ class MainWindow(QMainWindow):
         save_data_action.triggered.connect(self.save_data)
         file_menu.addAction(save_data_action)
 
+        # 创建 "录制" 动作
+        self.record_action = QAction("Start recording", self)
+        self.record_action.triggered.connect(self.toggle_recording)
+        file_menu.addAction(self.record_action)
+
+        # 创建 "自动存档" 动作
+        self.checkpoint_action = QAction("Start auto checkpoint", self)
+        self.checkpoint_action.triggered.connect(self.toggle_checkpointing)
+        file_menu.addAction(self.checkpoint_action)
+
+        # 创建 "模拟退火" 动作
+        anneal_action = QAction("Anneal", self)
+        anneal_action.triggered.connect(self.anneal)
+        file_menu.addAction(anneal_action)
+
+        # 创建 "精确基态" 动作
+        ground_state_action = QAction("Ground state", self)
+        ground_state_action.triggered.connect(self.ground_state)
+        file_menu.addAction(ground_state_action)
+
+        # 创建 "性能浮层" 动作: 打开计时并在数据界面显示每秒翻转数、接受率、绘制耗时等
+        self.profile_action = QAction("Performance overlay", self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.setChecked(PROFILER.enabled)
+        self.profile_action.toggled.connect(self.toggle_profiling)
+        file_menu.addAction(self.profile_action)
+
+        # 创建 "导出计时" 动作
+        trace_action = QAction("Export profile trace", self)
+        trace_action.triggered.connect(self.export_trace)
+        file_menu.addAction(trace_action)
+
         # 创建 "退出" 动作
         exit_action = QAction("Close", self)
         exit_action.triggered.connect(self.close)
@@ -685,15 +1045,17 @@ class MainWindow(QMainWindow):
         self.sub_window = QDockWidget(self)     
         self.sub_window.setWidget(SubWindow(self))
         self.sub_window.setFloating(True)  # 使其可以拖动
-        self.sub_window.setGeometry(1000, 250, 250, 600)  # 设置初始位置
+        self.sub_window.setGeometry(1000, 250, 250, 650)  # 设置初始位置
         
 
         # 隐藏标题栏
         self.sub_window.setTitleBarWidget(QWidget())
         self.addDockWidget(Qt.RightDockWidgetArea, self.sub_window)  # 让它停靠在右侧
 
-        # 模拟线程
-        self.simulation_thread = SimulationThread(self.grid_widget)
+        # 副本交换线程 (普通模拟在 GridWidget 启动的模拟进程中运行)
+        self.tempering_thread = TemperingThread(self.grid_widget)
+        self.grid_widget.tempering_thread = self.tempering_thread
+        self.tempering = False  # 是否使用副本交换
 
         # 绑定信号
         self.sub_window.widget().lattice_size_changed.connect(self.update_grid_size)
@@ -705,8 +1067,21 @@ class MainWindow(QMainWindow):
         self.sub_window.widget().update_option.connect(self.update_option)
         self.sub_window.widget().bound_option.connect(self.update_bound)
         self.sub_window.widget().reset_signal.connect(self.reset)
+        self.sub_window.widget().backend_option.connect(self.update_backend)
+        self.sub_window.widget().rule_option.connect(self.update_rule)
+        self.sub_window.widget().order_option.connect(self.update_order)
+        self.sub_window.widget().cluster_option.connect(self.update_cluster)
+        self.sub_window.widget().tempering_option.connect(self.update_tempering)
+        self.sub_window.widget().seed_option.connect(self.update_seed)
+        self.tempering_thread.tempering_updated.connect(self.statusBar().showMessage)
+        self.tempering_thread.configuration_updated.connect(self.grid_widget.show_tempering)
         self.grid_widget.data_updated.connect(self.sub_window.widget().update_data_labels)
         self.grid_widget.setting_updated.connect(self.sub_window.widget().update_settings)
+        self.grid_widget.algorithm_updated.connect(self.sub_window.widget().update_algorithm_choices)
+        self.grid_widget.performance_updated.connect(self.sub_window.widget().update_performance)
+        self.grid_widget.error_occurred.connect(self.show_error)
+        self.grid_widget.outputs_updated.connect(self.update_output_actions)
+        self.sub_window.widget().show_performance(PROFILER.enabled)
         
 
     # 更新 GridWidget 的 n 值
@@ -724,6 +1099,24 @@ class MainWindow(QMainWindow):
     # 更新边界条件
     def update_bound(self, bound_flag):
         self.grid_widget.set_bound_option(bound_flag)
+    # 更新模拟后端
+    def update_backend(self, backend):
+        self.grid_widget.set_backend(backend)
+    # 更新接受规则
+    def update_rule(self, rule):
+        self.grid_widget.set_update_rule(rule)
+    # 更新扫描顺序
+    def update_order(self, order):
+        self.grid_widget.set_sweep_order(order)
+    # 更新团簇更新方式
+    def update_cluster(self, cluster_move):
+        self.grid_widget.set_cluster_move(cluster_move)
+    # 更新随机数种子
+    def update_seed(self, seed):
+        self.grid_widget.set_seed(seed)
+    # 更新副本交换选项 (下次开始模拟时生效)
+    def update_tempering(self, tempering_flag):
+        self.tempering = tempering_flag
 
     # 调用 GridWidget 的方法将所有格子变色
     def align_grid(self):
@@ -736,16 +1129,35 @@ class MainWindow(QMainWindow):
     # 开始/停止模拟
     def simulation(self, start_flag):
         if start_flag:
-            self.grid_widget.start_simulation = True
-            self.simulation_thread.start()  # 启动模拟线程
+            if self.tempering:
+                self.grid_widget.start_simulation = True
+                self.tempering_thread.start()  # 启动副本交换线程
+            else:
+                self.grid_widget.start_engine()  # 启动模拟进程
         else:
+            # 副本交换线程检查到标志后自行退出, 等待它结束; 模拟进程停止后取回状态
             self.grid_widget.start_simulation = False
-            self.simulation_thread.quit()  # 停止线程
+            self.tempering_thread.wait()
+            self.grid_widget.stop_engine()
     
     # 重置
     def reset(self):
         self.grid_widget.reset()
 
+    # 模型停止了录制或自动存档 (例如格子大小改变), 更新菜单
+    def update_output_actions(self, recording, checkpointing):
+        self.record_action.setText("Stop recording" if recording else "Start recording")
+        self.checkpoint_action.setText("Stop auto checkpoint" if checkpointing else "Start auto checkpoint")
+        self.statusBar().showMessage('Recording and auto checkpoint stop when the lattice size changes')
+
+    # 模拟出错: 显示在状态栏; 模拟因此停止时 (例如录制或存档写入失败) 先停止模拟再弹出提示
+    def show_error(self, message, stopped):
+        self.statusBar().showMessage(f'Error: {message}')
+        if stopped:
+            if self.grid_widget.start_simulation:
+                self.sub_window.widget().toggle()
+            QMessageBox.warning(self, "Simulation stopped", message)
+
     # 打开文件
     def open(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -755,11 +1167,21 @@ class MainWindow(QMainWindow):
             "SpinGlass Files (*.spinglass);;All Files (*)"  # 文件过滤器
         )
         if file_path:
-            # 从二进制文件加载数据
-            with open(file_path, "rb") as file:
-                data = pickle.load(file)
-            # 恢复状态
-            self.grid_widget.load_data(data)
+            try:
+                # 旧版 pickle 文件可以执行任意代码, 只在用户确认后读取
+                legacy = is_legacy(file_path)
+                if legacy and QMessageBox.question(self, "Legacy file",
+                                                   "This is a legacy pickle file, which can run arbitrary code when opened.\n"
+                                                   "Open it only if you trust its source. Continue?") != QMessageBox.Yes:
+                    return
+                # 从二进制文件加载数据 (数组按内存映射读取)
+                data = read_state(file_path, allow_pickle=legacy)
+                # 恢复状态
+                self.grid_widget.load_data(data)
+            except Exception as error:
+                # 文件损坏或截断、格式版本更新、不是 .spinglass 文件等
+                QMessageBox.warning(self, "Open failed", f"Could not open {file_path}:\n{describe(error)}")
+                return
             self.grid_widget.update()  # 触发重绘
             # print(f"Data loaded from {file_path}")
 
@@ -790,25 +1212,98 @@ class MainWindow(QMainWindow):
         )
         if file_path:
             # 准备数据
-            data = {
-                "n": self.grid_widget.n,
-                "spins": self.grid_widget.spins,
-                "J_interaction": self.grid_widget.J_interaction,
-                "temperature": self.grid_widget.temperature,
-                "magnetic": self.grid_widget.magnetic,
-                "bound_option": self.grid_widget.bound_option,
-                "update_option": self.grid_widget.update_option,
-                "steps": self.grid_widget.steps,
-                "energy": self.grid_widget.energy,
-                "energies": self.grid_widget.energies,
-                "magnetization": self.grid_widget.magnetization,
-                "magnetizations": self.grid_widget.magnetizations
-            }
+            data = self.grid_widget.current_state()
+            data["update_option"] = self.grid_widget.update_option
             # 保存为二进制文件
-            with open(file_path, "wb") as file:
-                pickle.dump(data, file)
+            write_state(file_path, data)
             # print(f"Data saved to {file_path}")
 
+    # 开始/停止录制: 观测量和自旋快照由后台线程分段压缩写入所选目录
+    def toggle_recording(self):
+        if not self.grid_widget.recording:
+            path = QFileDialog.getExistingDirectory(self, "Record to directory")
+            if path:
+                self.grid_widget.start_recording(path)
+                self.record_action.setText("Stop recording")
+                self.statusBar().showMessage(f"Recording to {path}")
+        else:
+            self.grid_widget.stop_recording()
+            self.record_action.setText("Start recording")
+            self.statusBar().showMessage("Recording stopped")
+
+    # 开始/停止自动存档: 每 1000 次扫描或每 60 秒在后台写入所选文件, 用 Open 打开存档即可继续模拟
+    def toggle_checkpointing(self):
+        if not self.grid_widget.checkpointing:
+            file_path, _ = QFileDialog.getSaveFileName(self, "Checkpoint file", "", "SpinGlass Files (*.spinglass);;All Files (*)")
+            if file_path:
+                self.grid_widget.start_checkpointing(file_path)
+                self.checkpoint_action.setText("Stop auto checkpoint")
+                self.statusBar().showMessage(f"Checkpointing to {file_path}")
+        else:
+            self.grid_widget.stop_checkpointing()
+            self.checkpoint_action.setText("Start auto checkpoint")
+            self.statusBar().showMessage("Checkpointing stopped")
+
+    # 模拟退火: 从高温按所选程序降到当前设置的温度 (磁场不变), 结束时显示找到的最低能量构型并在该温度下继续模拟
+    def anneal(self):
+        if self.tempering:
+            self.statusBar().showMessage('Annealing is not available with parallel tempering')
+            return
+        kind, ok = QInputDialog.getItem(self, "Anneal", "Schedule", SCHEDULES[:-1], 1, False)
+        if not ok:
+            return
+        sweeps, ok = QInputDialog.getInt(self, "Anneal", "Sweeps", 10000, 100, 10**8)
+        if not ok:
+            return
+        sub = self.sub_window.widget()
+        temperature, magnetic = sub.temp_spin_box.value(), sub.magn_spin_box.value()
+        schedule = Schedule(kind, max(2.0, 2 * temperature), temperature, sweeps, magnetic, magnetic)
+        # 先启动模拟进程, 退火程序交给模拟进程执行
+        if not self.grid_widget.start_simulation:
+            sub.toggle()
+        self.grid_widget.start_annealing(schedule)
+        self.statusBar().showMessage(f'Annealing ({kind}) from T = {schedule.t_start:.2f} to {temperature:.2f}' +
+                                     (f' over {sweeps} sweeps' if kind != 'adaptive' else ''))
+
+    # 精确基态 (开放边界、无磁场): 显示基态构型, 模拟在运行时从基态继续
+    def ground_state(self):
+        if self.tempering:
+            self.statusBar().showMessage('The ground state is not available with parallel tempering')
+            return
+        try:
+            start = time.perf_counter()
+            energy = self.grid_widget.load_ground_state()
+        except (ValueError, ImportError) as error:
+            self.statusBar().showMessage(f'Ground state: {error}')
+            return
+        n = self.grid_widget.model.n
+        self.statusBar().showMessage(f'Exact ground state: E = {energy:.6f} (e = {energy / n**2:.6f}) in {time.perf_counter() - start:.2f} s')
+
+    # 打开/关闭计时和性能浮层
+    def toggle_profiling(self, flag):
+        self.grid_widget.set_profiling(flag)
+        self.sub_window.widget().show_performance(flag)
+
+    # 导出计时数据 (Chrome trace, 可以用 chrome://tracing 或 Perfetto 打开)
+    def export_trace(self):
+        if not PROFILER.enabled and self.grid_widget.engine_trace is None and not PROFILER.timings:
+            self.statusBar().showMessage('Turn on Performance overlay first to collect a profile')
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export profile trace", "", "Trace Files (*.json);;All Files (*)")
+        if file_path:
+            self.grid_widget.export_trace(file_path)
+            self.statusBar().showMessage(f'Profile trace saved to {file_path}')
+
+    # 关闭窗口时停止模拟, 写完录制的数据和最终存档
+    def closeEvent(self, event):
+        self.simulation(False)
+        try:
+            self.grid_widget.model.stop_recording()
+            self.grid_widget.model.stop_checkpointing()
+        except Exception as error:
+            QMessageBox.warning(self, "Saving failed", describe(error))
+        super().closeEvent(event)
+
     def open_author_url(self):
         url = QUrl("https://github.com/lkbrain/Spin_Glass")  # 替换为实际的作者网址
         QDesktopServices.openUrl(url)
@@ -819,6 +1314,7 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包成 exe 后副本交换的工作进程需要
     app = QApplication(sys.argv)
     n = 100  # 网格的大小
     mainwindow = MainWindow(n)
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+# 判断相互作用是否为离散的 ±J 分布, 是则返回 J 的绝对值, 否则返回 None
+# (值为 0 的键视为断开, 不参与判断)
+def coupling_unit(J):
+    magnitude = np.abs(J)
+    bonds = magnitude[magnitude > 0]
+    if bonds.size and np.all(bonds == bonds[0]):
+        return float(bonds[0])
+    return None
+
+
+# 可选的更新规则 (单个自旋翻转的接受概率):
+#   metropolis: min(1, exp(-delta_E / T))
+#   heat-bath: 1 / (1 + exp(delta_E / T)), 对 Ising 自旋与 Glauber 动力学相同; 接受率较低, 但低温下有时去相关更快
+UPDATE_RULES = ('metropolis', 'heat-bath')
+
+
+# 接受概率 (x = delta_E / T, 数组)
+def rule_probability(rule, x):
+    if rule == 'metropolis':
+        return np.exp(-np.maximum(x, 0))
+    if rule == 'heat-bath':
+        return 0.5 * (1 - np.tanh(x / 2))
+    raise ValueError(f'unknown update rule: {rule}')
+
+
+# 接受概率表, 只在温度、磁场、相互作用或更新规则改变时重建
+#   ±J 相互作用: 局域场只能取 J0 * k (k = -degree..degree, degree 为最大连接数, 正方格子为 4), 按 (自旋, k) 精确制表
+#   高斯相互作用: 对 x = |delta_E| / T 等距制表并线性插值 (heat-bath 的 delta_E < 0 一侧由 p(-x) = 1 - p(x) 得到),
+#   插值误差不超过 step^2 / (8 T^2) = tolerance; x > cutoff 时概率取 0, 由此引入的误差不超过 exp(-cutoff) (约 4e-18)
+class AcceptanceTable:
+    tolerance = 1e-6
+    cutoff = 40.0
+
+    def __init__(self, temperature, magnetic, unit=None, rule='metropolis', degree=4):
+        self.temperature = temperature
+        self.magnetic = magnetic
+        self.unit = unit
+        self.rule = rule
+        self.degree = degree
+        if unit is not None:
+            k = np.arange(-degree, degree + 1)
+            self.table = np.empty((2, k.size))
+            for row, spin in enumerate((-1, 1)):
+                delta_E = 2 * spin * (unit * k + magnetic)
+                self.table[row] = rule_probability(rule, delta_E / temperature)
+        else:
+            ratio = np.sqrt(8 * self.tolerance)
+            self.step = temperature * ratio
+            size = int(np.ceil(self.cutoff / ratio)) + 2
+            self.table = rule_probability(rule, np.arange(size) * ratio)
+            self.table[-1] = 0.0
+
+    # 翻转概率; field 为局域场 sum_k J_k * s_k (不含磁场), spins 为当前自旋, 标量或数组均可
+    def probability(self, field, spins):
+        if self.unit is not None:
+            k = np.rint(field / self.unit).astype(np.intp) + self.degree
+            return self.table[(spins > 0).astype(np.intp), k]
+        delta_E = 2 * spins * (field + self.magnetic)
+        x = np.abs(delta_E) / self.step if self.rule == 'heat-bath' else np.maximum(delta_E, 0) / self.step
+        index = np.minimum(x.astype(np.intp), self.table.size - 2)
+        frac = np.minimum(x - index, 1.0)
+        probability = self.table[index] * (1 - frac) + self.table[index + 1] * frac
+        if self.rule == 'heat-bath':
+            return np.where(delta_E < 0, 1 - probability, probability)
+        return probability
@@ -0,0 +1,71 @@
+import os
+import multiprocessing
+import numpy as np
+from model import SpinGlassModel
+from rng import seed_sequence
+
+
+# 无界面退火: 运行整个程序, 结束时 model 恢复为最低能量的构型, 返回结果
+def anneal(model, schedule):
+    model.start_annealing(schedule)
+    annealer = model.annealer
+    while model.annealer is not None:
+        model.sweep()
+    return annealer.result()
+
+
+# 工作进程启动时先编译 (或从缓存加载) 扫描内核, 不计入第一次重启的时间
+def _warm_up(backend):
+    SpinGlassModel(4, backend=backend).sweep()
+
+
+# 进程池中的一次重启: 同一组 J, 独立的随机初始构型和随机数流
+def _restart(task):
+    index, n, J, bound_option, backend, schedule, seed = task
+    model = SpinGlassModel(n, schedule.t_start, schedule.h_start, bound_option, backend, seed=seed)
+    model.set_couplings(J)
+    result = anneal(model, schedule)
+    result['restart'] = index
+    return result
+
+
+# 从 restarts 个随机构型分别退火, 在进程池中并行运行; 返回按重启序号排列的结果
+# seed 派生出每次重启的流, 结果与进程数无关; callback(result, finished, total) 在每次重启完成后调用
+def run_restarts(n, J, schedule, restarts, bound_option=True, backend=None, processes=None, seed=None, callback=None):
+    seeds = seed_sequence(seed).spawn(restarts)
+    tasks = [(index, n, J, bound_option, backend, schedule, seeds[index]) for index in range(restarts)]
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(max(1, min(restarts, processes or os.cpu_count() or 1)), _warm_up, (backend,)) as pool:
+        for finished, result in enumerate(pool.imap_unordered(_restart, tasks), 1):
+            results.append(result)
+            if callback is not None:
+                callback(result, finished, len(tasks))
+    return sorted(results, key=lambda result: result['restart'])
+
+
+# 达到目标能量的统计: 每次重启第一次达到 target (相对误差 tolerance 以内) 的扫描次数和时间, 成功率 p,
+# 以及以 99% 的概率至少成功一次所需的总量 TTS = t_run ln(0.01) / ln(1 - p) (p >= 0.99 时为 t_run)
+def time_to_target(results, target, tolerance=1e-9):
+    threshold = target + tolerance * abs(target)
+    hits = []
+    for result in results:
+        for sweeps, seconds, energy in result['trace']:
+            if energy <= threshold:
+                hits.append((sweeps, seconds))
+                break
+    success = len(hits) / len(results)
+    run_sweeps = np.mean([result['sweeps'] for result in results])
+    run_seconds = np.mean([result['seconds'] for result in results])
+    if success >= 0.99:
+        repeats = 1.0
+    elif success > 0:
+        repeats = np.log(0.01) / np.log(1 - success)
+    else:
+        repeats = np.inf
+    hit_sweeps = np.array([hit[0] for hit in hits], dtype=np.float64)
+    hit_seconds = np.array([hit[1] for hit in hits])
+    return {'target': target, 'success': success, 'hits': len(hits), 'restarts': len(results),
+            'median_sweeps': float(np.median(hit_sweeps)) if hits else np.inf,
+            'median_seconds': float(np.median(hit_seconds)) if hits else np.inf,
+            'tts_sweeps': run_sweeps * repeats, 'tts_seconds': run_seconds * repeats}
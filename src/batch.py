@@ -0,0 +1,119 @@
+import csv
+import os
+import multiprocessing
+import numpy as np
+from kernels import random_couplings
+from model import SpinGlassModel
+from rng import generator
+
+
+# 每个样本输出的列
+COLUMNS = ['seed', 'temperature', 'magnetic', 'n', 'sweeps', 'energy', 'energy_sq', 'abs_magnetization', 'magnetization_sq', 'specific_heat', 'susceptibility']
+# 参与无序平均的观测量
+OBSERVABLES = ['energy', 'abs_magnetization', 'magnetization_sq', 'specific_heat', 'susceptibility']
+
+
+# 任务的模拟随机数种子: 只由 (样本种子, T, h) 决定, 与任务的执行顺序和进程无关
+def task_seed(seed, temperature, magnetic):
+    bits = np.array([temperature, magnetic], dtype=np.float64).view(np.uint64)
+    return np.random.SeedSequence([seed, int(bits[0]), int(bits[1])])
+
+
+# 计算一个任务: 样本种子决定 J (同一样本在所有 T、h 下使用同一组 J), 先平衡再测量
+# 返回 COLUMNS 对应的一行数据 (能量、磁化强度均为每个格点的值)
+def run_sample(task):
+    seed, temperature, magnetic, n, bound_option, distribution, backend, equilibration, measurement = task
+    J = random_couplings(n, distribution=distribution, rng=generator(np.random.SeedSequence(seed).spawn(1)[0]))  # 与 SpinGlassModel(seed=seed) 的 J 相同
+    model = SpinGlassModel(n, temperature, magnetic, bound_option, backend, distribution, seed=task_seed(seed, temperature, magnetic))
+    model.set_couplings(J)
+    model.randomize()
+    model.run(equilibration)
+
+    energies = np.empty(measurement)
+    magnetizations = np.empty(measurement)
+    for k in range(measurement):
+        model.sweep()
+        energies[k] = model.energy / n**2
+        magnetizations[k] = model.magnetization
+    size = n**2
+    abs_m = np.abs(magnetizations)
+    return {
+        'seed': seed,
+        'temperature': temperature,
+        'magnetic': magnetic,
+        'n': n,
+        'sweeps': measurement,
+        'energy': energies.mean(),
+        'energy_sq': np.mean(energies**2),
+        'abs_magnetization': abs_m.mean(),
+        'magnetization_sq': np.mean(magnetizations**2),
+        'specific_heat': size * energies.var() / temperature**2,
+        'susceptibility': size * (np.mean(magnetizations**2) - abs_m.mean()**2) / temperature,
+    }
+
+
+# 已经完成的任务 (用于中断后继续)
+def completed_tasks(path):
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                done.add((int(row['seed']), float(row['temperature']), float(row['magnetic'])))
+    return done
+
+
+# 读取结果文件
+def read_results(path):
+    with open(path, newline='') as file:
+        return [{key: float(value) for key, value in row.items()} for row in csv.DictReader(file)]
+
+
+# 对所有样本种子 × 温度 × 磁场运行任务, 由进程池并行计算, 每完成一个任务就追加写入 output
+# output 中已有的任务会被跳过; callback(row, finished, total) 在每个任务完成后调用
+def run_batch(seeds, temperatures, fields, n, output, bound_option=True, distribution='gaussian', backend=None,
+              equilibration=1000, measurement=1000, processes=None, callback=None):
+    done = completed_tasks(output)
+    tasks = [(seed, float(temperature), float(magnetic), n, bound_option, distribution, backend, equilibration, measurement)
+             for seed in seeds for temperature in temperatures for magnetic in fields
+             if (seed, float(temperature), float(magnetic)) not in done]
+    total = len(tasks)
+    if not total:
+        return 0
+
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    context = multiprocessing.get_context('spawn')
+    with open(output, 'a', newline='') as file, context.Pool(processes or os.cpu_count()) as pool:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+        for finished, row in enumerate(pool.imap_unordered(run_sample, tasks), 1):
+            writer.writerow(row)
+            file.flush()
+            if callback is not None:
+                callback(row, finished, total)
+    return total
+
+
+# 无序平均: 按 (T, h) 分组, 对各样本求平均值和标准误差
+def aggregate(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['temperature'], row['magnetic']), []).append(row)
+    table = []
+    for (temperature, magnetic), group in sorted(groups.items()):
+        entry = {'temperature': temperature, 'magnetic': magnetic, 'samples': len(group)}
+        for name in OBSERVABLES:
+            values = np.array([row[name] for row in group])
+            entry[name] = values.mean()
+            entry[name + '_err'] = values.std(ddof=1) / np.sqrt(values.size) if values.size > 1 else 0.0
+        table.append(entry)
+    return table
+
+
+# 保存无序平均结果
+def write_summary(table, path):
+    columns = ['temperature', 'magnetic', 'samples'] + [name + suffix for name in OBSERVABLES for suffix in ('', '_err')]
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(table)
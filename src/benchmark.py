@@ -0,0 +1,357 @@
+import sys
+import os
+import json
+import time
+import platform
+import subprocess
+import tempfile
+import argparse
+import numpy as np
+from kernels import sublattice_tables, random_couplings, checkerboard_sweep, available_backends
+import kernels
+from acceptance import AcceptanceTable
+from rng import jit_states
+from model import SpinGlassModel
+from observables import BinningAnalysis
+from clusters import CLUSTER_MOVES
+from acceptance import UPDATE_RULES
+from spinfile import read_state, write_state
+from tempering import ParallelTempering, geometric_temperatures
+
+
+# 原来的逐点模拟 (与 GridWidget.simulation_by_step 周期边界分支相同), 作为对照
+def single_site_steps(spins, J, temperature, magnetic, count, rng):
+    n = spins.shape[0]
+    for _ in range(count):
+        i, j = rng.integers(0, n, size=2)
+        delta_E = 2 * spins[i, j] * \
+                (J[0, i, j] * spins[(i + 1) % n, j] + \
+                J[0, (i - 1) % n, j] * spins[(i - 1) % n, j] + \
+                J[1, i, j] * spins[i, (j + 1) % n] + \
+                J[1, i, (j - 1) % n] * spins[i, (j - 1) % n] + \
+                magnetic)
+        if delta_E < 0 or rng.random() < np.exp(-delta_E / temperature):
+            spins[i, j] *= -1
+
+
+# 逐点模拟的扫描速度 (sweeps/s), 只跑 steps 步再换算
+def bench_single_site(n, temperature=1.0, magnetic=0.0, steps=20000):
+    rng = np.random.default_rng()
+    spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=(n, n))
+    J = random_couplings(n, rng=rng)
+    start = time.perf_counter()
+    single_site_steps(spins, J, temperature, magnetic, steps, rng)
+    elapsed = time.perf_counter() - start
+    return steps / elapsed / n**2
+
+
+# 棋盘格向量化扫描速度 (sweeps/s), 包括每次扫描整体生成随机数
+def bench_sweep(n, temperature=1.0, magnetic=0.0, sweeps=50):
+    rng = np.random.default_rng()
+    spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=(n, n))
+    J = random_couplings(n, rng=rng)
+    sublattices = sublattice_tables(n)
+    acceptance = AcceptanceTable(temperature, magnetic)
+    uniforms = np.empty((n, n))
+    checkerboard_sweep(spins, J, acceptance, sublattices, rng.random(out=uniforms))  # 预热
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        checkerboard_sweep(spins, J, acceptance, sublattices, rng.random(out=uniforms))
+    elapsed = time.perf_counter() - start
+    return sweeps / elapsed
+
+
+# 编译后端扫描速度 (sweeps/s)
+def bench_jit(n, temperature=1.0, magnetic=0.0, sweeps=200):
+    rng = np.random.default_rng()
+    spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=(n, n))
+    J = random_couplings(n, rng=rng)
+    state = jit_states([rng])
+    kernels.sweep_jit(spins, J, temperature, magnetic, state)  # 预热 (包括编译)
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        kernels.sweep_jit(spins, J, temperature, magnetic, state)
+    elapsed = time.perf_counter() - start
+    return sweeps / elapsed
+
+
+# 各更新方式的去相关效率: 两个副本, 每次扫描后记录能量和 q^2 (铁磁时为 |M|), 由分箱估计积分自相关时间 tau (以扫描为单位),
+# 乘以每次扫描的 CPU 时间得到以 CPU 秒计的 tau, 每 CPU 秒的独立样本数为 1 / (2 tau t_sweep)
+def bench_decorrelation(n, temperature, cluster_move, ferromagnetic=False, sweeps=20000, equilibration=2000, seed=0):
+    model = SpinGlassModel(n, temperature, replicas=2, seed=seed, cluster_move=cluster_move)
+    if ferromagnetic:
+        model.set_couplings(np.full((2, n, n), 1 / 3, dtype=np.float32))
+    model.run(equilibration)
+    energies = np.empty(sweeps)
+    orders = np.empty(sweeps)
+    elapsed = 0.0
+    for k in range(sweeps):
+        start = time.process_time()
+        model.sweep()
+        elapsed += time.process_time() - start
+        energies[k] = model.energy
+        orders[k] = abs(model.magnetization) if ferromagnetic else model.overlap()**2
+    taus = []
+    for series in (energies, orders):
+        binning = BinningAnalysis()
+        for value in series:
+            binning.add(value)
+        taus.append(max(binning.autocorrelation_time(), 0.5))
+    return taus, elapsed / sweeps
+
+
+# 自旋玻璃在温度 temperature 下比较, 铁磁 (J = 1/3) 在临界温度 T_c = 2J / ln(1 + sqrt(2)) 下比较
+def main_clusters(n, temperature, sweeps):
+    critical = 2 / 3 / np.log(1 + np.sqrt(2))
+    for ferromagnetic, temperature in ((False, temperature), (True, critical)):
+        order = '|M|' if ferromagnetic else 'q^2'
+        print(f'{"ferromagnet" if ferromagnetic else "spin glass"} n={n} T={temperature:.4f}')
+        print(f'{"update":>16} {"ms/sweep":>10} {"tau_E":>8} {"tau_" + order:>9} {"tau_E cpu-s":>12} {"indep/cpu-s":>12}')
+        for cluster_move in CLUSTER_MOVES:
+            (tau_energy, tau_order), seconds = bench_decorrelation(n, temperature, cluster_move, ferromagnetic, sweeps)
+            tau = max(tau_energy, tau_order)
+            print(f'{"metropolis" if cluster_move == "none" else "+" + cluster_move:>16} {seconds * 1e3:>10.3f} {tau_energy:>8.1f} {tau_order:>9.1f} '
+                  f'{tau_energy * seconds:>12.3g} {1 / (2 * tau * seconds):>12.1f}')
+
+
+# 达到给定精度所需的墙钟时间: 平衡 equilibration 次扫描后每次扫描记录每个格点的能量,
+# 直到分箱误差不超过 accuracy (且至少 minimum 次扫描) 或超过 limit 秒; 返回 (扫描次数, 秒, 误差)
+def bench_accuracy(n, temperature, backend, rule, order, accuracy, equilibration=500, minimum=1024, limit=30.0, seed=0):
+    model = SpinGlassModel(n, temperature, backend=backend, seed=seed, update_rule=rule, sweep_order=order)
+    model.run(equilibration)
+    energy = BinningAnalysis()
+    start = time.perf_counter()
+    while True:
+        model.sweep()
+        energy.add(model.energy / n**2)
+        elapsed = time.perf_counter() - start
+        if (energy.count >= minimum and energy.error() <= accuracy) or elapsed > limit:
+            return energy.count, elapsed, energy.error()
+
+
+def main_rules(n, temperature, accuracy):
+    print(f'n={n} T={temperature} target error of E/N: {accuracy:g}')
+    print(f'{"backend":>8} {"rule":>11} {"order":>13} {"sweeps":>8} {"seconds":>9} {"error":>10}')
+    for backend in available_backends():
+        for rule in UPDATE_RULES:
+            for order in ('checkerboard', 'typewriter', 'random'):
+                sweeps, seconds, error = bench_accuracy(n, temperature, backend, rule, order, accuracy)
+                print(f'{backend:>8} {rule:>11} {order:>13} {sweeps:>8} {seconds:>9.2f} {error:>10.2e}' + ('' if error <= accuracy else '  (time limit)'))
+
+
+def main(sizes):
+    jit = 'numba' in available_backends()
+    print(f'{"n":>6} {"single-site":>14} {"checkerboard":>14} {"speedup":>10}' + (f' {"numba":>14} {"speedup":>10} {"flips/s":>12}' if jit else ''))
+    for n in sizes:
+        old = bench_single_site(n)
+        new = bench_sweep(n)
+        line = f'{n:>6} {old:>14.4f} {new:>14.2f} {new / old:>9.0f}x'
+        if jit:
+            fast = bench_jit(n)
+            line += f' {fast:>14.2f} {fast / old:>9.0f}x {fast * n**2:>12.3g}'
+        print(line)
+
+
+# 基准测试套件: 各项吞吐量写入 JSON (附机器信息), 可以与保存的基线比较, 标出变慢超过阈值的项
+# 每项为 {"value": 每秒次数, "unit": 单位}, 键为 "项目/参数", 数值都是越大越好
+SUITE_SIZES = (2, 8, 32, 128, 512, 1024, 2048, 4096)
+SUITE_SECTIONS = ('sweeps', 'steps', 'recompute', 'render', 'checkpoint', 'tempering')
+
+
+# 至少运行 budget 秒 (且至少 minimum 次) 的平均速度 (次/秒), 先调用一次预热
+def measure_rate(action, budget=0.5, minimum=3):
+    action()
+    count = 0
+    start = time.perf_counter()
+    while True:
+        action()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if count >= minimum and elapsed >= budget:
+            return count / elapsed
+
+
+# 机器和软件版本信息, 比较不同机器上的结果时作参考
+def machine_metadata():
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'machine': platform.machine(), 'processor': platform.processor(),
+            'system': platform.platform(), 'cpu_count': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'numba': numba_version, 'backends': available_backends(), 'commit': commit}
+
+
+# 整格扫描: 每个后端的 sweeps/s 和 flips/s (接受的翻转), 包括模型的增量统计和记录
+def suite_sweeps(results, sizes, budget):
+    for backend in available_backends():
+        for n in sizes:
+            model = SpinGlassModel(n, 1.0, backend=backend, seed=0)
+            sweeps = measure_rate(model.sweep, budget)
+            results[f'sweep/{backend}/n={n}'] = {'value': sweeps, 'unit': 'sweeps/s'}
+            results[f'flips/{backend}/n={n}'] = {'value': sweeps * model.steps / model.sweeps, 'unit': 'flips/s'}
+
+
+# 单点更新 (界面原来的 simulation_by_step): 每秒尝试的步数, 与格子大小基本无关, 只测较小的格子
+def suite_steps(results, sizes, budget):
+    for n in sizes:
+        if n <= 512:
+            model = SpinGlassModel(n, 1.0, seed=0)
+            results[f'step/n={n}'] = {'value': 1000 * measure_rate(lambda: [model.step() for _ in range(1000)], budget), 'unit': 'steps/s'}
+
+
+# 完整重新计算能量和磁化强度
+def suite_recompute(results, sizes, budget):
+    for n in sizes:
+        model = SpinGlassModel(n, 1.0, replicas=2, seed=0)
+        results[f'recompute/n={n}'] = {'value': measure_rate(model.recompute, budget), 'unit': 'calls/s'}
+
+
+# 界面绘制 (GridWidget.paintEvent 绘制到离屏图像); 没有 PyQt5 时跳过
+def suite_render(results, sizes, budget):
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtGui import QPixmap
+        from Spin_Glass import GridWidget
+    except ImportError:
+        print('render: PyQt5 is not installed, skipped')
+        return
+    app = QApplication.instance() or QApplication([])
+    for n in sizes:
+        if n >= 8:
+            widget = GridWidget(n)
+            widget.resize(widget.grid_size, widget.grid_size)
+            pixmap = QPixmap(widget.size())
+            results[f'render/n={n}'] = {'value': measure_rate(lambda: widget.render(pixmap), budget), 'unit': 'frames/s'}
+            widget.timer.stop()
+            widget.refresh_timer.stop()
+            widget.deleteLater()
+    app.processEvents()
+
+
+# 存档 (.spinglass) 的写入和读取 (读取包括恢复到模型), 以文件大小计的 MB/s
+def suite_checkpoint(results, sizes, budget):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.spinglass')
+        for n in sizes:
+            if n >= 128:
+                model = SpinGlassModel(n, 1.0, replicas=2, seed=0)
+                write_rate = measure_rate(lambda: write_state(path, model.state()), budget)
+                megabytes = os.path.getsize(path) / 1e6
+                read_rate = measure_rate(lambda: model.load_state(read_state(path, mmap=False)), budget)
+                results[f'checkpoint-write/n={n}'] = {'value': write_rate * megabytes, 'unit': 'MB/s'}
+                results[f'checkpoint-read/n={n}'] = {'value': read_rate * megabytes, 'unit': 'MB/s'}
+
+
+# 副本交换随进程数的扩展: 8 个副本 (64 x 64), 每秒的副本扫描数; 进程数为 1, 2, 4, ... 直到核心数
+def suite_tempering(results, budget, replicas=8, n=64, sweeps=10):
+    processes = 1
+    while processes <= min(os.cpu_count() or 1, replicas):
+        with ParallelTempering(n, geometric_temperatures(0.5, 1.5, replicas), processes=processes, seed=0) as pt:
+            rounds = measure_rate(lambda: pt.step(sweeps), budget)
+        results[f'tempering/processes={processes}'] = {'value': rounds * sweeps * replicas, 'unit': 'replica-sweeps/s'}
+        processes *= 2
+
+
+def run_suite(sizes, sections, budget):
+    results = {}
+    for section in sections:
+        start = time.perf_counter()
+        if section == 'tempering':
+            suite_tempering(results, budget)
+        else:
+            globals()[f'suite_{section}'](results, sizes, budget)
+        print(f'{section}: {time.perf_counter() - start:.1f} s', file=sys.stderr)
+    return {'meta': machine_metadata(), 'sizes': list(sizes), 'budget': budget, 'results': results}
+
+
+# 与基线比较: 返回 (键, 基线, 当前, 比值, 是否变慢超过 threshold) 的列表, 只比较两边都有的项
+def compare_results(current, baseline, threshold=0.15):
+    rows = []
+    for key, entry in current['results'].items():
+        if key in baseline['results']:
+            old, new = baseline['results'][key]['value'], entry['value']
+            ratio = new / old if old > 0 else float('inf')
+            rows.append((key, old, new, ratio, ratio < 1 - threshold))
+    return rows
+
+
+def print_results(data):
+    for key, entry in data['results'].items():
+        print(f'{key:<32} {entry["value"]:>14.4g} {entry["unit"]}')
+
+
+def print_comparison(rows, threshold):
+    print(f'{"benchmark":<32} {"baseline":>12} {"current":>12} {"ratio":>8}')
+    for key, old, new, ratio, regression in rows:
+        print(f'{key:<32} {old:>12.4g} {new:>12.4g} {ratio:>8.2f}' + (f'  REGRESSION (> {threshold:.0%} slower)' if regression else ''))
+    regressions = sum(row[4] for row in rows)
+    print(f'{regressions} regression(s) in {len(rows)} compared benchmarks')
+    return regressions
+
+
+# python benchmark.py suite [--sizes ...] [--only ...] [--output results.json] [--baseline baseline.json]
+# python benchmark.py compare results.json baseline.json
+# 有变慢的项时退出码为 1, 可以直接用于 CI
+def main_suite(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py suite', description='Throughput benchmark suite with regression tracking')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SUITE_SIZES), help='lattice sizes L')
+    parser.add_argument('--only', choices=SUITE_SECTIONS, nargs='+', default=list(SUITE_SECTIONS), help='sections to run')
+    parser.add_argument('--budget', type=float, default=0.5, help='minimum seconds per measurement')
+    parser.add_argument('--output', '-o', default='benchmark.json', help='JSON file for the results')
+    parser.add_argument('--baseline', default=None, help='stored results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+    data = run_suite(args.sizes, args.only, args.budget)
+    with open(args.output, 'w') as file:
+        json.dump(data, file, indent=1)
+    print_results(data)
+    print(f'results saved to {args.output}')
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if print_comparison(compare_results(data, baseline, args.threshold), args.threshold):
+            sys.exit(1)
+
+
+def main_compare(argv):
+    parser = argparse.ArgumentParser(prog='benchmark.py compare', description='Compare benchmark results with a baseline')
+    parser.add_argument('current')
+    parser.add_argument('baseline')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+    with open(args.current) as file:
+        current = json.load(file)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if print_comparison(compare_results(current, baseline, args.threshold), args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    # python benchmark.py clusters [n] [T] [sweeps]: 各更新方式的自相关时间
+    if sys.argv[1:2] == ['clusters']:
+        options = sys.argv[2:] + [None] * 3
+        main_clusters(int(options[0] or 32), float(options[1] or 0.2), int(options[2] or 20000))
+        sys.exit()
+    # python benchmark.py rules [n] [T] [accuracy]: 各更新规则和扫描顺序达到相同精度所需的时间
+    if sys.argv[1:2] == ['rules']:
+        options = sys.argv[2:] + [None] * 3
+        main_rules(int(options[0] or 32), float(options[1] or 0.5), float(options[2] or 2e-4))
+        sys.exit()
+    # python benchmark.py suite / compare: 基准测试套件和与基线的比较
+    if sys.argv[1:2] == ['suite']:
+        main_suite(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ['compare']:
+        main_compare(sys.argv[2:])
+        sys.exit()
+    sizes = [int(arg) for arg in sys.argv[1:]] or [50, 100, 200, 400]
+    main(sizes)
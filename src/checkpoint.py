@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from spinfile import write_state
+
+
+# 自动存档: 每 every_sweeps 次扫描或每 every_seconds 秒 (先到者) 把模型的完整状态写入 path
+# 状态在模拟线程中导出 (只复制数组), 由后台线程写入临时文件后改名, 任何时刻 path 都是一个完整的存档
+# 上一次存档还没写完时跳过本次, 模拟从不等待磁盘
+# 后台写入失败时保存异常, 在下一次 update()、save(wait=True) 或 close() 时抛出
+class Checkpointer:
+    def __init__(self, path, every_sweeps=1000, every_seconds=60.0, extra=None, sweeps=0, error=None):
+        self.path = path
+        self.every_sweeps = every_sweeps  # 0 或 None 表示不按扫描次数存档
+        self.every_seconds = every_seconds  # 0 或 None 表示不按时间存档
+        self.extra = extra or {}  # 额外写入存档的字段 (例如界面的 update_option)
+        self.last_sweeps = sweeps  # 上次存档时的扫描次数
+        self.last_time = time.perf_counter()
+        self.written = 0  # 已写入的存档数
+        self.error = error  # 后台写入的异常, 还没有抛出
+
+        self.queue = queue.Queue(maxsize=1)
+        self.writer = threading.Thread(target=self.write_checkpoints, daemon=True)
+        self.writer.start()
+
+    def write_checkpoints(self):
+        while True:
+            data = self.queue.get()
+            try:
+                if data is None:
+                    break
+                write_state(self.path, data)
+                self.written += 1
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    # 抛出后台写入的异常 (只抛出一次)
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    # 每次扫描后调用, 到期时存档
+    def update(self, model):
+        self.check()
+        due = (self.every_sweeps and model.sweeps - self.last_sweeps >= self.every_sweeps) or \
+              (self.every_seconds and time.perf_counter() - self.last_time >= self.every_seconds)
+        if due and not self.queue.full():
+            self.save(model)
+
+    # 立即存档 (wait 为 True 时等待写入完成)
+    def save(self, model, wait=False):
+        data = model.state()
+        data.update(self.extra)
+        self.last_sweeps = model.sweeps
+        self.last_time = time.perf_counter()
+        self.queue.put(data)
+        if wait:
+            self.flush()
+            self.check()
+
+    # 等待已提交的存档写完
+    def flush(self):
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(None)
+        self.writer.join()
+
+    # 停止 (等待写完), 抛出还没有抛出的写入异常
+    def close(self):
+        self.stop()
+        self.check()
+
+    # 停止 (等待写完), 返回在其他进程中重新创建 Checkpointer 所需的参数; 还没有抛出的写入异常随参数交给新的 Checkpointer
+    def detach(self):
+        self.stop()
+        return {'path': self.path, 'every_sweeps': self.every_sweeps, 'every_seconds': self.every_seconds,
+                'extra': self.extra, 'sweeps': self.last_sweeps, 'error': self.error}
@@ -0,0 +1,379 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from kernels import BACKENDS, SWEEP_ORDERS
+from acceptance import UPDATE_RULES
+from clusters import CLUSTER_MOVES
+from model import SpinGlassModel
+from spinfile import read_state, write_state, convert_legacy
+from tempering import ParallelTempering, geometric_temperatures
+import batch
+from schedules import Schedule, SCHEDULES, read_program
+from annealing import run_restarts, time_to_target
+from graphs import GEOMETRIES
+from graphmodel import GraphModel
+from profiler import PROFILER
+
+
+# 无界面批量模拟的命令行入口 (不导入 PyQt5), 例如:
+#   python cli.py run --size 400 --temperature 0.5 --sweeps 10000 --seed 1 --output result.spinglass
+
+
+# 运行一次模拟, 结果保存为界面可以打开的 .spinglass 文件
+def run(args):
+    if args.cluster == 'houdayer' and args.replicas < 2:
+        sys.exit('houdayer moves need --replicas 2 or more')
+    if args.cluster == 'houdayer' and args.replicas % 2:
+        print(f'note: houdayer pairs replicas (0, 1), (2, 3), ...; replica {args.replicas - 1} only gets single-spin updates')
+    model = SpinGlassModel(args.size, args.temperature, args.magnetic, not args.open_boundary, args.backend, args.couplings, args.replicas, args.series,
+                           args.seed, args.cluster, args.rule, args.order)
+    # 从存档继续: 模型参数、随机数状态和统计量都来自存档, --sweeps 为总扫描次数
+    if args.resume and args.checkpoint and os.path.exists(args.checkpoint):
+        model.load_state(read_state(args.checkpoint))
+        print(f'resumed from {args.checkpoint} at sweep {model.sweeps}')
+
+    if args.record:
+        model.start_recording(args.record, snapshot_interval=args.snapshot_interval)
+    if args.checkpoint:
+        model.start_checkpointing(args.checkpoint, args.checkpoint_every, args.checkpoint_seconds, {"update_option": True})
+    if args.profile:
+        PROFILER.enable()
+    # --samples: 判断为平衡后丢弃暂态, 收集到足够的独立样本即停止 (--sweeps 为上限)
+    if args.samples:
+        model.discard_transient = True
+
+    start = time.perf_counter()
+    first = done = model.sweeps
+    while done < args.sweeps and not (args.samples and model.independent_samples() >= args.samples):
+        chunk = min(args.report, args.sweeps - done)
+        model.run(chunk)
+        done += chunk
+        if not args.quiet:
+            print_progress(model, done, model.n**2)
+    elapsed = time.perf_counter() - start
+    print(f'{done - first} sweeps of {model.n}x{model.n} in {elapsed:.2f} s ({(done - first) / max(elapsed, 1e-9):.1f} sweeps/s, backend {model.backend})')
+    print_diagnostics(model, model.n**2)
+    if args.samples:
+        print(f'stopped after reaching {args.samples} independent samples' if model.independent_samples() >= args.samples else
+              f'{args.samples} independent samples not reached within {args.sweeps} sweeps')
+    if args.record:
+        model.stop_recording()
+        print(f'recording saved to {args.record}')
+    if args.checkpoint:
+        model.stop_checkpointing()
+        print(f'checkpoint saved to {args.checkpoint}')
+    if args.profile:
+        print(PROFILER.report())
+        PROFILER.export_trace(args.profile)
+        print(f'profile trace saved to {args.profile}')
+
+    if args.output:
+        data = model.state()
+        data["update_option"] = True
+        write_state(args.output, data)
+        print(f'saved to {args.output}')
+
+
+# 一行进度: 翻转数、接受率、能量和磁化强度 (及其平均值), 平衡后标出
+def print_progress(model, done, sites):
+    steps, energy, avg_energy, error_energy, sigma_energy, magnetization, avg_magnetization, error_magnetization, sigma_magnetization, \
+        overlap, specific_heat, susceptibility, acceptance, *_ = model.statistics()
+    print(f'sweep {done:>8}  flips {steps:>12}  acc {acceptance:.3f}  e {energy / sites:.4f}  '
+          f'M {magnetization:.4f}  <E> {avg_energy:.4f} ± {error_energy:.4f}  <M> {avg_magnetization:.4f} ± {error_magnetization:.4f}' +
+          (f'  q {overlap:.4f}' if model.replicas > 1 else '') + ('  equilibrated' if model.equilibrated_sweep is not None else ''))
+
+
+# 运行结束时的统计: 比热、磁化率、接受率、自相关时间 (扫描)、平衡开始的扫描数和独立样本数
+def print_diagnostics(model, sites):
+    observables = model.observables
+    *_, acceptance, tau_energy, tau_magnetization, tau_overlap, samples, equilibrated = model.statistics()
+    print(f'{observables.count} records  C {observables.specific_heat(model.temperature, sites):.4f}  chi {observables.susceptibility(model.temperature, sites):.4f}  '
+          f'acceptance {acceptance:.4f}  tau_E {tau_energy:.1f}  tau_|M| {tau_magnetization:.1f}' + (f'  tau_q {tau_overlap:.1f}' if model.replicas > 1 else '') + ' (sweeps)')
+    print((f'equilibrated at sweep {equilibrated}' if equilibrated >= 0 else 'not yet equilibrated') +
+          f'{" (transient discarded)" if model.discard_transient and equilibrated >= 0 else ""}, {samples:.0f} independent samples')
+
+
+# 一般几何上的模拟 (三维立方格子、随机正则图、Viana-Bray 图等), 结果保存为 .npz (图、J 和按位压缩的自旋)
+def graph(args):
+    model = GraphModel(args.geometry, args.size, args.temperature, args.magnetic, not args.open_boundary, args.backend, args.couplings, args.replicas,
+                       args.seed, args.rule, args.degree)
+    lattice = model.graph
+    print(f'{args.geometry}: {model.sites} sites, {lattice.first.size} bonds, degree {lattice.degree.min()}-{lattice.max_degree}, {len(lattice.colors)} colors')
+    if args.samples:
+        model.discard_transient = True
+    start = time.perf_counter()
+    done = 0
+    while done < args.sweeps and not (args.samples and model.independent_samples() >= args.samples):
+        chunk = min(args.report, args.sweeps - done)
+        model.run(chunk)
+        done += chunk
+        if not args.quiet:
+            print_progress(model, done, model.sites)
+    elapsed = time.perf_counter() - start
+    print(f'{done} sweeps of {model.sites} sites in {elapsed:.2f} s ({done * model.sites * model.replicas / max(elapsed, 1e-9):.3g} spin updates/s, '
+          f'backend {model.backend})')
+    print_diagnostics(model, model.sites)
+    if args.output:
+        np.savez_compressed(args.output, **model.arrays())
+        print(f'saved to {args.output}')
+
+
+# 副本交换: 同一组 J 的多个副本分布在温度序列上, 在进程池中并行模拟
+def tempering(args):
+    temperatures = [float(t) for t in args.temperatures.split(',')] if args.temperatures else \
+                   geometric_temperatures(args.tmin, args.tmax, args.replicas)
+    model = SpinGlassModel(args.size, temperatures[0], args.magnetic, not args.open_boundary, args.backend, args.couplings, seed=args.seed)
+
+    start = time.perf_counter()
+    with ParallelTempering(args.size, temperatures, args.magnetic, not args.open_boundary, model.J_bonds, args.backend, args.processes,
+                           model.seed_sequence.spawn(1)[0]) as pt:
+        done = 0
+        while done < args.rounds:
+            chunk = min(args.report, args.rounds - done)
+            pt.run(chunk, args.sweeps)
+            done += chunk
+            if not args.quiet:
+                energy, magnetization = pt.observables(0)
+                print(f'round {done:>8}  T {pt.temperatures[0]:.4f}  E {energy:.4f}  M {magnetization:.4f}')
+        elapsed = time.perf_counter() - start
+        print(f'{args.rounds} rounds x {args.sweeps} sweeps, {len(temperatures)} replicas on {len(pt.workers)} processes in {elapsed:.2f} s')
+        print(f'{"T_low":>10} {"T_high":>10} {"swap rate":>10}')
+        for t, rate in enumerate(pt.acceptance_rates()):
+            print(f'{pt.temperatures[t]:>10.4f} {pt.temperatures[t + 1]:>10.4f} {rate:>10.3f}')
+
+        if args.output:
+            model.spins = pt.configuration(0)
+            model.recompute()
+            data = model.state()
+            data["update_option"] = True
+            write_state(args.output, data)
+            print(f'lowest-temperature state saved to {args.output}')
+
+
+# 模拟退火寻找基态: 同一组 J 从多个随机构型分别退火 (进程池并行), 报告最低能量和达到目标能量的时间统计
+def anneal(args):
+    model = SpinGlassModel(args.size, args.t_start, args.h_start, not args.open_boundary, args.backend, args.couplings, seed=args.seed)
+    program = read_program(args.program) if args.program else None
+    schedule = Schedule('custom' if program is not None else args.schedule, args.t_start, args.t_end, args.sweeps, args.h_start, args.h_end, program,
+                        args.stage, args.rate)
+
+    def progress(result, finished, total):
+        if not args.quiet:
+            print(f'[{finished}/{total}] restart {result["restart"]:>4}  best E {result["best_energy"]:.6f} (e {result["best_energy"] / args.size**2:.6f})  '
+                  f'at sweep {result["best_sweep"]} of {result["sweeps"]}  {result["seconds"]:.2f} s')
+
+    start = time.perf_counter()
+    results = run_restarts(args.size, model.J_bonds, schedule, args.restarts, not args.open_boundary, args.backend, args.processes,
+                           model.seed_sequence.spawn(1)[0], progress)
+    elapsed = time.perf_counter() - start
+    best = min(results, key=lambda result: result['best_energy'])
+    print(f'{args.restarts} restarts of a {schedule.kind} schedule in {elapsed:.2f} s; best E {best["best_energy"]:.6f} (e {best["best_energy"] / args.size**2:.6f}) '
+          f'from restart {best["restart"]}')
+
+    # 目标能量默认为所有重启中的最低能量
+    target = args.target if args.target is not None else best['best_energy']
+    stats = time_to_target(results, target, args.tolerance)
+    print(f'target E {target:.6f}: reached by {stats["hits"]}/{stats["restarts"]} restarts, median {stats["median_sweeps"]:.0f} sweeps / '
+          f'{stats["median_seconds"]:.3f} s; time to target with 99% confidence {stats["tts_sweeps"]:.0f} sweeps / {stats["tts_seconds"]:.3f} s')
+
+    if args.output:
+        model.set_temperature(schedule.t_end)
+        model.set_magnetic(schedule.h_end)
+        model.spins = best['best_spins']
+        model.recompute()
+        data = model.state()
+        data["update_option"] = True
+        write_state(args.output, data)
+        print(f'lowest-energy state saved to {args.output}')
+
+
+# 开放边界、无磁场时的精确基态 (最小权完美匹配), 可作为 Monte Carlo 和退火的参考能量
+def groundstate(args):
+    from groundstate import available as matching_available  # 用到时才导入 (pymatching 是可选依赖)
+    if not matching_available():
+        sys.exit('the exact ground state needs pymatching (pip install pymatching)')
+    model = SpinGlassModel(args.size, args.temperature, 0.0, False, args.backend, args.couplings, seed=args.seed)
+    start = time.perf_counter()
+    energy = model.load_ground_state()
+    elapsed = time.perf_counter() - start
+    print(f'ground state of {model.n}x{model.n} (open boundaries, {args.couplings}) in {elapsed:.2f} s: E {energy:.6f} (e {energy / model.n**2:.6f})  '
+          f'M {model.magnetization:.4f}')
+    if args.output:
+        data = model.state()
+        data["update_option"] = True
+        write_state(args.output, data)
+        print(f'ground state saved to {args.output}')
+
+
+# 解析数值列表, 例如 "0.5,1.0,1.5"; 整数还可以写成范围 "0-99"
+def parse_list(text, kind=float):
+    values = []
+    for part in text.split(','):
+        if kind is int and '-' in part[1:]:
+            first, last = part.split('-', 1)
+            values.extend(range(int(first), int(last) + 1))
+        else:
+            values.append(kind(part))
+    return values
+
+
+# 无序平均: 多个 J 样本 × 温度 × 磁场, 在进程池中计算, 结果逐行追加到 CSV, 可中断后继续
+def disorder(args):
+    seeds = parse_list(args.seeds, int)
+    temperatures = parse_list(args.temperatures)
+    fields = parse_list(args.fields)
+
+    def progress(row, finished, total):
+        if not args.quiet:
+            print(f'[{finished}/{total}] seed {row["seed"]}  T {row["temperature"]:.4f}  h {row["magnetic"]:.4f}  e {row["energy"]:.5f}  |m| {row["abs_magnetization"]:.5f}')
+
+    start = time.perf_counter()
+    count = batch.run_batch(seeds, temperatures, fields, args.size, args.output, not args.open_boundary, args.couplings, args.backend,
+                            args.equilibration, args.measure, args.processes, progress)
+    print(f'{count} new tasks in {time.perf_counter() - start:.2f} s, results in {args.output}')
+
+    table = batch.aggregate(batch.read_results(args.output))
+    print(f'{"T":>8} {"h":>8} {"samples":>8} {"e":>18} {"|m|":>18} {"C":>18} {"chi":>18}')
+    for entry in table:
+        print(f'{entry["temperature"]:>8.4f} {entry["magnetic"]:>8.4f} {entry["samples"]:>8}' +
+              ''.join(f' {entry[name]:>9.5f}±{entry[name + "_err"]:<8.5f}' for name in ('energy', 'abs_magnetization', 'specific_heat', 'susceptibility')))
+    if args.summary:
+        batch.write_summary(table, args.summary)
+        print(f'disorder averages saved to {args.summary}')
+
+
+# 把旧版 (pickle) .spinglass 文件转换为新格式
+def convert(args):
+    convert_legacy(args.source, args.target or args.source)
+    print(f'converted {args.source} to {args.target or args.source}')
+
+
+# 各子命令共用的模型参数
+def add_model_arguments(parser):
+    parser.add_argument('--size', '-n', type=int, default=100, help='lattice size L (L x L sites)')
+    parser.add_argument('--temperature', '-T', type=float, default=1.0)
+    parser.add_argument('--magnetic', '-B', type=float, default=0.0, help='external field h')
+    parser.add_argument('--open-boundary', action='store_true', help='use open instead of periodic boundaries')
+    parser.add_argument('--couplings', choices=['gaussian', 'bimodal'], default='gaussian')
+    parser.add_argument('--backend', choices=BACKENDS, default=None, help='default: fastest available')
+    parser.add_argument('--seed', type=int, default=None, help='seed for all random streams (default: fresh entropy)')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='Headless 2D spin glass Monte Carlo')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run Metropolis sweeps at fixed T and h')
+    add_model_arguments(run_parser)
+    run_parser.add_argument('--sweeps', type=int, default=1000)
+    run_parser.add_argument('--report', type=int, default=100, help='print progress every N sweeps')
+    run_parser.add_argument('--replicas', type=int, default=1, help='independent replicas with the same J (2+ reports the overlap q)')
+    run_parser.add_argument('--rule', choices=UPDATE_RULES, default='metropolis', help='single-spin acceptance rule (heat-bath = Glauber)')
+    run_parser.add_argument('--order', choices=SWEEP_ORDERS, default='auto', help='site order within a sweep (auto: fastest for the backend)')
+    run_parser.add_argument('--cluster', choices=CLUSTER_MOVES, default='none',
+                            help='cluster move after every sweep (houdayer needs --replicas 2+; swendsen-wang/wolff suit the ferromagnetic limit)')
+    run_parser.add_argument('--output', '-o', default=None, help='.spinglass file to write the final state to')
+    run_parser.add_argument('--series', action='store_true', help='also keep the full E/M/q time series in the output file')
+    run_parser.add_argument('--record', default=None, help='directory to record observables and spin snapshots to (compressed .npz segments)')
+    run_parser.add_argument('--snapshot-interval', type=int, default=100, help='records between spin snapshots (0: none)')
+    run_parser.add_argument('--checkpoint', default=None, help='.spinglass file to auto-checkpoint the full state to')
+    run_parser.add_argument('--checkpoint-every', type=int, default=1000, help='sweeps between checkpoints (0: only by time)')
+    run_parser.add_argument('--checkpoint-seconds', type=float, default=60.0, help='seconds between checkpoints (0: only by sweeps)')
+    run_parser.add_argument('--resume', action='store_true', help='continue from --checkpoint if it exists; --sweeps is the total')
+    run_parser.add_argument('--samples', type=int, default=None,
+                            help='stop once equilibrated (transient discarded) with this many independent samples; --sweeps is the cap')
+    run_parser.add_argument('--profile', default=None, help='time sweeps and recomputes, print a summary and write a Chrome trace (.json)')
+    run_parser.add_argument('--quiet', '-q', action='store_true')
+    run_parser.set_defaults(func=run)
+
+    graph_parser = commands.add_parser('graph', help='Metropolis sweeps on a 3D cubic lattice or a sparse random graph (CSR neighbour lists)')
+    add_model_arguments(graph_parser)
+    graph_parser.add_argument('--geometry', choices=GEOMETRIES, default='cubic',
+                              help='--size is L for square/cubic lattices and the number of sites N for random graphs')
+    graph_parser.add_argument('--degree', type=float, default=3, help='degree (random-regular) or mean degree (viana-bray)')
+    graph_parser.add_argument('--sweeps', type=int, default=1000)
+    graph_parser.add_argument('--report', type=int, default=100, help='print progress every N sweeps')
+    graph_parser.add_argument('--replicas', type=int, default=1)
+    graph_parser.add_argument('--rule', choices=UPDATE_RULES, default='metropolis')
+    graph_parser.add_argument('--samples', type=int, default=None, help='stop once equilibrated with this many independent samples (--sweeps is the cap)')
+    graph_parser.add_argument('--output', '-o', default=None, help='.npz file for the graph, couplings and final spins')
+    graph_parser.add_argument('--quiet', '-q', action='store_true')
+    graph_parser.set_defaults(func=graph)
+
+    pt_parser = commands.add_parser('tempering', help='parallel tempering (replica exchange) on a process pool')
+    add_model_arguments(pt_parser)
+    pt_parser.add_argument('--temperatures', default=None, help='comma-separated temperature ladder (overrides --tmin/--tmax/--replicas)')
+    pt_parser.add_argument('--tmin', type=float, default=0.2)
+    pt_parser.add_argument('--tmax', type=float, default=1.5)
+    pt_parser.add_argument('--replicas', type=int, default=os.cpu_count() or 4)
+    pt_parser.add_argument('--processes', type=int, default=None, help='worker processes (default: all cores)')
+    pt_parser.add_argument('--rounds', type=int, default=1000, help='exchange rounds')
+    pt_parser.add_argument('--sweeps', type=int, default=10, help='sweeps per replica between exchanges')
+    pt_parser.add_argument('--report', type=int, default=100, help='print progress every N rounds')
+    pt_parser.add_argument('--output', '-o', default=None, help='.spinglass file for the lowest-temperature state')
+    pt_parser.add_argument('--quiet', '-q', action='store_true')
+    pt_parser.set_defaults(func=tempering)
+
+    anneal_parser = commands.add_parser('anneal', help='simulated annealing restarts on a process pool (ground-state search)')
+    add_model_arguments(anneal_parser)
+    anneal_parser.add_argument('--schedule', choices=SCHEDULES[:-1], default='geometric')
+    anneal_parser.add_argument('--program', default=None, help='CSV with columns sweep,temperature[,magnetic] for a custom T(t), h(t) program')
+    anneal_parser.add_argument('--t-start', type=float, default=2.0)
+    anneal_parser.add_argument('--t-end', type=float, default=0.05)
+    anneal_parser.add_argument('--h-start', type=float, default=0.0)
+    anneal_parser.add_argument('--h-end', type=float, default=0.0)
+    anneal_parser.add_argument('--sweeps', type=int, default=10000, help='sweeps per restart (linear/geometric)')
+    anneal_parser.add_argument('--stage', type=int, default=50, help='sweeps per temperature (adaptive)')
+    anneal_parser.add_argument('--rate', type=float, default=0.7, help='cooling rate: T <- T exp(-rate T / sigma_E) (adaptive)')
+    anneal_parser.add_argument('--restarts', type=int, default=8)
+    anneal_parser.add_argument('--processes', type=int, default=None, help='worker processes (default: all cores)')
+    anneal_parser.add_argument('--target', type=float, default=None, help='target energy for time-to-target (default: best found)')
+    anneal_parser.add_argument('--tolerance', type=float, default=1e-9, help='relative tolerance when comparing with the target')
+    anneal_parser.add_argument('--output', '-o', default=None, help='.spinglass file for the lowest-energy state')
+    anneal_parser.add_argument('--quiet', '-q', action='store_true')
+    anneal_parser.set_defaults(func=anneal)
+
+    gs_parser = commands.add_parser('groundstate', help='exact ground state for open boundaries and zero field (needs pymatching)')
+    gs_parser.add_argument('--size', '-n', type=int, default=100, help='lattice size L (L x L sites)')
+    gs_parser.add_argument('--temperature', '-T', type=float, default=1.0, help='temperature stored in the output file')
+    gs_parser.add_argument('--couplings', choices=['gaussian', 'bimodal'], default='gaussian')
+    gs_parser.add_argument('--backend', choices=BACKENDS, default=None)
+    gs_parser.add_argument('--seed', type=int, default=None, help='seed for the couplings (same as run/anneal with the same --seed)')
+    gs_parser.add_argument('--output', '-o', default=None, help='.spinglass file for the ground state')
+    gs_parser.set_defaults(func=groundstate)
+
+    batch_parser = commands.add_parser('batch', help='disorder average over many coupling realisations on a process pool')
+    batch_parser.add_argument('--size', '-n', type=int, default=32)
+    batch_parser.add_argument('--seeds', default='0-9', help='coupling seeds, e.g. "0-99" or "1,5,7"')
+    batch_parser.add_argument('--temperatures', '-T', default='0.5', help='comma-separated temperatures')
+    batch_parser.add_argument('--fields', '-B', default='0.0', help='comma-separated external fields')
+    batch_parser.add_argument('--open-boundary', action='store_true')
+    batch_parser.add_argument('--couplings', choices=['gaussian', 'bimodal'], default='gaussian')
+    batch_parser.add_argument('--backend', choices=BACKENDS, default=None)
+    batch_parser.add_argument('--equilibration', type=int, default=1000, help='sweeps discarded before measuring')
+    batch_parser.add_argument('--measure', type=int, default=1000, help='measurement sweeps per sample')
+    batch_parser.add_argument('--processes', type=int, default=None)
+    batch_parser.add_argument('--output', '-o', default='samples.csv', help='per-sample results; existing tasks are skipped')
+    batch_parser.add_argument('--summary', default=None, help='CSV file for the disorder-averaged table')
+    batch_parser.add_argument('--quiet', '-q', action='store_true')
+    batch_parser.set_defaults(func=disorder)
+
+    convert_parser = commands.add_parser('convert', help='convert a legacy pickle .spinglass file to the binary format (only for trusted files)')
+    convert_parser.add_argument('source')
+    convert_parser.add_argument('target', nargs='?', default=None, help='default: overwrite the source file')
+    convert_parser.set_defaults(func=convert)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except OSError as error:  # 读写文件失败 (包括后台写入的录制和存档), 以非零状态退出
+        sys.exit(f'error: {error}')
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # 未安装 numba 时并查集使用向量化的 NumPy 实现
+    numba = None
+
+
+# 可选的团簇更新 (每次 Metropolis 扫描后进行一次):
+#   houdayer: 同温度的两个副本 (0 和 1, 2 和 3, ...) 中 s^a s^b = -1 的区域组成团, 随机选一个团在两个副本中同时翻转,
+#             两个副本的总能量不变, 总是接受; 低温下帮助副本跨越能垒, 需要至少两个副本
+#   swendsen-wang: 满足的键 (J s_i s_j > 0) 以概率 1 - exp(-2|J|/T) 连接, 每个团按热浴概率翻转 (无磁场时为 1/2)
+#   wolff: 与 swendsen-wang 成键相同, 只翻转随机格点所在的一个团
+# swendsen-wang / wolff 对任意 J 都满足细致平衡, 但只在铁磁 (无阻挫) 极限下团簇才有意义, 自旋玻璃的团会逾渗
+CLUSTER_MOVES = ('none', 'houdayer', 'swendsen-wang', 'wolff')
+
+
+# 格子上的键, 与 J 的存储顺序相同 (先竖直键后水平键): 两端格点的一维序号 (i * n + j),
+# 以及该键是否存在 (开放边界下跨越边界的键不存在)
+def lattice_bonds(n, periodic=True):
+    i, j = np.indices((n, n))
+    first = np.tile(i * n + j, (2, 1, 1)).reshape(-1)
+    second = np.stack([(i + 1) % n * n + j, i * n + (j + 1) % n]).reshape(-1)
+    valid = np.ones((2, n, n), dtype=bool)
+    if not periodic:
+        valid[0, -1, :] = False
+        valid[1, :, -1] = False
+    return first, second, valid.reshape(-1)
+
+
+# 向量化的并查集: 每轮把每条键两端的根中较大的挂到较小的上, 再压缩路径直到每个点都直接指向根,
+# 两端已在同一个团中的键随后丢弃; 通常只需要几轮
+def _cluster_labels_numpy(first, second, size):
+    parent = np.arange(size)
+    while first.size:
+        low = np.minimum(first, second)
+        high = np.maximum(first, second)
+        np.minimum.at(parent, high, low)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        first, second = parent[first], parent[second]
+        keep = first != second
+        first, second = first[keep], second[keep]
+    return parent
+
+
+if numba is not None:
+    # 编译后的并查集 (路径减半), 合并时总是让较小的序号作根, 因此每个点的父节点序号不大于自身,
+    # 最后按序号从小到大一遍即可把每个点指向根
+    @numba.njit(cache=True, nogil=True)
+    def _cluster_labels_jit(first, second, size):
+        parent = np.arange(size)
+        for k in range(first.size):
+            a = first[k]
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            b = second[k]
+            while parent[b] != b:
+                parent[b] = parent[parent[b]]
+                b = parent[b]
+            if a < b:
+                parent[b] = a
+            elif b < a:
+                parent[a] = b
+        for k in range(size):
+            parent[k] = parent[parent[k]]
+        return parent
+
+
+# 由连接的键 (first[k], second[k]) 求团: 返回每个格点所在团的标号, 标号为团中最小的格点序号,
+# 两种实现给出相同的标号, 因此随机数的使用与后端无关
+def cluster_labels(first, second, size, jit=False):
+    if jit and numba is not None:
+        return _cluster_labels_jit(first, second, size)
+    return _cluster_labels_numpy(first, second, size)
+
+
+# swendsen-wang / wolff 成键概率 1 - exp(-2|J|/T) (每条键一个, 与 J 同形状)
+def bond_probability(J, temperature):
+    return -np.expm1(-2 * np.abs(J.astype(np.float64)) / temperature)
+
+
+# 对一个格子 (n, n) 做一次 swendsen-wang (wolff 为 True 时只翻转一个团) 更新, 返回翻转的自旋数
+# 每个团的翻转概率为热浴概率 1 / (1 + exp(2 B S_c / T)), S_c 为团内自旋之和
+def swendsen_wang(spins, J, bonds, probability, magnetic, temperature, rng, wolff=False, jit=False):
+    first, second, valid = bonds
+    flat = spins.reshape(-1)
+    satisfied = J.reshape(-1) * flat[first] * flat[second] > 0
+    active = valid & satisfied & (rng.random(first.size) < probability.reshape(-1))
+    labels = cluster_labels(first[active], second[active], flat.size, jit)
+    sums = np.bincount(labels, weights=flat, minlength=flat.size)
+    flip_probability = 0.5 * (1 - np.tanh(magnetic * sums / temperature))
+    if wolff:
+        label = labels[rng.integers(flat.size)]
+        flip = labels == label if rng.random() < flip_probability[label] else np.zeros(flat.size, dtype=bool)
+    else:
+        flip = rng.random(flat.size)[labels] < flip_probability[labels]
+    flat[flip] *= -1
+    return int(np.count_nonzero(flip))
+
+
+# 对同温度的两个副本做一次 houdayer 更新, 返回翻转的自旋数 (两个副本合计)
+def houdayer(spins_a, spins_b, bonds, rng, jit=False):
+    first, second, valid = bonds
+    a, b = spins_a.reshape(-1), spins_b.reshape(-1)
+    differ = a != b
+    candidates = np.flatnonzero(differ)
+    if candidates.size == 0:
+        return 0
+    active = valid & differ[first] & differ[second]
+    labels = cluster_labels(first[active], second[active], a.size, jit)
+    cluster = labels == labels[candidates[rng.integers(candidates.size)]]
+    a[cluster] *= -1
+    b[cluster] *= -1
+    return 2 * int(np.count_nonzero(cluster))
@@ -0,0 +1,225 @@
+import multiprocessing
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from model import SpinGlassModel
+from profiler import PROFILER
+
+
+# 快照中的统计量个数 (与 SpinGlassModel.statistics() 相同)
+STATISTICS = 18
+# 快照中的性能数据: (时间, 尝试的翻转, 接受的翻转, 计时的扫描次数, 扫描总耗时, 等待写入的录制分段和存档数), 扫描只在打开计时时计时
+PERFORMANCE = 6
+
+
+# 本进程的性能数据 (见 PERFORMANCE)
+def performance(model):
+    return (time.perf_counter(), model.attempted, model.accepted, *PROFILER.total('sweep'), model.queue_depth())
+
+
+# 共享内存中的双缓冲快照: 头部 [序号, 可读缓冲], 两组统计量, 两组性能数据, 两个 (n, n) int8 格子 (第 0 个副本)
+# 模拟进程总是写入另一个缓冲, 写完后切换可读缓冲并增加序号; 界面复制可读缓冲,
+# 复制前后序号相差不超过 1 时数据完整 (被复制的缓冲要再发布两次才会被覆盖), 否则重新读取
+class SharedSnapshot:
+    def __init__(self, n, name=None):
+        self.n = n
+        offset = 16 + 2 * (STATISTICS + PERFORMANCE) * 8
+        size = offset + 2 * n * n
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.owner = name is None
+        buffer = self.memory.buf
+        self.header = np.ndarray(2, dtype=np.int64, buffer=buffer)
+        self.statistics = np.ndarray((2, STATISTICS), dtype=np.float64, buffer=buffer, offset=16)
+        self.performance = np.ndarray((2, PERFORMANCE), dtype=np.float64, buffer=buffer, offset=16 + 2 * STATISTICS * 8)
+        self.spins = np.ndarray((2, n, n), dtype=np.int8, buffer=buffer, offset=offset)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    # 模拟进程: 发布一个快照
+    def publish(self, spins, statistics, performance=None):
+        back = 1 - self.header[1]
+        self.spins[back] = spins
+        self.statistics[back] = statistics
+        if performance is not None:
+            self.performance[back] = performance
+        self.header[1] = back
+        self.header[0] += 1
+
+    # 界面: 读取最新的快照 (自旋、统计量和性能数据的副本), 自 sequence 之后没有新快照时返回 None
+    def latest(self, sequence=-1):
+        while True:
+            first = int(self.header[0])
+            if first == sequence or first == 0:
+                return None
+            front = int(self.header[1])
+            spins = self.spins[front].copy()
+            statistics = self.statistics[front].copy()
+            performance = self.performance[front].copy()
+            if int(self.header[0]) - first <= 1:
+                return first, spins, statistics, performance
+
+    def close(self):
+        del self.header, self.statistics, self.performance, self.spins
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+# 异常的简短描述, 以字符串经管道传回界面 (异常对象不一定能 pickle)
+def describe(error):
+    return f'{type(error).__name__}: {error}'
+
+
+# 模拟进程: 从 state 恢复模型, 连续扫描并按 interval 秒发布快照
+# 命令: (方法名, 参数) 调用模型的方法; ('state',) 回复完整状态; ('profile', flag) 打开或关闭计时;
+# ('trace',) 回复计时数据 (PROFILER.snapshot()); ('stop',) 停止并回复 (状态, 录制/存档进度)
+# 发回的消息: ('reply', 值) 为命令的回复; ('error', 描述, 是否停止扫描) 为命令或扫描抛出的异常,
+# 命令出错时继续模拟, 扫描出错 (例如录制或存档写入失败) 后不再扫描, 只处理命令直到 stop
+def _engine_worker(conn, name, state, outputs, backend, interval, profile=False):
+    PROFILER.enable(profile)
+    model = SpinGlassModel(2, replicas=state["replicas"])
+    model.load_state(state)
+    model.set_backend(backend)
+    model.attach_outputs(outputs)
+    snapshot = SharedSnapshot(model.n, name)
+    snapshot.publish(model.spins, model.statistics(), performance(model))
+    last = time.perf_counter()
+    running = True
+    failed = False
+    while running:
+        while conn.poll():
+            try:
+                command, *args = conn.recv()
+            except EOFError:
+                command = 'stop'  # 界面进程已经关闭管道: 写完录制和存档后退出
+            if command == 'stop':
+                running = False
+                break
+            if command == 'state':
+                conn.send(('reply', model.state()))
+                continue
+            if command == 'profile':
+                PROFILER.enable(*args)
+                continue
+            if command == 'trace':
+                conn.send(('reply', PROFILER.snapshot()))
+                continue
+            try:
+                getattr(model, command)(*args)
+            except Exception as error:
+                conn.send(('error', describe(error), False))
+            last = 0.0  # 参数或构型改变后立即发布
+        if not running:
+            break
+        if failed:
+            conn.poll(interval)
+            continue
+        try:
+            model.sweep()
+        except Exception as error:
+            conn.send(('error', describe(error), True))
+            failed = True
+        now = time.perf_counter()
+        if now - last >= interval:
+            if PROFILER.enabled:
+                snapshot.publish(model.spins, model.statistics(), performance(model))
+                PROFILER.add('publish', now)
+            else:
+                snapshot.publish(model.spins, model.statistics())
+            last = now
+    outputs = model.detach_outputs()
+    snapshot.close()
+    try:
+        conn.send(('reply', (model.state(), outputs)))
+    except (BrokenPipeError, OSError):
+        pass
+    conn.close()
+
+
+# 在独立进程中运行模型, 界面进程只读取共享内存中的最新快照, 模拟不与界面争用 GIL
+# 开始时把模型的完整状态 (以及录制、存档的进度) 交给模拟进程, 停止时取回, 停止后的模型与一直在本进程中模拟时相同
+class SimulationEngine:
+    interval = 1 / 120  # 发布快照的最小间隔 (秒)
+
+    def __init__(self, model, profile=False):
+        self.model = model
+        self.snapshot = SharedSnapshot(model.n)
+        self.sequence = -1
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.worker = context.Process(target=_engine_worker, daemon=True,
+                                      args=(child_conn, self.snapshot.name, model.state(), model.detach_outputs(), model.backend, self.interval, profile))
+        self.worker.start()
+        child_conn.close()
+        self.pending = []  # 收到但还没有取走的异常 (描述, 是否停止扫描)
+        self.reported = False  # 已经报告过进程意外退出
+
+    # 调用模拟进程中模型的方法
+    def send(self, command, *args):
+        self.conn.send((command, *args))
+
+    # 最新的 (自旋, 统计量, 性能数据), 没有新快照时返回 None
+    def latest(self):
+        result = self.snapshot.latest(self.sequence)
+        if result is None:
+            return None
+        self.sequence, *snapshot = result
+        return snapshot
+
+    # 等待模拟进程的回复 (其间收到的异常留给 errors()); 进程意外退出时抛出异常而不是一直等待
+    def receive(self):
+        while True:
+            while not self.conn.poll(0.1):
+                if not self.worker.is_alive():
+                    raise RuntimeError(f'simulation process exited with code {self.worker.exitcode}')
+            kind, *message = self.conn.recv()
+            if kind == 'reply':
+                return message[0]
+            self.pending.append(tuple(message))
+
+    # 模拟进程报告的异常 [(描述, 是否停止扫描)], 取走后清空; 进程意外退出时报告一次
+    def errors(self):
+        try:
+            while self.conn.poll():
+                kind, *message = self.conn.recv()
+                if kind == 'error':
+                    self.pending.append(tuple(message))
+        except (EOFError, OSError):
+            pass
+        if not self.worker.is_alive() and self.worker.exitcode and not self.reported:
+            self.reported = True
+            self.pending.append((f'simulation process exited with code {self.worker.exitcode}', True))
+        errors, self.pending = self.pending, []
+        return errors
+
+    # 模拟进程中模型的完整状态 (不停止模拟)
+    def state(self):
+        self.send('state')
+        return self.receive()
+
+    # 模拟进程的计时数据 (PROFILER.snapshot())
+    def trace(self):
+        self.send('trace')
+        return self.receive()
+
+    # 停止模拟进程, 把最终状态和录制/存档进度恢复到本进程的模型
+    # 进程已经退出时抛出 RuntimeError, 本进程的模型保持启动模拟进程时的状态; 共享内存总是释放
+    def stop(self):
+        try:
+            if not self.worker.is_alive():
+                raise RuntimeError(f'simulation process exited with code {self.worker.exitcode}')
+            try:
+                self.send('stop')
+                state, outputs = self.receive()
+            except (BrokenPipeError, EOFError) as error:
+                raise RuntimeError(f'simulation process exited with code {self.worker.exitcode}') from error
+        finally:
+            self.worker.join()
+            self.conn.close()
+            self.snapshot.close()
+        self.model.load_state(state)
+        self.model.attach_outputs(outputs)
@@ -0,0 +1,90 @@
+import numpy as np
+from kernels import available_backends, pack_spins
+from rng import seed_sequence, spawn_generators, jit_states
+from acceptance import AcceptanceTable, coupling_unit, UPDATE_RULES
+from observables import ObservableStatistics, Equilibration, MeasuredModel
+from graphs import GEOMETRIES, build_graph, graph_sweep
+import graphs
+
+
+# 一般几何 (graphs.GEOMETRIES) 上的自旋玻璃: 与 SpinGlassModel 的算法和统计相同, 但格点按一般图的邻接表 (CSR) 存储,
+# 可以是三维立方格子或稀疏随机图; 只用于无界面运行 (cli.py graph), 不支持团簇更新、录制和存档
+# 自旋为 (R, N) int8, 随机数流的派生方式与 SpinGlassModel 相同: 第一个子流只用于图和 J (与副本数无关), square 的 J 与相同种子的 SpinGlassModel 相同;
+# 测量和统计见 MeasuredModel
+class GraphModel(MeasuredModel):
+
+    def __init__(self, geometry, size, temperature=1.0, magnetic=0.0, bound_option=True, backend=None, distribution='gaussian', replicas=1,
+                 seed=None, update_rule='metropolis', degree=3, keep_series=False):
+        if geometry not in GEOMETRIES:
+            raise ValueError(f'unknown geometry: {geometry}')
+        if update_rule not in UPDATE_RULES:
+            raise ValueError(f'unknown update rule: {update_rule}')
+        self.geometry = geometry
+        self.n = size
+        self.replicas = replicas
+        self.temperature = temperature
+        self.magnetic = magnetic
+        self.bound_option = bound_option
+        self.distribution = distribution
+        self.degree = degree
+        self.update_rule = update_rule
+        self.backend = backend if backend in available_backends() else available_backends()[-1]
+        self.seed_sequence = seed_sequence(seed)
+        self.coupling_rng, self.rng, *self.replica_rngs = spawn_generators(self.seed_sequence, self.replicas + 2)
+        self.rng_state = jit_states(self.replica_rngs)
+        self.graph = build_graph(geometry, size, bound_option, distribution, degree, self.coupling_rng)  # 图和 J 只用第一个子流
+        self.sites = self.graph.size
+        self.order = np.concatenate(self.graph.colors)  # 编译后端按颜色顺序访问格点
+        self.replica_spins = self.rng.choice(np.array([-1, 1], dtype=np.int8), size=(self.replicas, self.sites))
+        self.uniforms = np.empty(self.replica_spins.shape)
+        self.check_interval = 1000
+        self.observables = ObservableStatistics(keep_series)
+        self.equilibration = Equilibration(keep_series=keep_series)
+        self.discard_transient = False
+        self.build_acceptance()
+        self.recompute()
+        self.reset()
+
+    def recompute(self):
+        self.replica_energy = self.graph.energy(self.replica_spins, self.magnetic)
+        self.replica_magnetization = np.sum(self.replica_spins, axis=-1) / self.sites
+
+    def build_acceptance(self):
+        self.acceptance = AcceptanceTable(self.temperature, self.magnetic, coupling_unit(self.graph.J), self.update_rule, max(self.graph.max_degree, 1))
+
+    def set_temperature(self, temperature):
+        self.temperature = temperature
+        self.build_acceptance()
+
+    def set_magnetic(self, magnetic):
+        self.replica_energy -= (magnetic - self.magnetic) * self.replica_magnetization * self.sites
+        self.magnetic = magnetic
+        self.build_acceptance()
+
+    # 一次扫描, 记录了数据时返回 True
+    def sweep(self):
+        if self.backend == 'numba':
+            accepted, delta_E, delta_S = graphs.graph_sweep_jit(self.replica_spins, self.graph, self.temperature, self.magnetic, self.rng_state,
+                                                                self.update_rule, self.order)
+        else:
+            for g, uniforms in zip(self.replica_rngs, self.uniforms):
+                g.random(out=uniforms)
+            accepted, delta_E, delta_S = graph_sweep(self.replica_spins, self.graph, self.acceptance, self.uniforms)
+        self.steps += accepted
+        self.accepted += accepted
+        self.attempted += self.replicas * self.sites
+        self.sweeps += 1
+        self.replica_energy += delta_E
+        self.replica_magnetization += delta_S / self.sites
+        if self.check_interval and self.sweeps % self.check_interval == 0:
+            self.recompute()
+        recorded = self.sweeps % self.record_interval == 0
+        if recorded:
+            self.record()
+        return recorded
+
+    # 图、相互作用和自旋 (np.savez 可以直接保存)
+    def arrays(self):
+        return {'geometry': self.geometry, 'size': self.n, 'sites': self.sites, 'first': self.graph.first, 'second': self.graph.second,
+                'J': self.graph.J, 'packed_spins': pack_spins(self.replica_spins), 'replicas': self.replicas,
+                'temperature': self.temperature, 'magnetic': self.magnetic, 'sweeps': self.sweeps}
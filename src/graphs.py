@@ -0,0 +1,249 @@
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # 未安装 numba 时只能使用 NumPy 扫描
+    numba = None
+
+
+# 一般的格子和稀疏图 (界面只显示二维正方格子, 其余几何只能无界面运行):
+#   square: L x L 正方格子 (与 SpinGlassModel 相同, 但按一般图的方式存储)
+#   cubic: L x L x L 简单立方格子, 每个格点 6 个近邻
+#   random-regular: N 个格点的随机正则图, 每个格点恰好 degree 个近邻
+#   viana-bray: N 个格点的稀疏随机图 (Erdős–Rényi), 平均连接数 degree, 连接数服从泊松分布
+GEOMETRIES = ('square', 'cubic', 'random-regular', 'viana-bray')
+
+
+# 每条边的随机相互作用, 分布与 kernels.random_couplings 相同
+def edge_couplings(count, distribution='gaussian', rng=None, sigma=1/3):
+    rng = rng if rng is not None else np.random.default_rng()
+    if distribution == 'gaussian':
+        J = rng.normal(0, sigma, size=count)
+    elif distribution == 'bimodal':
+        J = sigma * rng.choice([-1.0, 1.0], size=count)
+    else:
+        raise ValueError(f'unknown coupling distribution: {distribution}')
+    return J.astype(np.float32)
+
+
+# 稀疏图上的相互作用: 第 k 条边连接 first[k] 和 second[k], 相互作用为 J[k]
+# 邻接表按 CSR 存储 (indptr, indices), weights 为对应边的 J, edge 为对应边的序号 (每条边在两端各出现一次)
+# colors 为若干组格点, 同一组内的格点互不相邻, 可以同时更新
+class CouplingGraph:
+    def __init__(self, size, first, second, J, colors=None, rng=None):
+        self.size = size
+        self.first = first.astype(np.int64)
+        self.second = second.astype(np.int64)
+        ends = np.concatenate([self.first, self.second])
+        neighbors = np.concatenate([self.second, self.first])
+        order = np.argsort(ends, kind='stable')
+        self.indices = neighbors[order]
+        self.edge = np.tile(np.arange(self.first.size), 2)[order]
+        self.degree = np.bincount(ends, minlength=size)
+        self.indptr = np.concatenate([[0], np.cumsum(self.degree)])
+        self.max_degree = int(self.degree.max()) if size else 0
+        self.colors = colors if colors is not None else greedy_colors(self, rng)
+        self.set_couplings(J)
+
+    # 换成给定的相互作用 (每条边一个)
+    def set_couplings(self, J):
+        self.J = J.astype(np.float32)
+        self.weights = self.J[self.edge]
+        # 每组格点的局域场只需要这些格点的邻接表: 预先取出 (起点, 近邻, 相互作用); 没有近邻的格点不出现在起点中
+        self.color_tables = []
+        for sites in self.colors:
+            rows = sites[self.degree[sites] > 0]
+            entries = np.repeat(self.indptr[rows], self.degree[rows]) + _ranges(self.degree[rows])
+            starts = np.concatenate([[0], np.cumsum(self.degree[rows])[:-1]])
+            self.color_tables.append((sites, np.searchsorted(sites, rows), starts, self.indices[entries], self.weights[entries]))
+
+    # 每个格点的局域场 sum_k J_k * s_k, spins 为 (N,) 或 (R, N)
+    def local_field(self, spins):
+        field = np.zeros(spins.shape, dtype=np.float64)
+        contributions = spins[..., self.indices] * self.weights
+        nonempty = self.degree > 0
+        field[..., nonempty] = np.add.reduceat(contributions, self.indptr[:-1][nonempty], axis=-1)
+        return field
+
+    # 总能量 H = -sum_<ij> J_ij s_i s_j - B sum_i s_i, 每条边只计一次 (多个副本时返回每个副本的能量)
+    def energy(self, spins, magnetic):
+        bonds = spins[..., self.first] * spins[..., self.second] * self.J
+        return -np.sum(bonds, axis=-1, dtype=np.float64) - magnetic * np.sum(spins, axis=-1, dtype=np.float64)
+
+
+# 0, 1, ..., k-1 依次接起来 (每个 k 一段)
+def _ranges(counts):
+    total = int(np.sum(counts))
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total) - starts
+
+
+# 一般图的着色 (Jones-Plassmann): 每个格点一个随机优先级, 每轮把比所有未着色近邻优先级都高的格点染成新的颜色
+# 每轮都是向量化运算; 对稀疏图轮数约为最大连接数
+def greedy_colors(graph, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    priority = rng.permutation(graph.size).astype(np.float64)
+    remaining = np.ones(graph.size, dtype=bool)
+    colors = []
+    owner = np.repeat(np.arange(graph.size), graph.degree)
+    while remaining.any():
+        # 已着色的近邻不再参与比较
+        rivals = np.where(remaining[graph.indices], priority[graph.indices], -1.0)
+        highest = np.full(graph.size, -1.0)
+        np.maximum.at(highest, owner, rivals)
+        chosen = remaining & (priority > highest)
+        colors.append(np.flatnonzero(chosen))
+        remaining &= ~chosen
+    return colors
+
+
+# 超立方格子的着色: 每个方向上坐标的颜色与 kernels.sublattice_masks 相同 (奇数 L 的周期格子用三色), 各方向求和
+def lattice_colors(L, dimension, periodic=True):
+    i = np.arange(L)
+    if L % 2 == 0 or not periodic:
+        axis, count = i % 2, 2
+    else:
+        axis, count = np.where(i == L - 1, 2, i % 2), 3
+    color = np.zeros((L,) * dimension, dtype=np.int64)
+    for d in range(dimension):
+        color += axis.reshape((L,) + (1,) * (dimension - 1 - d)) if d < dimension - 1 else axis
+    color = (color % count).reshape(-1)
+    return [np.flatnonzero(color == c) for c in range(count)]
+
+
+# L^dimension 的超立方格子 (格点序号按 C 顺序); 每个方向一组键, 开放边界下去掉跨越边界的键
+# bonds 为每条边在完整格子的相互作用数组 (dimension, L, ..., L) 中的一维序号 (第 d 个方向上格点 x 到 x + e_d 的键),
+# 即 kernels.random_couplings 的顺序; L = 2 的周期格子两条重合的键合并为一条边, 对应两个序号 (bonds 的第二项, 其余情况为 None)
+def hypercubic_edges(L, dimension, periodic=True):
+    sites = L**dimension
+    site = np.arange(sites).reshape((L,) * dimension)
+    first, second, bonds, wraps = [], [], [], []
+    for d in range(dimension):
+        neighbor = np.roll(site, -1, axis=d)
+        if periodic and L > 2:
+            first.append(site.reshape(-1))
+            second.append(neighbor.reshape(-1))
+        else:
+            # 开放边界 (或 L = 2 时周期边界的两条键重合) 不要跨越边界的键
+            first.append(np.take(site, np.arange(L - 1), axis=d).reshape(-1))
+            second.append(np.take(neighbor, np.arange(L - 1), axis=d).reshape(-1))
+        bonds.append(d * sites + first[-1])
+        wraps.append(d * sites + second[-1])
+    wrap = np.concatenate(wraps) if periodic and L == 2 else None
+    return np.concatenate(first), np.concatenate(second), (np.concatenate(bonds), wrap)
+
+
+# 随机正则图的边: 把 N * degree 个端点随机配对, 再随机交换自环和重边的端点直到图是简单图
+def random_regular_edges(size, degree, rng):
+    if size * degree % 2 or degree >= size:
+        raise ValueError('a random regular graph needs N * degree even and degree < N')
+    stubs = rng.permutation(np.repeat(np.arange(size), degree)).reshape(-1, 2)
+    while True:
+        low, high = stubs.min(axis=1), stubs.max(axis=1)
+        key = low * size + high
+        _, first_index = np.unique(key, return_index=True)
+        bad = np.ones(len(stubs), dtype=bool)
+        bad[first_index] = False
+        bad |= low == high
+        bad = np.flatnonzero(bad)
+        if bad.size == 0:
+            return stubs[:, 0], stubs[:, 1]
+        # 每条坏边与一条随机的边交换一个端点: (a, b), (c, d) -> (a, d), (c, b)
+        for edge, partner in zip(bad, rng.integers(len(stubs), size=bad.size)):
+            stubs[edge, 1], stubs[partner, 1] = stubs[partner, 1], stubs[edge, 1]
+
+
+# Viana-Bray 图的边: 每对格点以概率 degree / (N - 1) 相连 (边数服从二项分布, 边的位置均匀)
+def viana_bray_edges(size, degree, rng):
+    pairs = size * (size - 1) // 2
+    count = rng.binomial(pairs, min(degree / max(size - 1, 1), 1.0))
+    keys = np.empty(0, dtype=np.int64)
+    while keys.size < count:
+        first = rng.integers(size, size=count - keys.size)
+        second = rng.integers(size, size=count - keys.size)
+        keep = first != second
+        candidates = np.minimum(first, second)[keep] * size + np.maximum(first, second)[keep]
+        keys = np.unique(np.concatenate([keys, candidates]))
+    keys = rng.permutation(keys)[:count]
+    return keys // size, keys % size
+
+
+# 按几何生成图和相互作用: size 为 L (square, cubic) 或格点数 N (random-regular, viana-bray)
+# degree 为随机图的连接数 (random-regular) 或平均连接数 (viana-bray)
+def build_graph(geometry, size, periodic=True, distribution='gaussian', degree=3, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    if geometry in ('square', 'cubic'):
+        dimension = 2 if geometry == 'square' else 3
+        # 相互作用按完整格子生成后取出存在的键, 与 SpinGlassModel 用同一个随机数流时 square 的 J 相同 (开放边界时同样)
+        first, second, (bonds, wrap) = hypercubic_edges(size, dimension, periodic)
+        J = edge_couplings(dimension * size**dimension, distribution, rng)
+        J = J[bonds] if wrap is None else J[bonds] + J[wrap]
+        return CouplingGraph(size**dimension, first, second, J, lattice_colors(size, dimension, periodic))
+    if geometry == 'random-regular':
+        first, second = random_regular_edges(size, int(degree), rng)
+    elif geometry == 'viana-bray':
+        first, second = viana_bray_edges(size, degree, rng)
+    else:
+        raise ValueError(f'unknown geometry: {geometry}')
+    return CouplingGraph(size, first, second, edge_couplings(first.size, distribution, rng), rng=rng)
+
+
+# 一般图上的一次扫描 (逐组格点向量化更新), 参数和返回值与 kernels.checkerboard_sweep 相同, spins 和 uniforms 为 (R, N)
+def graph_sweep(spins, graph, acceptance, uniforms):
+    accepted = 0
+    energy_change = 0.0
+    spin_change = 0
+    for sites, rows, starts, neighbors, weights in graph.color_tables:
+        field = np.zeros((spins.shape[0], sites.size))
+        if rows.size:
+            field[:, rows] = np.add.reduceat(spins[:, neighbors] * weights, starts, axis=-1)
+        sub = spins[:, sites]
+        delta_E = 2 * sub * (field + acceptance.magnetic)
+        flip = uniforms[:, sites] < acceptance.probability(field, sub)
+        energy_change = energy_change + np.sum(delta_E, axis=-1, where=flip, dtype=np.float64)
+        spin_change = spin_change - 2 * np.sum(sub, axis=-1, where=flip, dtype=np.int64)
+        sub[flip] *= -1
+        spins[:, sites] = sub
+        accepted += int(np.count_nonzero(flip))
+    return accepted, energy_change, spin_change
+
+
+if numba is not None:
+    # 编译后的一般图扫描: 按 order 依次更新格点, 局域场由 CSR 邻接表求和; 随机数与 kernels._sweep_jit 相同 (xorshift64*)
+    @numba.njit(cache=True, nogil=True)
+    def _graph_sweep_jit(spins, indptr, indices, weights, order, temperature, magnetic, state, heat_bath):
+        replicas = spins.shape[0]
+        accepted = 0
+        energy_change = np.zeros(replicas)
+        spin_change = np.zeros(replicas, dtype=np.int64)
+        for r in range(replicas):
+            x = state[r]
+            for k in range(order.size):
+                i = order[k]
+                field = 0.0
+                for e in range(indptr[i], indptr[i + 1]):
+                    field += weights[e] * spins[r, indices[e]]
+                s = spins[r, i]
+                delta_E = 2 * s * (field + magnetic)
+                x ^= x >> np.uint64(12)
+                x ^= x << np.uint64(25)
+                x ^= x >> np.uint64(27)
+                u = (x * np.uint64(2685821657736338717) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+                if heat_bath:
+                    accept = u < 1.0 / (1.0 + math.exp(delta_E / temperature))
+                else:
+                    accept = delta_E <= 0 or u < math.exp(-delta_E / temperature)
+                if accept:
+                    spins[r, i] = -s
+                    accepted += 1
+                    energy_change[r] += delta_E
+                    spin_change[r] -= 2 * s
+            state[r] = x
+        return accepted, energy_change, spin_change
+
+
+# 编译后端的一次扫描 (按颜色顺序访问格点), 返回值与 graph_sweep 相同; state 为每个副本的 uint64 随机数状态
+def graph_sweep_jit(spins, graph, temperature, magnetic, state, rule='metropolis', order=None):
+    order = order if order is not None else np.concatenate(graph.colors)
+    return _graph_sweep_jit(spins, graph.indptr, graph.indices, graph.weights, order, temperature, magnetic, state, rule == 'heat-bath')
@@ -0,0 +1,286 @@
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # 未安装 numba 时只能使用 NumPy 后端
+    numba = None
+
+
+# 可选的模拟后端
+BACKENDS = ('numpy', 'numba')
+
+
+# 当前环境可用的后端
+def available_backends():
+    return [backend for backend in BACKENDS if backend != 'numba' or numba is not None]
+
+
+# 棋盘格分解: 返回若干子格掩码, 同一子格内的格点互不为近邻, 可以同时更新
+# 偶数 n 用红/黑两色; 奇数 n 的周期格子两色会在边界处冲突, 改用三色
+def sublattice_masks(n):
+    i = np.arange(n)
+    if n % 2 == 0:
+        color = i % 2
+        colors = 2
+    else:
+        color = np.where(i == n - 1, 2, i % 2)
+        colors = 3
+    site_color = (color[:, None] + color[None, :]) % colors
+    return [site_color == c for c in range(colors)]
+
+
+# 相互作用按键存储 (每条键只存一次, float32), J 的 shape 为 (2, n, n):
+#   J[0, i, j]: 竖直键 (i, j) - (i+1, j)
+#   J[1, i, j]: 水平键 (i, j) - (i, j+1)
+# 周期边界下最后一行/列的键跨越边界, 开放边界下这些键由键掩码 (bond_mask) 置为 0
+
+# 生成随机相互作用 J_{ij}
+# distribution 为 'gaussian' (高斯分布, 标准差 sigma) 或 'bimodal' (±sigma 等概率); rng 为 np.random.Generator
+def random_couplings(n, sigma=1/3, distribution='gaussian', rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    if distribution == 'gaussian':
+        J = rng.normal(0, sigma, size=(2, n, n))
+    elif distribution == 'bimodal':
+        J = sigma * rng.choice([-1.0, 1.0], size=(2, n, n))
+    else:
+        raise ValueError(f'unknown coupling distribution: {distribution}')
+    return J.astype(np.float32)
+
+
+# 旧版 (n, n, 4) 的相互作用 (每个格点存 4 个近邻, 0 -> (i+1, j), 2 -> (i, j+1)) 转为按键存储
+def couplings_from_legacy(J_interaction):
+    return np.stack([J_interaction[:, :, 0], J_interaction[:, :, 2]]).astype(np.float32)
+
+
+# 自旋按位压缩保存 (+1 -> 1, -1 -> 0), 每个自旋占 1 bit
+def pack_spins(spins):
+    return np.packbits(spins > 0, axis=None)
+
+
+def unpack_spins(packed, shape):
+    bits = np.unpackbits(packed, count=int(np.prod(shape))).reshape(shape)
+    return (2 * bits.astype(np.int8) - 1).astype(np.int8)
+
+
+# 开放边界: 跨越边界的键 (最后一行的竖直键和最后一列的水平键) 乘以 0, 返回 (2, n, n) 的键掩码
+# 相互作用乘以掩码后 (model.couplings), 所有内核和能量计算都按周期格子进行, 热路径中没有边界判断
+def bond_mask(n, periodic=True):
+    mask = np.ones((2, n, n), dtype=np.float32)
+    if not periodic:
+        mask[0, -1, :] = 0
+        mask[1, :, -1] = 0
+    return mask
+
+
+# 近邻表 (每个格子大小建一次), 格点按一维序号 i * n + j:
+#   neighbors[k, site]: 第 k 个近邻 (k = 0..3: 下、上、右、左), 跨越边界时周期地取
+#   bonds[k, site]: 与该近邻之间的键在 J.reshape(-1) 中的序号
+def neighbor_table(n):
+    i, j = np.indices((n, n))
+    neighbors = np.stack([(i + 1) % n * n + j, (i - 1) % n * n + j, i * n + (j + 1) % n, i * n + (j - 1) % n])
+    bonds = np.stack([i * n + j, (i - 1) % n * n + j, n * n + i * n + j, n * n + i * n + (j - 1) % n])
+    return neighbors.reshape(4, -1), bonds.reshape(4, -1)
+
+
+# 计算每个格点的局域场 sum_k J_k * s_k (J 为乘以键掩码后的相互作用)
+# spins 可以是单个格子 (n, n), 也可以是共用同一组 J 的多个副本 (R, n, n)
+def local_field(spins, J):
+    return J[0] * np.roll(spins, -1, axis=-2) + np.roll(J[0] * spins, 1, axis=-2) + \
+           J[1] * np.roll(spins, -1, axis=-1) + np.roll(J[1] * spins, 1, axis=-1)
+
+
+# 计算总能量 H = -sum_<ij> J_ij s_i s_j - B sum_i s_i, 每条键只计一次 (多个副本时返回每个副本的能量); J 为乘以键掩码后的相互作用
+def total_energy(spins, J, magnetic):
+    vertical = J[0] * spins * np.roll(spins, -1, axis=-2)
+    horizontal = J[1] * spins * np.roll(spins, -1, axis=-1)
+    return -np.sum(vertical, axis=(-2, -1), dtype=np.float64) - np.sum(horizontal, axis=(-2, -1), dtype=np.float64) - \
+           magnetic * np.sum(spins, axis=(-2, -1))
+
+
+# 扫描顺序:
+#   checkerboard: 逐个子格整体更新 (NumPy 后端最快)
+#   typewriter: 按行依次更新 (编译后端最快, 顺序访问内存); NumPy 后端每行的偶数列和奇数列各向量化更新一次
+#   random: 每次随机选择格点, 共 n^2 次 (与原来的单点模拟相同, 访问内存没有规律, 作为对照)
+#   auto: 后端最快的顺序
+SWEEP_ORDERS = ('auto', 'checkerboard', 'typewriter', 'random')
+
+
+# 列的分组: 同一组的列互不相邻, 一行中同一组的格点可以同时更新 (奇数 n 的周期格子用三组, 与 sublattice_masks 相同)
+def column_groups(n):
+    j = np.arange(n)
+    color = j % 2 if n % 2 == 0 else np.where(j == n - 1, 2, j % 2)
+    return [np.flatnonzero(color == c) for c in range(color.max() + 1)]
+
+
+# 格点 (r, i, j) 的局域场 sum_k J_k * s_k, r, i, j 为等长的数组 (每个副本一个格点); 近邻和键都从近邻表 (neighbor_table) 中查出
+def site_field(spins, J, table, r, i, j):
+    neighbors, bonds = table
+    site = i * spins.shape[-1] + j
+    flat = spins.reshape(spins.shape[0], -1)
+    couplings = J.reshape(-1)
+    return couplings[bonds[0, site]] * flat[r, neighbors[0, site]] + couplings[bonds[1, site]] * flat[r, neighbors[1, site]] + \
+           couplings[bonds[2, site]] * flat[r, neighbors[2, site]] + couplings[bonds[3, site]] * flat[r, neighbors[3, site]]
+
+
+# 每个副本各更新一个格点 (r, i, j), u 为各自的均匀随机数; 返回 (是否翻转, 能量变化, 原来的自旋)
+def site_update(spins, J, acceptance, table, r, i, j, u):
+    field = site_field(spins, J, table, r, i, j)
+    s = spins[r, i, j]
+    delta_E = 2 * s * (field + acceptance.magnetic)
+    flip = u < acceptance.probability(field, s)
+    spins[r[flip], i[flip], j[flip]] = -s[flip]
+    return flip, delta_E, s
+
+
+# 棋盘格扫描用的子格 (每个格子大小建一次), 只在子格的格点上计算局域场:
+# 行和列各按 sublattice_masks 的颜色分为 2 类 (偶数 n) 或 3 类 (奇数 n, 最后一行/列单独一类), 每类是一个步长为 2 的切片;
+# 行类 ci 和列类 cj 的块颜色为 (ci + cj) % 颜色数, 与 sublattice_masks 相同. 返回每种颜色的块列表, 每块为
+# (行切片, 列切片, 下/上一行的行号, 右/左一列的列号), 近邻按行号或列号沿一个轴取出 (跨越边界时周期地取), 内存只与 n 有关
+def sublattice_tables(n):
+    if n % 2 == 0:
+        classes = [slice(0, n, 2), slice(1, n, 2)]
+    else:
+        classes = [slice(0, n - 1, 2), slice(1, n, 2), slice(n - 1, n)]
+    index = np.arange(n)
+    tables = [[] for _ in classes]
+    for ci, rows in enumerate(classes):
+        for cj, cols in enumerate(classes):
+            tables[(ci + cj) % len(classes)].append((rows, cols, (index[rows] + 1) % n, (index[rows] - 1) % n, (index[cols] + 1) % n, (index[cols] - 1) % n))
+    return tables
+
+
+# 对整个格子做一次扫描 (逐个子格向量化更新), 接受概率查 acceptance 表 (AcceptanceTable, 决定更新规则)
+# 多个副本 (R, n, n) 在同一次向量化运算中一起更新; sublattices 为 sublattice_tables(n)
+# uniforms 为与 spins 同形状的 [0, 1) 均匀随机数, 每次扫描预先整体生成, 每个格点用一个
+# 返回 (翻转次数, 能量变化, 自旋总和变化), 后两项在多个副本时为每个副本的值, 用于增量更新能量和磁化强度
+def checkerboard_sweep(spins, J, acceptance, sublattices, uniforms):
+    accepted = 0
+    energy_change = 0.0
+    spin_change = 0
+    for blocks in sublattices:
+        for rows, cols, down, up, right, left in blocks:
+            sub = spins[..., rows, cols]  # 视图, 翻转直接写回 spins
+            column_spins = spins[..., :, cols]
+            row_spins = spins[..., rows, :]
+            field = J[0, rows, cols] * np.take(column_spins, down, axis=-2) + np.take(J[0, :, cols], up, axis=-2) * np.take(column_spins, up, axis=-2) + \
+                    J[1, rows, cols] * np.take(row_spins, right, axis=-1) + np.take(J[1, rows, :], left, axis=-1) * np.take(row_spins, left, axis=-1)
+            delta_E = 2 * sub * (field + acceptance.magnetic)
+            flip = uniforms[..., rows, cols] < acceptance.probability(field, sub)
+            energy_change = energy_change + np.sum(delta_E, axis=(-2, -1), where=flip, dtype=np.float64)
+            spin_change = spin_change - 2 * np.sum(sub, axis=(-2, -1), where=flip, dtype=np.int64)
+            accepted += int(np.count_nonzero(flip))
+            np.negative(sub, out=sub, where=flip)
+    return accepted, energy_change, spin_change
+
+
+# 按行扫描 (typewriter), spins 为 (R, n, n); 每行按列的分组 (column_groups) 向量化更新, table 为近邻表, 其余参数和返回值与 checkerboard_sweep 相同
+def typewriter_sweep(spins, J, acceptance, table, groups, uniforms):
+    replicas, n = spins.shape[0], spins.shape[-1]
+    accepted = 0
+    energy_change = np.zeros(replicas)
+    spin_change = np.zeros(replicas, dtype=np.int64)
+    for i in range(n):
+        for columns in groups:
+            r = np.repeat(np.arange(replicas), columns.size)
+            j = np.tile(columns, replicas)
+            flip, delta_E, s = site_update(spins, J, acceptance, table, r, np.full(r.size, i), j, uniforms[r, i, j])
+            energy_change += np.bincount(r, np.where(flip, delta_E, 0), replicas)
+            spin_change -= np.bincount(r, np.where(flip, 2 * s, 0), replicas).astype(np.int64)
+            accepted += int(np.count_nonzero(flip))
+    return accepted, energy_change, spin_change
+
+
+# 随机顺序扫描: 每个副本依次更新 sites[:, r, k] 处的格点 (k = 0..n^2-1), uniforms 为 (R, n^2); 返回值与 checkerboard_sweep 相同
+def random_site_sweep(spins, J, acceptance, table, sites, uniforms):
+    replicas = spins.shape[0]
+    r = np.arange(replicas)
+    accepted = 0
+    energy_change = np.zeros(replicas)
+    spin_change = np.zeros(replicas, dtype=np.int64)
+    for k in range(uniforms.shape[1]):
+        flip, delta_E, s = site_update(spins, J, acceptance, table, r, sites[0, :, k], sites[1, :, k], uniforms[:, k])
+        energy_change += np.where(flip, delta_E, 0)
+        spin_change -= np.where(flip, 2 * s, 0)
+        accepted += int(np.count_nonzero(flip))
+    return accepted, energy_change, spin_change
+
+
+if numba is not None:
+    # 编译后的扫描: 逐点顺序更新, 内联 xorshift64* 随机数, 同时累计能量和自旋变化; 释放 GIL, 模拟线程不阻塞界面
+    # spins 为 (R, n, n) 的副本组, 依次扫描每个副本; 每个副本有独立的随机数状态 state[r]
+    # heat_bath 为 True 时用 heat-bath 规则, 否则用 Metropolis
+    # random_sites 为 False 时按 site_color 分 colors 轮 (每轮按行访问颜色为该轮的格点), colors = 1 即 typewriter 顺序;
+    # 为 True 时每次随机选择格点 (多用两个随机数)
+    @numba.njit(cache=True, nogil=True)
+    def _sweep_jit(spins, J, temperature, magnetic, state, heat_bath, random_sites, site_color, colors):
+        replicas, n = spins.shape[0], spins.shape[1]
+        accepted = 0
+        energy_change = np.zeros(replicas)
+        spin_change = np.zeros(replicas, dtype=np.int64)
+        for r in range(replicas):
+            x = state[r]
+            for c in range(colors):
+                for row in range(n):
+                    for column in range(n):
+                        if random_sites:
+                            x ^= x >> np.uint64(12)
+                            x ^= x << np.uint64(25)
+                            x ^= x >> np.uint64(27)
+                            i = int((x * np.uint64(2685821657736338717) >> np.uint64(11)) * (1.0 / 9007199254740992.0) * n)
+                            x ^= x >> np.uint64(12)
+                            x ^= x << np.uint64(25)
+                            x ^= x >> np.uint64(27)
+                            j = int((x * np.uint64(2685821657736338717) >> np.uint64(11)) * (1.0 / 9007199254740992.0) * n)
+                        elif site_color[row, column] == c:
+                            i = row
+                            j = column
+                        else:
+                            continue
+                        # J 已乘以键掩码, 近邻总是周期地取
+                        down = i + 1 if i + 1 < n else 0
+                        up = i - 1 if i > 0 else n - 1
+                        right = j + 1 if j + 1 < n else 0
+                        left = j - 1 if j > 0 else n - 1
+                        field = 0.0
+                        field += J[0, i, j] * spins[r, down, j]
+                        field += J[0, up, j] * spins[r, up, j]
+                        field += J[1, i, j] * spins[r, i, right]
+                        field += J[1, i, left] * spins[r, i, left]
+                        s = spins[r, i, j]
+                        delta_E = 2 * s * (field + magnetic)
+                        x ^= x >> np.uint64(12)
+                        x ^= x << np.uint64(25)
+                        x ^= x >> np.uint64(27)
+                        u = (x * np.uint64(2685821657736338717) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+                        if heat_bath:
+                            accept = u < 1.0 / (1.0 + math.exp(delta_E / temperature))
+                        else:
+                            accept = delta_E <= 0 or u < math.exp(-delta_E / temperature)
+                        if accept:
+                            spins[r, i, j] = -s
+                            accepted += 1
+                            energy_change[r] += delta_E
+                            spin_change[r] -= 2 * s
+            state[r] = x
+        return accepted, energy_change, spin_change
+
+
+# 编译后端扫描时各格点的颜色和颜色数: typewriter 为一种颜色, checkerboard 与 sublattice_masks 相同
+def jit_order(n, order):
+    if order == 'checkerboard':
+        masks = sublattice_masks(n)
+        return np.argmax(np.stack(masks), axis=0).astype(np.int8), len(masks)
+    return np.zeros((n, n), dtype=np.int8), 1
+
+
+# 编译后端的一次扫描, 返回值与 checkerboard_sweep 相同; state 为每个副本的 uint64 随机数状态 (rng.jit_states)
+# rule 为 acceptance.UPDATE_RULES 之一, order 为 SWEEP_ORDERS 之一 ('auto' 即 typewriter)
+def sweep_jit(spins, J, temperature, magnetic, state, rule='metropolis', order='auto', site_order=None):
+    site_color, colors = site_order if site_order is not None else jit_order(spins.shape[-1], order)
+    single = spins.ndim == 2
+    accepted, energy_change, spin_change = _sweep_jit(spins[None] if single else spins, J, temperature, magnetic, state,
+                                                      rule == 'heat-bath', order == 'random', site_color, colors)
+    if single:
+        return accepted, energy_change[0], int(spin_change[0])
+    return accepted, energy_change, spin_change
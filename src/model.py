@@ -0,0 +1,476 @@
+import numpy as np
+from kernels import sublattice_tables, column_groups, bond_mask, neighbor_table, random_couplings, couplings_from_legacy, pack_spins, unpack_spins, total_energy, site_update, \
+    checkerboard_sweep, typewriter_sweep, random_site_sweep, jit_order, available_backends, SWEEP_ORDERS
+import kernels
+from rng import seed_sequence, fresh_sequence, spawn_generators, jit_states, pack_generators, unpack_generators
+from acceptance import AcceptanceTable, coupling_unit, UPDATE_RULES
+from observables import ObservableStatistics, Equilibration, MeasuredModel
+from recorder import Recorder
+from checkpoint import Checkpointer
+from clusters import CLUSTER_MOVES, lattice_bonds, bond_probability, swendsen_wang, houdayer
+from schedules import Annealer
+from profiler import profiled
+
+
+# 随机自旋 (int8), shape 为 (n, n) 或 (R, n, n); rng 为 np.random.Generator
+def random_spins(shape, rng):
+    return rng.choice(np.array([-1, 1], dtype=np.int8), size=shape)
+
+
+# 自旋玻璃模型: 保存全部模拟状态和算法, 不依赖 PyQt5, 可以在无界面的计算节点上运行
+# 可以同时模拟共用同一组 J 的 R 个独立副本 (replica_spins, shape (R, n, n), int8),
+# 所有副本在同一次向量化扫描中更新; 两个副本之间的 Edwards-Anderson 重叠 q 是自旋玻璃的序参量
+# spins / energy / magnetization 为第 0 个副本 (界面显示的副本)
+# 随机数由种子 seed 决定 (见 rng.py): J 用单独的流 (与副本数无关), 模型自身的流生成初始自旋, 每个副本的 Monte Carlo 各用一个独立的流
+# update_rule 为单自旋翻转的接受规则 (acceptance.UPDATE_RULES), sweep_order 为扫描访问格点的顺序 (kernels.SWEEP_ORDERS)
+# cluster_move 可以在每次扫描后加一次团簇更新 (见 clusters.py)
+class SpinGlassModel(MeasuredModel):
+    step_block = 1024  # 单点模拟每次预先生成的随机数个数 (每个副本)
+
+    def __init__(self, n, temperature=0.01, magnetic=0.0, bound_option=True, backend=None, distribution='gaussian', replicas=1, keep_series=False,
+                 seed=None, cluster_move='none', update_rule='metropolis', sweep_order='auto'):
+        self.n = n
+        self.replicas = replicas
+        self.temperature = temperature
+        self.magnetic = magnetic
+        self.bound_option = bound_option  # True 为周期边界条件
+        self.distribution = distribution  # 相互作用分布 ('gaussian' 或 'bimodal')
+        self.update_rule = 'metropolis'
+        self.sweep_order = 'auto'
+        self.backend = available_backends()[-1]  # 默认使用最快的可用后端
+        if backend is not None:
+            self.set_backend(backend)
+        self.set_seed(seed)
+        self.uniforms = np.empty(0)  # NumPy 后端每次扫描的均匀随机数
+        self.is_black = True
+        self.check_interval = 1000  # 每隔多少次扫描重新计算一次能量以校正累积误差, 0 表示不校正
+        self.observables = ObservableStatistics(keep_series)  # 流式统计, keep_series 为 True 时同时保留完整时间序列
+        self.equilibration = Equilibration(keep_series=keep_series)  # 在线判断平衡 (见 observables.Equilibration)
+        self.discard_transient = False  # 判断为平衡时是否丢弃之前的暂态数据 (统计量从平衡开始重新计算)
+        self.recorder = None  # 录制到磁盘 (见 start_recording)
+        self.checkpointer = None  # 自动存档 (见 start_checkpointing)
+        self.annealer = None  # 正在执行的退火程序 (见 start_annealing)
+        self.set_cluster_move(cluster_move)
+        self.set_sweep_order(sweep_order)
+
+        self.J_bonds = random_couplings(self.n, distribution=self.distribution, rng=self.coupling_rng)  # 随机相互作用 J_{ij}, 竖直键和水平键各一个 float32 数组
+        self.replica_spins = random_spins((self.replicas, self.n, self.n), self.rng)
+        self.build_lattice()
+        self.set_update_rule(update_rule)
+        self.recompute()
+        self.reset()
+
+    # 由种子 (整数、SeedSequence 或 None 表示随机) 派生全部随机数流, 丢弃预先生成的随机数
+    # 第一个子流只用于 J, 因此相同的种子在任何副本数下 (界面、run、groundstate、anneal、batch) 都得到相同的 J
+    # 已经派生过子流的 SeedSequence 按未派生时处理, 得到的流只由种子决定
+    def set_seed(self, seed=None):
+        self.seed_sequence = fresh_sequence(seed_sequence(seed))
+        self.coupling_rng, self.rng, *self.replica_rngs = spawn_generators(self.seed_sequence, self.replicas + 2)
+        self.rng_state = jit_states(self.replica_rngs)  # 编译后端每个副本的随机数状态
+        self.step_sites = np.zeros((2, self.replicas, self.step_block), dtype=np.int64)
+        self.step_uniforms = np.zeros((self.replicas, self.step_block))
+        self.step_index = self.step_block
+
+    # 为单点模拟整块生成格点坐标和均匀随机数
+    def refill_steps(self):
+        for r, g in enumerate(self.replica_rngs):
+            self.step_sites[:, r] = g.integers(0, self.n, size=(2, self.step_block))
+            self.step_uniforms[r] = g.random(self.step_block)
+        self.step_index = 0
+
+    # 第 0 个副本
+    @property
+    def spins(self):
+        return self.replica_spins[0]
+
+    @spins.setter
+    def spins(self, spins):
+        self.replica_spins[0] = spins
+
+    # 格点数 N
+    @property
+    def sites(self):
+        return self.n**2
+
+    # 重新计算总能量和磁化强度 (其余时候由每次翻转增量更新)
+    @profiled('recompute')
+    def recompute(self):
+        self.replica_energy = total_energy(self.replica_spins, self.couplings, self.magnetic)
+        self.replica_magnetization = np.sum(self.replica_spins, axis=(1, 2)) / self.n**2
+
+    # 与格子大小和边界有关的辅助数组 (格子大小或边界改变时重建)
+    def build_lattice(self):
+        self.sublattices = sublattice_tables(self.n)  # 棋盘格子格
+        self.table = None  # 单点更新 (step 和 NumPy 后端的 typewriter / random 顺序) 用的近邻表, 第一次用到时生成
+        self.bond_mask = bond_mask(self.n, self.bound_option)  # 开放边界下跨越边界的键为 0
+        self.groups = column_groups(self.n)  # NumPy 后端 typewriter 顺序每行的列分组
+        self.site_order = jit_order(self.n, self.sweep_order)  # 编译后端的访问顺序
+        self.bonds = None  # 团簇更新用的键列表, 第一次团簇更新时生成 (大格子不用团簇更新时不占内存)
+        self.build_couplings()
+
+    def neighbors(self):
+        if self.table is None:
+            self.table = neighbor_table(self.n)
+        return self.table
+
+    # 内核和能量计算用的相互作用: J 乘以键掩码, 边界条件只在这里处理 (J 或边界改变时重建)
+    def build_couplings(self):
+        self.couplings = self.J_bonds * self.bond_mask
+
+    # 重建接受概率表 (温度、磁场、相互作用或更新规则改变时)
+    def build_acceptance(self):
+        self.acceptance = AcceptanceTable(self.temperature, self.magnetic, coupling_unit(self.J_bonds), self.update_rule)
+        self.bond_probability = None  # swendsen-wang / wolff 的成键概率, 同样在用到时生成
+
+    # 更新格子大小, 重新生成相互作用并清空记录
+    def set_grid_size(self, n):
+        self.stop_outputs_if_reshaped(n, self.replicas)
+        self.n = n
+        self.replica_spins = np.ones((self.replicas, self.n, self.n), dtype=np.int8)
+        self.J_bonds = random_couplings(self.n, distribution=self.distribution, rng=self.coupling_rng)
+        self.build_lattice()
+        self.step_index = self.step_block
+        self.build_acceptance()
+        self.recompute()
+        self.reset()
+
+    # 换成给定的相互作用 (同一组 J 的多个副本、读取的样本等)
+    def set_couplings(self, J):
+        self.J_bonds = J
+        self.build_couplings()
+        self.build_acceptance()
+        self.recompute()
+
+    def set_temperature(self, temperature):
+        self.temperature = temperature
+        self.build_acceptance()
+
+    def set_magnetic(self, magnetic):
+        # 磁场项 -B sum_i s_i 随之改变
+        self.replica_energy -= (magnetic - self.magnetic) * self.replica_magnetization * self.n**2
+        self.magnetic = magnetic
+        self.build_acceptance()
+
+    def set_bound_option(self, bound_flag):
+        self.bound_option = bound_flag
+        self.build_lattice()
+        self.recompute()
+
+    # 更新模拟后端, 不可用时退回 NumPy
+    def set_backend(self, backend):
+        self.backend = backend if backend in available_backends() else 'numpy'
+
+    # 更新单自旋翻转的接受规则
+    def set_update_rule(self, rule):
+        if rule not in UPDATE_RULES:
+            raise ValueError(f'unknown update rule: {rule}')
+        self.update_rule = rule
+        self.build_acceptance()
+
+    # 更新扫描顺序
+    def set_sweep_order(self, order):
+        if order not in SWEEP_ORDERS:
+            raise ValueError(f'unknown sweep order: {order}')
+        self.sweep_order = order
+        self.site_order = jit_order(self.n, order)
+
+    # 更新团簇更新方式 ('none' 表示只用 Metropolis)
+    # houdayer 需要至少两个副本; 副本数为奇数时最后一个副本不参与 houdayer 更新 (只做单点更新)
+    def set_cluster_move(self, cluster_move):
+        if cluster_move not in CLUSTER_MOVES:
+            raise ValueError(f'unknown cluster move: {cluster_move}')
+        if cluster_move == 'houdayer' and self.replicas < 2:
+            raise ValueError(f'houdayer moves need at least 2 replicas, got {self.replicas}')
+        self.cluster_move = cluster_move
+
+    # 所有自旋同向, 每次调用切换方向
+    def align(self):
+        self.is_black = not self.is_black
+        self.replica_spins[:] = 1 if self.is_black else -1
+        self.recompute()
+
+    # 随机设置每个自旋 (各副本独立)
+    def randomize(self):
+        self.replica_spins = random_spins((self.replicas, self.n, self.n), self.rng)
+        self.recompute()
+
+    # 记录当前能量、磁化强度和重叠 (见 MeasuredModel.record), 同时写入录制
+    def record(self):
+        super().record()
+        if self.recorder is not None:
+            self.recorder.add(self)
+
+    # 等待后台写入的录制分段和存档数 (写入跟不上时增长)
+    def queue_depth(self):
+        depth = 0
+        if self.recorder is not None and self.recorder.queue is not None:
+            depth += self.recorder.queue.qsize()
+        if self.checkpointer is not None:
+            depth += self.checkpointer.queue.qsize()
+        return depth
+
+    # 开始把每次记录的观测量和定期的自旋快照分段写入目录 path
+    def start_recording(self, path, **options):
+        self.stop_recording()
+        self.recorder = Recorder(path, self, **options)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+
+    # 取下录制和自动存档 (写完已提交的数据), 返回可以 pickle 的进度, 由 attach_outputs 在其他进程中继续
+    def detach_outputs(self):
+        outputs = {"recorder": None, "checkpointer": None}
+        if self.recorder is not None:
+            outputs["recorder"] = self.recorder.detach()
+        if self.checkpointer is not None:
+            outputs["checkpointer"] = self.checkpointer.detach()
+        self.recorder = None
+        self.checkpointer = None
+        return outputs
+
+    def attach_outputs(self, outputs):
+        progress = outputs["recorder"]
+        if progress is not None:
+            self.recorder = Recorder(progress["path"], self, progress["chunk"], progress["snapshot_interval"], progress["snapshot_chunk"], progress)
+        options = outputs["checkpointer"]
+        if options is not None:
+            self.checkpointer = Checkpointer(**options)
+
+    # 格子大小或副本数改变时停止录制 (分段中的快照和 meta.json 只对应一种形状) 和自动存档 (先写入改变前的最终状态)
+    def stop_outputs_if_reshaped(self, n, replicas):
+        if (n, replicas) != (self.n, self.replicas):
+            self.stop_recording()
+            self.stop_checkpointing()
+
+    # 开始自动存档: 每 every_sweeps 次扫描或每 every_seconds 秒写入 path, 用 load_state 读取存档即可继续
+    def start_checkpointing(self, path, every_sweeps=1000, every_seconds=60.0, extra=None):
+        self.stop_checkpointing(save=False)
+        self.checkpointer = Checkpointer(path, every_sweeps, every_seconds, extra, self.sweeps)
+
+    # 停止自动存档, save 为 True 时先写入最终状态
+    def stop_checkpointing(self, save=True):
+        if self.checkpointer is not None:
+            checkpointer, self.checkpointer = self.checkpointer, None
+            if save:
+                checkpointer.save(self)
+            checkpointer.close()
+
+    # 开始按 schedule (schedules.Schedule) 退火: 此后每次扫描前按程序设置温度和磁场, 程序结束时自动调用 stop_annealing
+    # 退火过程不写入状态 (state), 停止模拟进程或读取存档后不再继续
+    def start_annealing(self, schedule):
+        self.annealer = Annealer(schedule, self)
+
+    # 停止退火, restore_best 为 True 时第 0 个副本恢复为找到的最低能量构型; 返回退火结果 (没有在退火时返回 None)
+    def stop_annealing(self, restore_best=True):
+        if self.annealer is None:
+            return None
+        annealer, self.annealer = self.annealer, None
+        if restore_best and annealer.sweeps:
+            self.spins = annealer.best_spins
+            self.recompute()
+        return annealer.result()
+
+    # 第 0 个副本换成精确基态 (开放边界、无磁场, 见 groundstate.py), 返回基态能量
+    def load_ground_state(self):
+        if self.bound_option:
+            raise ValueError('the exact ground state needs open boundaries (the periodic lattice is not planar)')
+        if self.magnetic != 0:
+            raise ValueError('the exact ground state needs zero magnetic field')
+        from groundstate import ground_state  # 用到时才导入 (pymatching 是可选依赖)
+        energy, self.spins = ground_state(self.J_bonds)
+        self.recompute()
+        return energy
+
+    # 单点更新: 每个副本各自随机选择一个格点尝试翻转 (接受概率查表, 规则见 update_rule), 记录了数据时返回 True
+    @profiled('step')
+    def step(self):
+        r = np.arange(self.replicas)
+        if self.step_index == self.step_block:
+            self.refill_steps()
+        k = self.step_index
+        self.step_index += 1
+        flip, delta_E, s = site_update(self.replica_spins, self.couplings, self.acceptance, self.neighbors(), r, self.step_sites[0, :, k], self.step_sites[1, :, k],
+                                       self.step_uniforms[:, k])
+        accepted = int(np.count_nonzero(flip))
+        self.steps += accepted
+        self.accepted += accepted
+        self.attempted += self.replicas
+        # 增量更新能量和磁化强度
+        self.replica_energy += np.where(flip, delta_E, 0)
+        self.replica_magnetization -= np.where(flip, 2 * s, 0) / self.n**2
+        # 每个副本尝试 n^2 次折算为一次扫描
+        if self.attempted % (self.replicas * self.n**2 * self.record_interval) == 0:
+            self.record()
+            return True
+        return False
+
+    # NumPy 后端的一次扫描, 随机数由每个副本自己的流整体生成
+    def sweep_numpy(self):
+        if self.sweep_order == 'random':
+            count = self.n**2
+            sites = np.empty((2, self.replicas, count), dtype=np.int64)
+            uniforms = np.empty((self.replicas, count))
+            for r, g in enumerate(self.replica_rngs):
+                sites[:, r] = g.integers(0, self.n, size=(2, count))
+                g.random(out=uniforms[r])
+            return random_site_sweep(self.replica_spins, self.couplings, self.acceptance, self.neighbors(), sites, uniforms)
+        if self.uniforms.shape != self.replica_spins.shape:
+            self.uniforms = np.empty(self.replica_spins.shape)
+        for g, uniforms in zip(self.replica_rngs, self.uniforms):
+            g.random(out=uniforms)
+        if self.sweep_order == 'typewriter':
+            return typewriter_sweep(self.replica_spins, self.couplings, self.acceptance, self.neighbors(), self.groups, self.uniforms)
+        return checkerboard_sweep(self.replica_spins, self.couplings, self.acceptance, self.sublattices, self.uniforms)
+
+    # 整格扫描 (按 backend 和 sweep_order 选择实现), 记录了数据时返回 True
+    @profiled('sweep')
+    def sweep(self):
+        # 退火程序结束时本次不再扫描
+        if self.annealer is not None and not self.annealer.before_sweep(self):
+            self.stop_annealing()
+            return False
+        if self.backend == 'numba':
+            accepted, delta_E, delta_S = kernels.sweep_jit(self.replica_spins, self.couplings, self.temperature, self.magnetic, self.rng_state, self.update_rule,
+                                                           self.sweep_order, self.site_order)
+        else:
+            accepted, delta_E, delta_S = self.sweep_numpy()
+        # 增量更新能量和磁化强度
+        self.steps += accepted
+        self.accepted += accepted
+        self.attempted += self.replicas * self.n**2
+        self.sweeps += 1
+        self.replica_energy += delta_E
+        self.replica_magnetization += delta_S / self.n**2
+        if self.cluster_move != 'none':
+            self.steps += self.cluster_update()
+        # 定期完整计算一次, 消除浮点累积误差
+        if self.check_interval and self.sweeps % self.check_interval == 0:
+            self.recompute()
+        # 记录的间隔按扫描计, 与接受率 (温度) 无关
+        recorded = self.sweeps % self.record_interval == 0
+        if recorded:
+            self.record()
+        if self.annealer is not None:
+            self.annealer.after_sweep(self)
+        # 自动存档放在本次扫描的全部更新之后, 从存档继续与不中断时逐位相同
+        if self.checkpointer is not None:
+            self.checkpointer.update(self)
+        return recorded
+
+    # 一次团簇更新, 返回翻转的自旋数; 翻转后重新计算能量和磁化强度
+    # houdayer 作用于副本对 (0, 1), (2, 3), ..., 用每对第一个副本的随机数流; 其余作用于每个副本
+    @profiled('cluster')
+    def cluster_update(self):
+        jit = self.backend == 'numba'
+        flipped = 0
+        if self.bonds is None:
+            self.bonds = lattice_bonds(self.n, self.bound_option)
+        if self.cluster_move == 'houdayer':
+            for r in range(0, self.replicas - 1, 2):
+                flipped += houdayer(self.replica_spins[r], self.replica_spins[r + 1], self.bonds, self.replica_rngs[r], jit)
+        else:
+            if self.bond_probability is None:
+                self.bond_probability = bond_probability(self.J_bonds, self.temperature)
+            for spins, g in zip(self.replica_spins, self.replica_rngs):
+                flipped += swendsen_wang(spins, self.J_bonds, self.bonds, self.bond_probability, self.magnetic, self.temperature, g,
+                                         self.cluster_move == 'wolff', jit)
+        self.recompute()
+        return flipped
+
+    # 导出全部状态 (与界面保存的 .spinglass 文件格式相同), 自旋按位压缩
+    # 包括随机数状态, 从导出的状态继续模拟与不中断时逐位相同; 可变的数组都是副本, 可以交给其他线程写入
+    def state(self):
+        return {
+            "n": self.n,
+            "replicas": self.replicas,
+            "packed_spins": pack_spins(self.replica_spins),
+            "J_bonds": self.J_bonds,
+            "temperature": self.temperature,
+            "magnetic": self.magnetic,
+            "bound_option": self.bound_option,
+            "update_rule": self.update_rule,
+            "sweep_order": self.sweep_order,
+            "cluster_move": self.cluster_move,
+            "steps": self.steps,
+            "sweeps": self.sweeps,
+            "attempted": self.attempted,
+            "accepted": self.accepted,
+            "equilibration": self.equilibration.state(),
+            "discard_transient": self.discard_transient,
+            "energy": self.energy,
+            "replica_energy": self.replica_energy.copy(),
+            "replica_magnetization": self.replica_magnetization.copy(),
+            "energies": list(self.energies),
+            "magnetization": self.magnetization,
+            "magnetizations": list(self.magnetizations),
+            "overlaps": list(self.overlaps),
+            "statistics": self.observables.state(),
+            "is_black": self.is_black,
+            "rng_state": self.rng_state.copy(),
+            "generators": pack_generators([self.rng] + self.replica_rngs),
+            "coupling_generator": pack_generators([self.coupling_rng]),
+            "step_sites": self.step_sites.copy(),
+            "step_uniforms": self.step_uniforms.copy(),
+            "step_index": self.step_index
+        }
+
+    # 恢复状态 (旧文件只有一个副本的 float64 自旋和 (n, n, 4) 的相互作用, 其余副本随机生成)
+    def load_state(self, data):
+        self.stop_outputs_if_reshaped(data["n"], data.get("replicas", self.replicas))
+        self.n = data["n"]
+        if "packed_spins" in data:
+            self.replicas = data["replicas"]
+            self.replica_spins = unpack_spins(data["packed_spins"], (self.replicas, self.n, self.n))
+        else:
+            self.replica_spins = random_spins((self.replicas, self.n, self.n), self.rng)
+            self.replica_spins[0] = data["spins"]
+        # 复制到内存: read_state 返回的 np.memmap 会一直占用文件, Windows 上之后不能用 write_state 覆盖同一个文件
+        self.J_bonds = np.array(data["J_bonds"], dtype=np.float32) if "J_bonds" in data else couplings_from_legacy(data["J_interaction"])
+        self.temperature = data["temperature"]
+        self.magnetic = data["magnetic"]
+        self.bound_option = data["bound_option"]
+        self.update_rule = data.get("update_rule", "metropolis")
+        self.sweep_order = data.get("sweep_order", "auto")
+        self.build_lattice()
+        self.set_cluster_move(data.get("cluster_move", "none"))
+        self.build_acceptance()
+        self.reset()
+        self.steps = data["steps"]
+        if "statistics" in data:
+            self.observables.load_state(data["statistics"])
+            if self.observables.keep_series:
+                self.observables.series.update(energy=list(data["energies"]), magnetization=list(data["magnetizations"]),
+                                               overlap=list(data["overlaps"]))
+        else:
+            # 旧文件只有时间序列, 逐个加入统计
+            overlaps = data.get("overlaps", [])
+            if len(overlaps) != len(data["energies"]):
+                overlaps = [0.0] * len(data["energies"])
+            for energy, magnetization, overlap in zip(data["energies"], data["magnetizations"], overlaps):
+                self.observables.add(energy, magnetization, overlap)
+        self.sweeps = data.get("sweeps", 0)
+        self.attempted = data.get("attempted", 0)
+        self.accepted = data.get("accepted", 0)
+        self.discard_transient = data.get("discard_transient", False)
+        if "equilibration" in data:
+            self.equilibration.load_state(data["equilibration"])
+        self.is_black = data.get("is_black", self.is_black)
+        if "generators" in data:
+            self.rng, *self.replica_rngs = unpack_generators(data["generators"])
+            self.rng_state = np.array(data["rng_state"], dtype=np.uint64)
+            self.step_sites = np.array(data["step_sites"])
+            self.step_uniforms = np.array(data["step_uniforms"])
+            self.step_index = data["step_index"]
+        else:
+            # 旧文件没有随机数状态, 从当前种子重新派生 (与第一次派生的流相同)
+            self.set_seed(self.seed_sequence)
+        if "coupling_generator" in data:
+            self.coupling_rng, = unpack_generators(data["coupling_generator"])
+        if "replica_energy" in data:
+            self.replica_energy = np.array(data["replica_energy"], dtype=np.float64)
+            self.replica_magnetization = np.array(data["replica_magnetization"], dtype=np.float64)
+        else:
+            # 旧文件的能量按旧公式保存, 统一重新计算
+            self.recompute()
@@ -0,0 +1,356 @@
+import numpy as np
+
+
+# 流式统计: Welford 算法计算均值和方差, 对数分箱 (每层把相邻两个数据平均成一个) 估计自相关修正后的误差
+# 第 k 层保存长度为 2^k 的块平均值的统计量, 每个数据平均只更新 O(1) 层, 内存只与层数有关
+class BinningAnalysis:
+    levels = 40  # 最多 2^40 个数据
+    min_bins = 64  # 估计误差时一层至少需要的块数
+
+    def __init__(self):
+        self.counts = np.zeros(self.levels, dtype=np.int64)  # 每层的块数
+        self.means = np.zeros(self.levels)  # 每层块平均值的均值
+        self.m2 = np.zeros(self.levels)  # 每层块平均值的离差平方和
+        self.pending = np.zeros(self.levels)  # 每层等待配对的块平均值
+        self.has_pending = np.zeros(self.levels, dtype=bool)
+
+    # 加入一个数据
+    def add(self, value):
+        value = float(value)
+        for k in range(self.levels):
+            self.counts[k] += 1
+            delta = value - self.means[k]
+            self.means[k] += delta / self.counts[k]
+            self.m2[k] += delta * (value - self.means[k])
+            if not self.has_pending[k]:
+                self.pending[k] = value
+                self.has_pending[k] = True
+                return
+            value = (self.pending[k] + value) / 2
+            self.has_pending[k] = False
+
+    @property
+    def count(self):
+        return int(self.counts[0])
+
+    @property
+    def mean(self):
+        return float(self.means[0])
+
+    # 方差 (总体方差, 与 np.var 相同)
+    @property
+    def variance(self):
+        return float(self.m2[0] / self.counts[0]) if self.counts[0] else 0.0
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+    # 第 k 层的均值误差 sqrt(var_k / (M_k - 1))
+    def level_error(self, k):
+        if self.counts[k] < 2:
+            return 0.0
+        return float(np.sqrt(self.m2[k] / self.counts[k] / (self.counts[k] - 1)))
+
+    # 自相关修正后的均值误差: 块数不少于 min_bins 的最高一层
+    def error(self):
+        usable = np.nonzero(self.counts >= self.min_bins)[0]
+        return self.level_error(usable[-1] if usable.size else 0)
+
+    # 积分自相关时间 tau = (err^2 / err_0^2 - 1) / 2 (以记录间隔为单位)
+    def autocorrelation_time(self):
+        naive = self.level_error(0)
+        return 0.5 * ((self.error() / naive)**2 - 1) if naive > 0 else 0.0
+
+    # 导出 (副本, 可以交给其他线程写入) / 恢复累加器
+    def state(self):
+        return {"counts": self.counts.copy(), "means": self.means.copy(), "m2": self.m2.copy(),
+                "pending": self.pending.copy(), "has_pending": self.has_pending.copy()}
+
+    def load_state(self, data):
+        for key, value in data.items():
+            getattr(self, key)[:len(value)] = value
+
+
+# 在线估计积分自相关时间: 保存最近 max_lag 个数据, 每加入一个数据累加所有延迟 t < max_lag 的乘积和 sum x_i x_{i+t},
+# tau = sum_{t=1}^{W} rho(t) (与 BinningAnalysis 相同, 不相关时为 0), 窗口 W 取满足 W >= c (tau + 1/2) 的最小值 (Sokal)
+# 多个观测量一起向量化更新, 每个数据 O(max_lag); 自相关时间超过 max_lag / c 时结果偏小, 由分箱估计补充
+class Autocorrelation:
+    def __init__(self, width, max_lag=1024, window=6.0):
+        self.max_lag = max_lag
+        self.window = window
+        self.buffer = np.zeros((width, 2 * max_lag))  # 环形缓冲区存两份, 最近的 max_lag 个数据总是一段连续的切片
+        self.products = np.zeros((width, max_lag))  # 每个延迟的乘积和
+        self.scratch = np.empty((width, max_lag))
+        self.total = np.zeros(width)
+        self.offset = np.zeros(width)  # 减去第一个数据, 避免均值远大于涨落时的舍入误差
+        self.count = 0
+
+    def add(self, values):
+        if self.count == 0:
+            self.offset[:] = values
+        x = np.subtract(values, self.offset)
+        # 从后往前写入, buffer[p + t] 为 t 步之前的数据 (t = 0..L-1)
+        p = self.max_lag - 1 - self.count % self.max_lag
+        self.buffer[:, p] = x
+        self.buffer[:, p + self.max_lag] = x
+        np.multiply(x[:, None], self.buffer[:, p:p + self.max_lag], out=self.scratch)
+        self.products += self.scratch
+        self.total += x
+        self.count += 1
+
+    # 各观测量的积分自相关时间 (以数据间隔为单位)
+    def times(self):
+        lags = min(self.max_lag, self.count)
+        if lags < 2:
+            return np.zeros(len(self.total))
+        t = np.arange(lags)
+        mean = self.total / self.count
+        covariance = self.products[:, :lags] / (self.count - t) - mean[:, None]**2
+        result = np.zeros(len(self.total))
+        for k, row in enumerate(covariance):
+            if row[0] > 0:
+                tau = np.cumsum(row[1:] / row[0])
+                window = np.nonzero(t[1:] >= self.window * (tau + 0.5))[0]
+                result[k] = max(tau[window[0]] if window.size else tau[-1], 0.0)
+        return result
+
+    def state(self):
+        return {"buffer": self.buffer.copy(), "products": self.products.copy(), "total": self.total.copy(), "offset": self.offset.copy(),
+                "count": self.count}
+
+    def load_state(self, data):
+        for key in ("buffer", "products", "total", "offset"):
+            getattr(self, key)[...] = data[key]
+        self.count = int(data["count"])
+
+
+# 模拟过程中的观测量: 能量 E (总能量), 磁化强度 m, |m| 和副本重叠 q
+# 比热 C = var(E) / (N T^2), 磁化率 chi = N var(|m|) / T
+# E、|m| 和 q 的积分自相关时间取在线估计和分箱估计中较大的一个
+class ObservableStatistics:
+    names = ("energy", "magnetization", "abs_magnetization", "overlap")
+    correlated = ("energy", "abs_magnetization", "overlap")
+
+    def __init__(self, keep_series=False):
+        self.keep_series = keep_series  # 是否保留完整的时间序列
+        self.reset()
+
+    def reset(self):
+        self.accumulators = {name: BinningAnalysis() for name in self.names}
+        self.autocorrelation = Autocorrelation(len(self.correlated))
+        self.series = {"energy": [], "magnetization": [], "overlap": []}
+
+    def add(self, energy, magnetization, overlap):
+        values = (energy, magnetization, abs(magnetization), overlap)
+        for name, value in zip(self.names, values):
+            self.accumulators[name].add(value)
+        self.autocorrelation.add((energy, abs(magnetization), overlap))
+        if self.keep_series:
+            self.series["energy"].append(energy)
+            self.series["magnetization"].append(magnetization)
+            self.series["overlap"].append(overlap)
+
+    def __getitem__(self, name):
+        return self.accumulators[name]
+
+    @property
+    def count(self):
+        return self.accumulators["energy"].count
+
+    def specific_heat(self, temperature, sites):
+        return self.accumulators["energy"].variance / (sites * temperature**2)
+
+    def susceptibility(self, temperature, sites):
+        return sites * self.accumulators["abs_magnetization"].variance / temperature
+
+    # E、|m| 和 q 的积分自相关时间 (以记录间隔为单位)
+    def autocorrelation_times(self):
+        online = self.autocorrelation.times()
+        return {name: max(tau, self.accumulators[name].autocorrelation_time()) for name, tau in zip(self.correlated, online)}
+
+    # 按自相关时间修正的均值误差 sqrt(var (1 + 2 tau) / N)
+    def corrected_errors(self):
+        return {name: np.sqrt(self.accumulators[name].variance * (1 + 2 * tau) / self.count) if self.count else 0.0
+                for name, tau in self.autocorrelation_times().items()}
+
+    # 独立样本数 N / (1 + 2 tau), 取 E、|m| 和 q 中最少的
+    def independent_samples(self):
+        if self.count == 0:
+            return 0.0
+        return min(self.count / (1 + 2 * tau) for tau in self.autocorrelation_times().values())
+
+    def state(self):
+        data = {name: accumulator.state() for name, accumulator in self.accumulators.items()}
+        data["autocorrelation"] = self.autocorrelation.state()
+        return data
+
+    def load_state(self, data):
+        self.reset()
+        for name, accumulator in self.accumulators.items():
+            if name in data:
+                accumulator.load_state(data[name])
+        if "autocorrelation" in data:
+            self.autocorrelation.load_state(data["autocorrelation"])
+
+
+# 在线判断平衡: 把记录分成长度加倍的窗口 (first, first, 2 first, 4 first, ...), 每个窗口结束时比较它与前一个窗口的
+# E、|m| 和 q 的均值, 差别都不超过 z 倍合并误差时认为前一个窗口开始时已经平衡; 误差由当前窗口 (自相关修正后) 按长度折算,
+# 前一个窗口中的漂移会增大它自己的方差, 不能用来估计误差; 当前窗口的独立样本数少于 min_samples 时比较没有意义, 等待下一个窗口
+# 每个窗口开始时另起一组统计量, 平衡后 production 为从前一个窗口开始 (去掉暂态) 的统计量
+class Equilibration:
+    names = ObservableStatistics.correlated
+
+    def __init__(self, first=32, z=2.0, min_samples=20, keep_series=False):
+        self.first = first
+        self.z = z
+        self.min_samples = min_samples
+        self.keep_series = keep_series
+        self.reset()
+
+    def reset(self):
+        self.records = 0  # 已加入的记录数
+        self.window_start = 0  # 当前窗口开始和结束时的记录数
+        self.window_end = self.first
+        self.previous = None  # 前一个窗口各观测量的均值
+        self.previous_length = 0
+        self.candidates = []  # (开始时的扫描数, 统计量): 前一个窗口和当前窗口开始的
+        self.sweep = None  # 平衡开始时的扫描数, 未平衡时为 None
+        self.production = None
+
+    @property
+    def equilibrated(self):
+        return self.sweep is not None
+
+    # 加入一个记录 (sweep 为记录时的扫描数); 刚判断为平衡时返回 True, 之后不再处理
+    def add(self, sweep, energy, magnetization, overlap):
+        if self.sweep is not None:
+            return False
+        if self.records == self.window_start:
+            self.candidates.append((sweep, ObservableStatistics(self.keep_series)))
+        for _, statistics in self.candidates:
+            statistics.add(energy, magnetization, overlap)
+        self.records += 1
+        if self.records < self.window_end:
+            return False
+        current = self.candidates[-1][1]
+        means = np.array([current[name].mean for name in self.names])
+        errors = np.array(list(current.corrected_errors().values()))
+        length = self.records - self.window_start
+        if self.previous is not None and current.independent_samples() >= self.min_samples and np.all(np.abs(means - self.previous) <= self.z * errors * np.sqrt(1 + length / self.previous_length)):
+            self.sweep, self.production = self.candidates[0]
+            self.candidates = []
+            return True
+        self.previous = means
+        self.previous_length = length
+        self.candidates = self.candidates[-1:]
+        self.window_start = self.records
+        self.window_end = 2 * self.records
+        return False
+
+    def state(self):
+        return {"records": self.records, "window_start": self.window_start, "window_end": self.window_end, "previous_length": self.previous_length,
+                "sweep": -1 if self.sweep is None else self.sweep, "previous": np.zeros(0) if self.previous is None else self.previous.copy(),
+                "starts": [start for start, _ in self.candidates], "candidates": {str(k): statistics.state() for k, (_, statistics) in enumerate(self.candidates)}}
+
+    def load_state(self, data):
+        self.reset()
+        self.records = int(data["records"])
+        self.window_start = int(data["window_start"])
+        self.window_end = int(data["window_end"])
+        self.previous_length = int(data["previous_length"])
+        self.sweep = None if int(data["sweep"]) < 0 else int(data["sweep"])
+        self.previous = np.array(data["previous"], dtype=np.float64) if len(data["previous"]) else None
+        # 空的列表和字典不写入存档文件
+        for k, start in enumerate(data.get("starts", [])):
+            statistics = ObservableStatistics(self.keep_series)
+            statistics.load_state(data["candidates"][str(k)])
+            self.candidates.append((int(start), statistics))
+
+
+# SpinGlassModel 和 GraphModel 共用的测量部分: 第 0 个副本的能量和磁化强度、重叠 q、按格点数折算的记录间隔、
+# 流式统计和平衡判断, 以及界面和命令行显示的 statistics()
+# 使用的类需要提供 sites (格点数)、replicas、replica_spins、replica_energy、replica_magnetization、temperature、
+# observables (ObservableStatistics)、equilibration (Equilibration)、discard_transient 和 sweep()
+class MeasuredModel:
+    record_sites = 4096  # 两次记录之间每个副本至少尝试更新的格点数: 大格子每次扫描记录一次, 小格子每隔几次扫描记录一次
+
+    @property
+    def energy(self):
+        return float(self.replica_energy[0])
+
+    @property
+    def magnetization(self):
+        return float(self.replica_magnetization[0])
+
+    # 完整时间序列 (只有 keep_series 时才记录)
+    @property
+    def energies(self):
+        return self.observables.series["energy"]
+
+    @property
+    def magnetizations(self):
+        return self.observables.series["magnetization"]
+
+    @property
+    def overlaps(self):
+        return self.observables.series["overlap"]
+
+    # 副本 a 和 b 之间的重叠 q = (1/N) sum_i s_i^a s_i^b, 只有一个副本时为 0
+    def overlap(self, a=0, b=1):
+        if self.replicas < 2:
+            return 0.0
+        return float(np.mean(self.replica_spins[a] * self.replica_spins[b], dtype=np.float64))
+
+    # 清空记录
+    def reset(self):
+        self.steps = 0  # 翻转的自旋数 (包括团簇更新)
+        self.sweeps = 0
+        self.attempted = 0  # 尝试和接受的单自旋翻转数
+        self.accepted = 0
+        self.observables.reset()
+        self.equilibration.reset()
+
+    # 记录当前能量、磁化强度和重叠; 判断为平衡且丢弃暂态时, 统计量换成平衡之后的部分
+    def record(self):
+        overlap = self.overlap()
+        self.observables.add(self.energy, self.magnetization, overlap)
+        if self.equilibration.add(self.sweeps, self.energy, self.magnetization, overlap) and self.discard_transient:
+            self.observables = self.equilibration.production
+
+    # 每隔多少次扫描记录一次能量、磁化强度和重叠 (单点更新按尝试次数折算为扫描), 与接受率无关
+    @property
+    def record_interval(self):
+        return max(1, -(-self.record_sites // self.sites))
+
+    # 单自旋翻转的接受率
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.attempted if self.attempted else 0.0
+
+    # 平衡开始时的扫描数, 还没有判断为平衡时为 None
+    @property
+    def equilibrated_sweep(self):
+        return self.equilibration.sweep
+
+    # 平衡后 (丢弃暂态时) 按 E、|m| 和 q 中最长的自相关时间计算的独立样本数, 未平衡时为 0
+    def independent_samples(self):
+        return self.observables.independent_samples() if self.equilibration.equilibrated else 0.0
+
+    # 连续运行若干次扫描
+    def run(self, sweeps):
+        for _ in range(sweeps):
+            self.sweep()
+
+    # 界面显示的数据: (步数, 能量, 平均能量, 平均能量误差, 能量标准差, 磁化强度, 平均磁化强度, 平均磁化强度误差, 磁化强度标准差,
+    #                  重叠 q, 比热, 磁化率, 接受率, E、|m| 和 q 的积分自相关时间 (扫描), 独立样本数, 平衡开始的扫描数 (未平衡时为 -1)),
+    # 强度量按格点数归一; 由流式统计得到, 耗时与记录长度无关
+    def statistics(self):
+        energy = self.observables["energy"]
+        magnetization = self.observables["magnetization"]
+        taus = [self.record_interval * tau for tau in self.observables.autocorrelation_times().values()]
+        return self.steps, self.energy, energy.mean, energy.error(), energy.std, \
+               self.magnetization, magnetization.mean, magnetization.error(), magnetization.std, self.overlap(), \
+               self.observables.specific_heat(self.temperature, self.sites), self.observables.susceptibility(self.temperature, self.sites), \
+               self.acceptance_rate, *taus, self.independent_samples(), \
+               -1 if self.equilibrated_sweep is None else self.equilibrated_sweep
@@ -0,0 +1,124 @@
+import collections
+import functools
+import json
+import math
+import os
+import threading
+import time
+import numpy as np
+
+
+# 耗时直方图的桶数: 第 b 个桶为 [2^(b-1), 2^b) 微秒, 最后一个桶包括更长的耗时
+BINS = 32
+
+
+# 一个热点的累计耗时: 次数、总耗时、最大耗时 (秒) 和按 2 的幂分桶的直方图
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = np.zeros(BINS, dtype=np.int64)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.histogram[min(max(math.frexp(duration * 1e6)[1], 0), BINS - 1)] += 1
+
+    # 分位数 (秒), 取所在桶的上界
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        b = int(np.searchsorted(np.cumsum(self.histogram), q * self.count))
+        return min(2.0**b * 1e-6, self.max)
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {'count': self.count, 'total': self.total, 'mean': mean, 'max': self.max, 'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95), 'histogram': self.histogram.tolist()}
+
+
+# 热点路径的计数器和计时: 关闭时 (默认) 被测的函数只多一次属性判断; 打开时记录耗时直方图,
+# 并把最近 trace_limit 个事件保存在环形缓冲区中, 可以导出为 Chrome trace (chrome://tracing 或 Perfetto 打开)
+# 每个进程一个 (PROFILER), 模拟进程的数据由 snapshot() 取回后与界面进程的一起导出
+class Profiler:
+    def __init__(self, enabled=False, trace_limit=200000):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.timings = collections.defaultdict(Timing)
+        self.events = collections.deque(maxlen=trace_limit)
+
+    def enable(self, flag=True):
+        self.enabled = flag
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.events.clear()
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    # 记录一次从 start 到 end (time.perf_counter()) 的耗时
+    def add(self, name, start, end=None):
+        end = time.perf_counter() if end is None else end
+        with self.lock:
+            self.timings[name].add(end - start)
+            self.events.append((name, start, end - start, threading.get_ident()))
+
+    # 计数和耗时的 (次数, 总耗时), 没有记录时为 0
+    def total(self, name):
+        timing = self.timings.get(name)
+        return (timing.count, timing.total) if timing is not None else (0, 0.0)
+
+    # 可以通过管道传给其他进程的全部数据
+    def snapshot(self):
+        with self.lock:
+            return {'pid': os.getpid(), 'counters': dict(self.counters), 'timings': {name: timing.summary() for name, timing in self.timings.items()},
+                    'events': list(self.events)}
+
+    # 把本进程和 others (其他进程的 snapshot()) 的事件写成 Chrome trace 的 JSON, 计数器和耗时统计放在 otherData 中
+    def export_trace(self, path, others=(), names=None):
+        processes = [self.snapshot(), *others]
+        events = []
+        for index, data in enumerate(processes):
+            name = names[index] if names is not None else f'process {data["pid"]}'
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': data['pid'], 'args': {'name': name}})
+            for event, start, duration, thread in data['events']:
+                events.append({'name': event, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': data['pid'], 'tid': thread})
+        other = {str(data['pid']): {'counters': data['counters'], 'timings': data['timings']} for data in processes}
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': other}, file)
+
+    # 各热点的耗时统计表 (毫秒)
+    def report(self):
+        lines = [f'{"section":<20} {"count":>10} {"total s":>10} {"mean ms":>10} {"p95 ms":>10} {"max ms":>10}']
+        for name, timing in sorted(self.timings.items(), key=lambda item: -item[1].total):
+            s = timing.summary()
+            lines.append(f'{name:<20} {s["count"]:>10} {s["total"]:>10.3f} {s["mean"] * 1e3:>10.4f} {s["p95"] * 1e3:>10.4f} {s["max"] * 1e3:>10.4f}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<20} {value:>10}')
+        return '\n'.join(lines)
+
+
+# 本进程的计时器; 设置环境变量 SPIN_GLASS_PROFILE=1 时一开始就打开
+PROFILER = Profiler(os.environ.get('SPIN_GLASS_PROFILE', '') not in ('', '0'))
+
+
+# 装饰器: 打开计时时记录函数每次调用的耗时
+def profiled(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.add(name, start)
+        return wrapper
+    return decorate
@@ -0,0 +1,195 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+from kernels import pack_spins, unpack_spins
+
+
+# 记录的观测量 (每次 model.record() 一行)
+FIELDS = ('sweep', 'steps', 'energy', 'magnetization', 'overlap')
+
+
+# 分段文件名: observables_000000.npz, snapshots_000000.npz, ...
+def segment_name(kind, index):
+    return f'{kind}_{index:06d}.npz'
+
+
+# 录制: 观测量和定期的自旋快照先写入固定大小的缓冲区, 缓冲区满后交给后台线程压缩写入一个 .npz 分段
+# 内存只与分段大小有关; 自旋按位压缩后再由 savez_compressed 压缩
+# 目录结构: meta.json + observables_*.npz + snapshots_*.npz
+# progress 为 detach() 返回的进度时接着已有的录制继续 (例如模拟转到另一个进程中运行)
+# 后台写入失败时保存异常, 在下一次 add() 或 close() 时抛出; 后台线程不会因此退出, 模拟不会因队列满而一直等待
+class Recorder:
+    def __init__(self, path, model, chunk=4096, snapshot_interval=100, snapshot_chunk=64, progress=None):
+        self.path = path
+        self.chunk = chunk  # 每个观测量分段的行数
+        self.snapshot_interval = snapshot_interval  # 每记录多少行保存一次快照, 0 表示不保存
+        self.snapshot_chunk = snapshot_chunk  # 每个快照分段的快照数
+        self.lock = threading.Lock()
+        self.error = None  # 后台写入的异常, 还没有抛出
+        self.buffer = {name: np.empty(chunk) for name in FIELDS}
+        if progress is None:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, 'meta.json'), 'w') as file:
+                json.dump({'version': 1, 'n': model.n, 'replicas': model.replicas, 'temperature': model.temperature,
+                           'magnetic': model.magnetic, 'bound_option': model.bound_option, 'fields': FIELDS,
+                           'chunk': chunk, 'snapshot_chunk': snapshot_chunk}, file)
+            self.rows = 0  # 已记录的总行数
+            self.filled = 0
+            self.segments = 0
+            self.snapshot_sweeps = []
+            self.snapshots = []
+            self.snapshot_segments = 0
+        else:
+            self.rows = progress['rows']
+            self.filled = len(progress['buffer']['sweep'])
+            for name in FIELDS:
+                self.buffer[name][:self.filled] = progress['buffer'][name]
+            self.segments = progress['segments']
+            self.snapshot_sweeps = progress['snapshot_sweeps']
+            self.snapshots = progress['snapshots']
+            self.snapshot_segments = progress['snapshot_segments']
+            self.error = progress.get('error')
+
+        # 队列有上限, 写入跟不上时模拟线程等待, 内存不会无限增长
+        self.queue = queue.Queue(maxsize=4)
+        self.writer = threading.Thread(target=self.write_segments, daemon=True)
+        self.writer.start()
+
+    # 后台线程: 原子地写入分段 (先写临时文件再改名)
+    def write_segments(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                name, arrays = item
+                target = os.path.join(self.path, name)
+                with open(target + '.tmp', 'wb') as file:
+                    np.savez_compressed(file, **arrays)
+                os.replace(target + '.tmp', target)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    # 抛出后台写入的异常 (只抛出一次)
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    # 记录模型当前的观测量, 按 snapshot_interval 保存快照
+    def add(self, model):
+        with self.lock:
+            if self.queue is None:
+                return
+            self.check()
+            values = (model.sweeps, model.steps, model.energy, model.magnetization, model.overlap())
+            for name, value in zip(FIELDS, values):
+                self.buffer[name][self.filled] = value
+            self.filled += 1
+            if self.snapshot_interval and self.rows % self.snapshot_interval == 0:
+                self.snapshot_sweeps.append(model.sweeps)
+                self.snapshots.append(pack_spins(model.replica_spins))
+            self.rows += 1
+            if self.filled == self.chunk:
+                self.flush_observables()
+            if len(self.snapshots) == self.snapshot_chunk:
+                self.flush_snapshots()
+
+    def flush_observables(self):
+        if self.filled:
+            arrays = {name: self.buffer[name][:self.filled].copy() for name in FIELDS}
+            self.queue.put((segment_name('observables', self.segments), arrays))
+            self.segments += 1
+            self.filled = 0
+
+    def flush_snapshots(self):
+        if self.snapshots:
+            arrays = {'sweep': np.array(self.snapshot_sweeps), 'packed_spins': np.stack(self.snapshots)}
+            self.queue.put((segment_name('snapshots', self.snapshot_segments), arrays))
+            self.snapshot_segments += 1
+            self.snapshot_sweeps = []
+            self.snapshots = []
+
+    # 停止录制但不写出未满的分段, 返回可以交给 Recorder(progress=...) 继续录制的进度 (包括还没有抛出的写入异常)
+    def detach(self):
+        with self.lock:
+            if self.queue is None:
+                return None
+            self.queue.put(None)
+            self.writer.join()
+            self.queue = None
+            return {'path': self.path, 'chunk': self.chunk, 'snapshot_interval': self.snapshot_interval, 'snapshot_chunk': self.snapshot_chunk,
+                    'rows': self.rows, 'buffer': {name: self.buffer[name][:self.filled].copy() for name in FIELDS},
+                    'segments': self.segments, 'snapshot_sweeps': self.snapshot_sweeps, 'snapshots': self.snapshots,
+                    'snapshot_segments': self.snapshot_segments, 'error': self.error}
+
+    # 写出剩余数据并等待后台线程结束, 抛出还没有抛出的写入异常
+    def close(self):
+        with self.lock:
+            if self.queue is None:
+                return
+            self.flush_observables()
+            self.flush_snapshots()
+            self.queue.put(None)
+            self.writer.join()
+            self.queue = None
+            self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 读取录制结果: 只加载与请求的切片重叠的分段
+class Recording:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            self.meta = json.load(file)
+        self.shape = (self.meta['replicas'], self.meta['n'], self.meta['n'])
+        self.observable_files = self.segment_files('observables')
+        self.snapshot_files = self.segment_files('snapshots')
+        # 除最后一个分段外, 每个分段都是满的
+        self.rows = self.segment_rows(self.observable_files, 'sweep', self.meta['chunk'])
+        self.snapshot_count = self.segment_rows(self.snapshot_files, 'sweep', self.meta['snapshot_chunk'])
+
+    def segment_files(self, kind):
+        files = []
+        while os.path.exists(os.path.join(self.path, segment_name(kind, len(files)))):
+            files.append(os.path.join(self.path, segment_name(kind, len(files))))
+        return files
+
+    def segment_rows(self, files, key, chunk):
+        if not files:
+            return 0
+        with np.load(files[-1]) as data:
+            return chunk * (len(files) - 1) + len(data[key])
+
+    def __len__(self):
+        return self.rows
+
+    # 观测量 name 的第 start 到 stop 行
+    def observable(self, name, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(self.rows)
+        chunk = self.meta['chunk']
+        parts = []
+        for index in range(start // chunk, -(-stop // chunk) if stop > start else 0):
+            with np.load(self.observable_files[index]) as data:
+                values = data[name]
+            offset = index * chunk
+            parts.append(values[max(start - offset, 0):stop - offset])
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    # 第 k 个快照: (扫描次数, 自旋 (R, n, n))
+    def snapshot(self, k):
+        if k < 0:
+            k += self.snapshot_count
+        index, offset = divmod(k, self.meta['snapshot_chunk'])
+        with np.load(self.snapshot_files[index]) as data:
+            return int(data['sweep'][offset]), unpack_spins(data['packed_spins'][offset], self.shape)
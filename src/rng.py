@@ -0,0 +1,50 @@
+import numpy as np
+
+
+# 随机数: 所有随机数都来自显式的 np.random.Generator (PCG64), 不使用全局的 np.random 状态
+# 一个种子 (或 SeedSequence) 通过 spawn 派生出互相独立的流: J (第一个子流)、模型自身 (初始自旋)、每个副本、每个工作进程各用一个
+
+
+def seed_sequence(seed=None):
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+# 与 sequence 相同但还没有派生过子流的 SeedSequence: 再次派生时得到与第一次相同的流, 与之前派生过几次无关
+def fresh_sequence(sequence):
+    return np.random.SeedSequence(sequence.entropy, spawn_key=sequence.spawn_key, pool_size=sequence.pool_size)
+
+
+def generator(sequence):
+    return np.random.Generator(np.random.PCG64(sequence))
+
+
+# 派生 count 个独立的随机数发生器
+def spawn_generators(sequence, count):
+    return [generator(child) for child in sequence.spawn(count)]
+
+
+# 编译后端的 xorshift64* 状态 (每个副本一个, 不能为 0), 由各副本的发生器生成
+def jit_states(generators):
+    return np.array([g.integers(1, 2**63) for g in generators], dtype=np.uint64)
+
+
+# PCG64 的状态 (128 位 state 和 inc、缓存的 32 位数) 编码为 6 个 uint64, 便于写入存档
+def pack_generators(generators):
+    rows = []
+    for g in generators:
+        state = g.bit_generator.state
+        rows.append([state['state']['state'] >> 64, state['state']['state'] & (2**64 - 1),
+                     state['state']['inc'] >> 64, state['state']['inc'] & (2**64 - 1),
+                     state['has_uint32'], state['uinteger']])
+    return np.array(rows, dtype=np.uint64).reshape(len(rows), 6)
+
+
+def unpack_generators(packed):
+    generators = []
+    for row in np.asarray(packed, dtype=np.uint64):
+        high, low, inc_high, inc_low, has_uint32, uinteger = (int(value) for value in row)
+        bit_generator = np.random.PCG64()
+        bit_generator.state = {'bit_generator': 'PCG64', 'state': {'state': (high << 64) | low, 'inc': (inc_high << 64) | inc_low},
+                               'has_uint32': has_uint32, 'uinteger': uinteger}
+        generators.append(np.random.Generator(bit_generator))
+    return generators
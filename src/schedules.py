@@ -0,0 +1,119 @@
+import csv
+import time
+import numpy as np
+
+
+# 可选的退火程序
+SCHEDULES = ('linear', 'geometric', 'adaptive', 'custom')
+
+
+# 读取自定义程序: CSV 的列为 sweep, temperature, magnetic (磁场可省略), 按扫描次数分段线性插值
+def read_program(path):
+    with open(path, newline='') as file:
+        rows = [(float(row['sweep']), float(row['temperature']), float(row.get('magnetic') or 0.0)) for row in csv.DictReader(file)]
+    return np.array(sorted(rows))
+
+
+# 退火程序: 依次给出每次扫描的 (温度, 磁场)
+#   linear / geometric: sweeps 次扫描内温度从 t_start 线性 / 几何地降到 t_end
+#   adaptive: 每 stage 次扫描为一级, 按本级能量的标准差 sigma_E 降温 T <- T exp(-rate T / sigma_E)
+#             (能量涨落大, 即热容大的温度附近降得慢), 每级降幅在 [min_ratio, max_ratio] 之间, 降到 t_end 为止
+#   custom: program 为 (扫描次数, 温度, 磁场) 的表 (read_program), 分段线性插值
+# 除 custom 外磁场随退火进度从 h_start 线性变到 h_end (adaptive 的进度按温度的对数计算)
+class Schedule:
+    min_ratio = 0.5
+    max_ratio = 0.99
+
+    def __init__(self, kind='geometric', t_start=2.0, t_end=0.05, sweeps=1000, h_start=0.0, h_end=0.0, program=None, stage=50, rate=0.7):
+        if kind not in SCHEDULES:
+            raise ValueError(f'unknown schedule: {kind}')
+        if kind == 'custom' and program is None:
+            raise ValueError('a custom schedule needs a program')
+        self.kind = kind
+        self.t_start = t_start
+        self.t_end = t_end
+        self.sweeps = sweeps
+        self.h_start = h_start
+        self.h_end = h_end
+        self.program = None if program is None else np.asarray(program, dtype=np.float64)
+        self.stage = stage
+        self.rate = rate
+        if kind == 'custom':
+            self.t_start, self.h_start = self.program[0, 1:]
+            self.t_end, self.h_end = self.program[-1, 1:]
+            self.sweeps = int(self.program[-1, 0]) + 1  # 表的第一行和最后一行都包括在内
+
+    # 每次扫描的 (温度, 磁场); adaptive 在每一级结束时读取 model 的能量
+    def values(self, model):
+        if self.kind == 'adaptive':
+            yield from self.adaptive_values(model)
+            return
+        k = np.arange(self.sweeps)
+        if self.kind == 'custom':
+            temperatures = np.interp(k, self.program[:, 0], self.program[:, 1])
+            fields = np.interp(k, self.program[:, 0], self.program[:, 2])
+        else:
+            progress = k / max(self.sweeps - 1, 1)
+            if self.kind == 'linear':
+                temperatures = self.t_start + (self.t_end - self.t_start) * progress
+            else:
+                temperatures = self.t_start * (self.t_end / self.t_start)**progress
+            fields = self.h_start + (self.h_end - self.h_start) * progress
+        for temperature, magnetic in zip(temperatures, fields):
+            yield float(temperature), float(magnetic)
+
+    def adaptive_values(self, model):
+        temperature = self.t_start
+        span = np.log(self.t_start / self.t_end)
+        while True:
+            progress = np.log(self.t_start / temperature) / span if span else 1.0
+            magnetic = self.h_start + (self.h_end - self.h_start) * progress
+            energies = np.empty(self.stage)
+            for k in range(self.stage):
+                yield temperature, magnetic
+                energies[k] = model.energy
+            if temperature <= self.t_end:
+                return
+            sigma = energies.std()
+            ratio = np.exp(-self.rate * temperature / sigma) if sigma > 0 else 0.0
+            temperature = max(self.t_end, temperature * min(max(ratio, self.min_ratio), self.max_ratio))
+
+
+# 一次退火的过程 (SpinGlassModel.start_annealing 创建, 由 model.sweep 在每次扫描前后调用, 见 annealing.py):
+# 按程序设置温度和磁场, 跟踪第 0 个副本在最终磁场 h_end 下的最低能量和对应构型
+# trace 记录每次刷新最低能量时的 (扫描次数, 秒, 能量), 之后可以对任意目标能量计算到达时间
+class Annealer:
+    def __init__(self, schedule, model):
+        self.schedule = schedule
+        self.values = schedule.values(model)
+        self.sweeps = 0
+        self.start = time.perf_counter()
+        self.best_energy = np.inf
+        self.best_spins = model.spins.copy()
+        self.best_sweep = 0
+        self.trace = []
+
+    # 扫描前设置本次扫描的温度和磁场, 程序已经结束时返回 False
+    def before_sweep(self, model):
+        try:
+            temperature, magnetic = next(self.values)
+        except StopIteration:
+            return False
+        if temperature != model.temperature:
+            model.set_temperature(temperature)
+        if magnetic != model.magnetic:
+            model.set_magnetic(magnetic)
+        return True
+
+    def after_sweep(self, model):
+        self.sweeps += 1
+        energy = model.energy + (model.magnetic - self.schedule.h_end) * model.magnetization * model.n**2
+        if energy < self.best_energy:
+            self.best_energy = energy
+            self.best_spins = model.spins.copy()
+            self.best_sweep = self.sweeps
+            self.trace.append((self.sweeps, time.perf_counter() - self.start, energy))
+
+    def result(self):
+        return {'best_energy': self.best_energy, 'best_spins': self.best_spins, 'best_sweep': self.best_sweep,
+                'sweeps': self.sweeps, 'seconds': time.perf_counter() - self.start, 'trace': self.trace}
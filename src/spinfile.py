@@ -0,0 +1,106 @@
+import json
+import os
+import pickle
+import struct
+import numpy as np
+
+
+# .spinglass 文件格式 (版本 1):
+#   8 字节标识 b'SPINGLAS' | uint32 版本 | uint64 头部长度 | JSON 头部 | 按 64 字节对齐的原始数组数据
+# 头部保存标量和每个数组的 dtype、shape、偏移量; 嵌套的字典用 '/' 连接键名展开
+# 读取时数组用 np.memmap 映射 (写时复制), 打开大格子不需要复制数据; 不使用 pickle, 可以安全读取
+MAGIC = b'SPINGLAS'
+VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sIQ')
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# 把状态字典拆成标量 (写入头部) 和数组 (写入数据段)
+def flatten(data, prefix=''):
+    scalars, arrays = {}, {}
+    for key, value in data.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            inner_scalars, inner_arrays = flatten(value, name + '/')
+            scalars.update(inner_scalars)
+            arrays.update(inner_arrays)
+        elif isinstance(value, (np.ndarray, list, tuple)):
+            arrays[name] = np.ascontiguousarray(value)
+        elif isinstance(value, np.generic):
+            scalars[name] = value.item()
+        else:
+            scalars[name] = value
+    return scalars, arrays
+
+
+def unflatten(items):
+    data = {}
+    for name, value in items.items():
+        *parents, key = name.split('/')
+        node = data
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return data
+
+
+# 写入状态: 先写头部, 再依次写入每个数组 (不拼接成一个大缓冲区); 先写临时文件再改名, 中途失败不会损坏原文件
+def write_state(path, data):
+    scalars, arrays = flatten(data)
+    sections = {}
+    offset = 0  # 相对于数据段开头的偏移量
+    for name, array in arrays.items():
+        sections[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = align(offset + array.nbytes)
+    header = json.dumps({'version': VERSION, 'scalars': scalars, 'arrays': sections}).encode()
+    start = align(PREAMBLE.size + len(header))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(start + sections[name]['offset'])
+            file.write(memoryview(array.reshape(-1)).cast('B'))
+        file.truncate(start + offset)
+    os.replace(temporary, path)
+
+
+# 是否为旧版 (pickle) 文件
+def is_legacy(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) != MAGIC
+
+
+# 读取状态; 旧版 pickle 文件只有在 allow_pickle 时才读取 (pickle 可以执行任意代码, 只能打开可信的文件)
+def read_state(path, mmap=True, allow_pickle=False):
+    if is_legacy(path):
+        if not allow_pickle:
+            raise ValueError(f'{path} is a legacy pickle file; convert it with "cli.py convert" or pass allow_pickle=True')
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+    with open(path, 'rb') as file:
+        magic, version, length = PREAMBLE.unpack(file.read(PREAMBLE.size))
+        if version > VERSION:
+            raise ValueError(f'{path} uses format version {version}, newer than supported version {VERSION}')
+        header = json.loads(file.read(length))
+        start = align(PREAMBLE.size + length)
+        items = dict(header['scalars'])
+        for name, section in header['arrays'].items():
+            dtype, shape = np.dtype(section['dtype']), tuple(section['shape'])
+            if not mmap or 0 in shape:
+                file.seek(start + section['offset'])
+                items[name] = np.fromfile(file, dtype, int(np.prod(shape))).reshape(shape)
+            else:
+                items[name] = np.memmap(path, dtype, 'c', start + section['offset'], shape)
+    return unflatten(items)
+
+
+# 把旧版 pickle 文件转换为新格式
+def convert_legacy(source, target):
+    write_state(target, read_state(source, allow_pickle=True))
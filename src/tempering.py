@@ -0,0 +1,156 @@
+import os
+import multiprocessing
+import numpy as np
+from kernels import random_couplings
+from model import SpinGlassModel
+from rng import seed_sequence, generator
+
+
+# 几何间隔的温度序列 (从低到高), 副本交换常用的取法
+def geometric_temperatures(tmin, tmax, count):
+    if count == 1:
+        return [float(tmin)]
+    return list(np.geomspace(tmin, tmax, count))
+
+
+# 按格点数 sites 取几何温度序列: 相邻温度的交换接受率由 Δβ σ_E 决定, 能量涨落 σ_E 随 sqrt(sites) 增长,
+# 因此相邻温度之比取 exp(spacing / sqrt(sites)), 副本数随 sqrt(sites) 增长 (spacing = 2.5 时相邻接受率约 0.3 以上, 与格子大小无关)
+# 副本数超过 limit 时保持间隔、降低最高温度, 交换仍然能被接受
+def ladder_temperatures(tmin, tmax, sites, limit=32, spacing=2.5, minimum=4):
+    step = spacing / np.sqrt(sites)
+    count = max(int(np.ceil(np.log(tmax / tmin) / step)) + 1, minimum)
+    if count > limit:
+        count = limit
+        tmax = tmin * np.exp(step * (limit - 1))
+    return geometric_temperatures(tmin, tmax, count)
+
+
+# 工作进程: 持有若干个同一组 J 的副本, 按主进程的命令运行扫描
+# 命令: ('sweep', 扫描次数, 各副本温度) -> 各副本 (能量, 磁化强度)
+#       ('spins', 副本序号) -> 该副本的自旋
+#       ('stop',)
+# seeds 为每个副本的 SeedSequence, 每个副本的随机数流互相独立, 与副本分配到哪个进程无关
+def _replica_worker(conn, n, J, temperatures, magnetic, bound_option, backend, seeds):
+    replicas = []
+    for temperature, seed in zip(temperatures, seeds):
+        model = SpinGlassModel(n, temperature, magnetic, bound_option, backend, seed=seed)
+        model.set_couplings(J)
+        replicas.append(model)
+    while True:
+        command = conn.recv()
+        if command[0] == 'sweep':
+            _, sweeps, temperatures = command
+            for model, temperature in zip(replicas, temperatures):
+                if model.temperature != temperature:
+                    model.set_temperature(temperature)
+                model.run(sweeps)
+            conn.send([(model.energy, model.magnetization) for model in replicas])
+        elif command[0] == 'spins':
+            conn.send(replicas[command[1]].spins)
+        else:
+            break
+    conn.close()
+
+
+# 副本交换 (并行回火): K 个副本共用同一组 J, 分布在温度序列上, 由进程池并行模拟
+# 每轮先让各副本独立扫描, 再尝试交换相邻温度上的构型, 接受概率 min(1, exp((β_t - β_{t+1}) (E_t - E_{t+1})))
+# 交换构型等价于交换两个副本的温度, 因此只在主进程里交换温度标签, 不必传输自旋
+# seed 派生出交换判定用的流和每个副本的流, 相同的 seed 给出相同的结果
+class ParallelTempering:
+    def __init__(self, n, temperatures, magnetic=0.0, bound_option=True, J=None, backend=None, processes=None, seed=None):
+        self.n = n
+        self.temperatures = sorted(temperatures)
+        self.magnetic = magnetic
+        self.bound_option = bound_option
+        count = len(self.temperatures)
+        coupling_seed, exchange_seed, *replica_seeds = seed_sequence(seed).spawn(count + 2)  # 第一个子流用于 J, 与 SpinGlassModel 相同
+        self.rng = generator(exchange_seed)
+        self.J_bonds = random_couplings(n, rng=generator(coupling_seed)) if J is None else J
+        processes = max(1, min(count, processes or os.cpu_count() or 1))
+
+        self.replica_at = list(range(count))  # 每个温度上的副本序号
+        self.energies = np.zeros(count)  # 各副本的能量
+        self.magnetizations = np.zeros(count)
+        self.attempts = np.zeros(count - 1, dtype=np.int64)  # 相邻温度对的交换尝试次数
+        self.accepts = np.zeros(count - 1, dtype=np.int64)  # 相邻温度对的交换成功次数
+        self.rounds = 0
+
+        # 副本 r 放在第 r % processes 个进程中
+        self.owner = [(r % processes, r // processes) for r in range(count)]
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.workers = []
+        for p in range(processes):
+            local = [self.temperatures[r] for r in range(p, count, processes)]
+            parent_conn, child_conn = context.Pipe()
+            worker = context.Process(target=_replica_worker, daemon=True,
+                                     args=(child_conn, n, self.J_bonds, local, magnetic, bound_option, backend, replica_seeds[p::processes]))
+            worker.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+    # 每个副本当前的温度
+    def replica_temperatures(self):
+        temperatures = [0.0] * len(self.temperatures)
+        for t, r in enumerate(self.replica_at):
+            temperatures[r] = self.temperatures[t]
+        return temperatures
+
+    # 运行一轮: 各副本扫描 sweeps 次, 然后尝试相邻温度交换 (奇偶轮交替尝试偶数对和奇数对)
+    def step(self, sweeps=10):
+        temperatures = self.replica_temperatures()
+        processes = len(self.connections)
+        for p, conn in enumerate(self.connections):
+            conn.send(('sweep', sweeps, temperatures[p::processes]))
+        for p, conn in enumerate(self.connections):
+            for k, (energy, magnetization) in enumerate(conn.recv()):
+                r = p + k * processes
+                self.energies[r] = energy
+                self.magnetizations[r] = magnetization
+
+        for t in range(self.rounds % 2, len(self.temperatures) - 1, 2):
+            low, high = self.replica_at[t], self.replica_at[t + 1]
+            delta = (1 / self.temperatures[t] - 1 / self.temperatures[t + 1]) * (self.energies[low] - self.energies[high])
+            self.attempts[t] += 1
+            if delta >= 0 or self.rng.random() < np.exp(delta):
+                self.replica_at[t], self.replica_at[t + 1] = high, low
+                self.accepts[t] += 1
+        self.rounds += 1
+
+    def run(self, rounds, sweeps=10):
+        for _ in range(rounds):
+            self.step(sweeps)
+
+    # 相邻温度对的交换接受率
+    def acceptance_rates(self):
+        return self.accepts / np.maximum(self.attempts, 1)
+
+    # 第 t 个温度上的 (能量, 磁化强度)
+    def observables(self, t):
+        r = self.replica_at[t]
+        return self.energies[r], self.magnetizations[r]
+
+    # 第 t 个温度上的自旋构型
+    def configuration(self, t):
+        p, k = self.owner[self.replica_at[t]]
+        self.connections[p].send(('spins', k))
+        return self.connections[p].recv()
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(('stop',))
+                conn.close()
+            except (OSError, BrokenPipeError):
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,104 @@
+import itertools
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from kernels import available_backends, SWEEP_ORDERS  # noqa: E402
+from acceptance import UPDATE_RULES  # noqa: E402
+from model import SpinGlassModel  # noqa: E402
+
+
+BACKENDS = available_backends()
+
+
+# 逐条键求和的能量 E = -sum_<ij> J_ij s_i s_j - h sum_i s_i, 不使用模型的 bond_mask 和 couplings
+# J[0, i, j] 为竖直键 (i, j)-(i+1, j), J[1, i, j] 为水平键 (i, j)-(i, j+1); 开放边界时跨越边界的键不存在
+def brute_energy(spins, J, magnetic, periodic):
+    n = spins.shape[-1]
+    energy = -magnetic * float(np.sum(spins))
+    for i, j in itertools.product(range(n), repeat=2):
+        if periodic or i + 1 < n:
+            energy -= float(J[0, i, j]) * spins[i, j] * spins[(i + 1) % n, j]
+        if periodic or j + 1 < n:
+            energy -= float(J[1, i, j]) * spins[i, j] * spins[i, (j + 1) % n]
+    return energy
+
+
+# 在全部 2^N 个构型上精确计算 <E>
+def exact_mean_energy(J, temperature, magnetic, periodic, n):
+    energies = np.array([brute_energy(np.array(bits, dtype=np.int8).reshape(n, n) * 2 - 1, J, magnetic, periodic)
+                         for bits in itertools.product((0, 1), repeat=n * n)])
+    weights = np.exp(-(energies - energies.min()) / temperature)
+    return float(np.sum(weights * energies) / np.sum(weights))
+
+
+def make_model(n, periodic, backend, rule='metropolis', order='auto', distribution='gaussian', magnetic=0.3, temperature=1.5, seed=7):
+    model = SpinGlassModel(n, temperature, magnetic, periodic, backend, distribution, replicas=2, seed=seed, update_rule=rule, sweep_order=order)
+    model.check_interval = 0  # 只用增量更新, 不定期重新计算
+    return model
+
+
+def assert_energies(model):
+    for r in range(model.replicas):
+        spins = model.replica_spins[r]
+        assert model.replica_energy[r] == pytest.approx(brute_energy(spins, model.J_bonds, model.magnetic, model.bound_option), abs=1e-4)
+        assert model.replica_magnetization[r] == pytest.approx(np.mean(spins, dtype=np.float64))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('n', [2, 3, 4])
+@pytest.mark.parametrize('distribution', ['gaussian', 'bimodal'])
+def test_total_energy(n, periodic, backend, distribution):
+    model = make_model(n, periodic, backend, distribution=distribution)
+    rng = np.random.default_rng(n)
+    for _ in range(5):
+        model.replica_spins = rng.choice(np.array([-1, 1], dtype=np.int8), size=(model.replicas, n, n))
+        model.recompute()
+        assert_energies(model)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('n', [2, 3, 4])
+@pytest.mark.parametrize('order', SWEEP_ORDERS)
+@pytest.mark.parametrize('rule', UPDATE_RULES)
+def test_incremental_energy_after_sweeps(n, periodic, backend, order, rule):
+    model = make_model(n, periodic, backend, rule, order)
+    for _ in range(50):
+        model.sweep()
+    assert model.accepted > 0
+    assert_energies(model)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('n', [2, 3, 4])
+@pytest.mark.parametrize('rule', UPDATE_RULES)
+def test_incremental_energy_after_steps(n, periodic, backend, rule):
+    model = make_model(n, periodic, backend, rule)
+    for _ in range(500):
+        model.step()
+    assert model.accepted > 0
+    assert_energies(model)
+
+
+# 3x3 上 Monte Carlo 的 <E> 与精确枚举一致 (误差由分组平均估计, 允许 4 倍标准误差)
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('order', SWEEP_ORDERS[1:])
+@pytest.mark.parametrize('rule', UPDATE_RULES)
+def test_mean_energy_matches_enumeration(rule, order, backend):
+    n, periodic = 3, True
+    model = make_model(n, periodic, backend, rule, order, temperature=1.5, magnetic=0.3)
+    exact = exact_mean_energy(model.J_bonds, model.temperature, model.magnetic, periodic, n)
+    model.run(500)
+    energies = np.empty(10000)
+    for k in range(energies.size):
+        model.sweep()
+        energies[k] = model.energy
+    batches = energies.reshape(50, -1).mean(axis=1)
+    error = batches.std(ddof=1) / np.sqrt(batches.size)
+    assert abs(energies.mean() - exact) < 4 * error + 1e-3